@@ -1,30 +1,54 @@
 from abc import ABC, abstractmethod
 from pydantic import BaseModel, Field
-from typing import Optional, Any, AsyncGenerator
+from typing import Optional, Any, AsyncGenerator, Literal
 
 from app.llm.base import BaseLLM
+from app.llm.scheduler import LLMScheduler
 from app.tools.tool_box import ToolBox
+from app.tracing.tracer import Tracer
+from app.agent.checkpoint import CheckpointStore
+from app.agent.long_term import LongTermMemory
+from app.agent.budget import BudgetManager
 from app.states.base import AgentStepResult
 
 class BaseAgent(BaseModel, ABC):
     """
     This is a abstract agent for further expanding.
+    The agent only holds the parts shared by every run, per-run data lives in an `AgentSession`.
     """
 
     name: str = Field(default="Default agent", description="Individual agent.")
     description: Optional[str] = Field(default=None, description="The functionality of this agent.")
     llm: BaseLLM = Field(..., description="The selected large language model (brain).")
+    state_llms: dict = Field(default_factory=dict, description="LLMs used by specific states instead of `llm`, keyed by state name.")
+    state_reasoning: dict = Field(default_factory=dict, description="Reasoning budgets (`ReasoningBudget`) of specific states, keyed by state name.")
+    store_think: bool = Field(default=False, description="Keep the planner's thinking in memory. By default it is dropped and never re-enters later prompts.")
+    finish_policy: Literal["direct", "summarize", "tool_result"] = Field(
+        default="direct",
+        description=(
+            "How a run ends. 'direct': the answer of a well-formed `finish_task` is final. "
+            "'summarize': a summarizer LLM call always writes the answer. "
+            "'tool_result': like 'direct', and a simple request answered by a single successful tool call ends with its result."
+        ),
+    )
     max_steps: int = Field(default=5, description="The max steps that llm is going to loop.")
-    memory: list = Field([], description="The memory of the agent.")
+    run_timeout: Optional[float] = Field(default=None, description="Seconds a run may take before it ends with what it has found so far. None lets runs take as long as they need.")
+    scheduler: Optional[LLMScheduler] = Field(default=None, description="Queues the LLM requests of all the runs by priority, and holds back new runs when the queue is too long. None sends them right away.")
+    budget_manager: Optional[BudgetManager] = Field(default=None, description="Token, LLM call and wall time limits of runs and tenants. None leaves runs unlimited.")
+    memory_budget_tokens: Optional[int] = Field(default=None, description="Token budget of each run's memory, older turns are summarized beyond it. None means unbounded.")
+    long_term_memory: Optional[LongTermMemory] = Field(default=None, description="Keeps the tool results and answers of finished runs and recalls the relevant ones for new requests. None disables it.")
+    recall_budget_tokens: int = Field(default=300, description="Token budget of the facts recalled from the long-term memory for a request.")
     toolbox: ToolBox = Field(default_factory=ToolBox, description="The tools that llm can use.")
     states: dict = Field(..., description="All the states the agent can have")
+    tracer: Tracer = Field(default_factory=Tracer, description="Records the timing of runs, states, LLM and tool calls.")
+    checkpoint_store: Optional[CheckpointStore] = Field(default=None, description="Saves every step of a run so it can be resumed. None disables checkpoints.")
 
 
     class Config:
         arbitrary_types_allowed = True
 
     @abstractmethod
-    async def run(self) -> AsyncGenerator[AgentStepResult, None]:
+    async def run(self, user_request: str) -> AsyncGenerator[AgentStepResult, None]:
         """
         The method that defines how the agent work
         """
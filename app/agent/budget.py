@@ -0,0 +1,218 @@
+import time
+import threading
+from collections import deque
+from typing import Literal, Optional
+from pydantic import BaseModel, Field
+
+from app.tracing.tracer import Span
+
+BudgetStatus = Literal["ok", "low", "exhausted"]
+
+
+class BudgetLimits(BaseModel):
+    """
+    Limits of a run, or of a tenant over the window of its `BudgetManager`. None means unlimited.
+    """
+
+    max_tokens: Optional[int] = Field(default=None, description="Prompt and generated tokens processed by the LLM servers.")
+    max_llm_calls: Optional[int] = Field(default=None, description="LLM requests sent to a server, cache hits are free.")
+    max_wall_time: Optional[float] = Field(default=None, description="Seconds from the start of the run. Not used for tenants.")
+
+
+def llm_usage(span: Span) -> tuple[int, int, float]:
+    """
+    The (tokens, LLM calls, slowest call in seconds) of the LLM requests under a span.
+    A wrapping LLM (router, cascade) is only counted through the requests its backends sent.
+    Cache hits and replies shared with another caller's request are free.
+    """
+    tokens = calls = 0
+    slowest = 0.0
+    for child in span.children:
+        child_tokens, child_calls, child_slowest = llm_usage(child)
+        tokens += child_tokens
+        calls += child_calls
+        slowest = max(slowest, child_slowest)
+        if child.kind != "llm":
+            continue
+        tokens += (child.prompt_tokens or 0) + (child.eval_tokens or 0)
+        if child_calls == 0 and child.attributes.get("cache") != "hit" and not child.attributes.get("coalesced"):
+            calls += 1
+            slowest = max(slowest, child.wall_time or 0.0)
+    return tokens, calls, slowest
+
+
+class TenantLedger:
+    """
+    The tokens and LLM calls a tenant used over a sliding window, shared by all its runs.
+    """
+
+    def __init__(self, limits: BudgetLimits, window: float):
+        self.limits = limits
+        self.window = window
+        self._entries: deque = deque()
+        self._tokens = 0
+        self._calls = 0
+        # Runs of a tenant may be charged from several threads (e.g. one event loop per worker)
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        while self._entries and self._entries[0][0] <= now - self.window:
+            _, tokens, calls = self._entries.popleft()
+            self._tokens -= tokens
+            self._calls -= calls
+
+    def charge(self, tokens: int, calls: int):
+        if not tokens and not calls:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            self._entries.append((now, tokens, calls))
+            self._tokens += tokens
+            self._calls += calls
+
+    def remaining(self) -> tuple[Optional[int], Optional[int]]:
+        """
+        (tokens, LLM calls) left in the window, None where unlimited.
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            return (
+                None if self.limits.max_tokens is None else self.limits.max_tokens - self._tokens,
+                None if self.limits.max_llm_calls is None else self.limits.max_llm_calls - self._calls,
+            )
+
+
+def _least(*values):
+    values = [value for value in values if value is not None]
+    return min(values) if values else None
+
+
+class RunBudget:
+    """
+    What one run has used of its limits and of its tenant's.
+
+    The run is charged after every step with the usage of the LLM requests of that step. The budget is
+    low when the next planning step and a summary would probably not fit any more, judging by the
+    largest request and the slowest call of the run so far. That estimate grows with the memory,
+    so the number of steps a run can afford adapts to how expensive its steps turn out to be.
+    """
+
+    def __init__(self, limits: BudgetLimits, ledger: Optional[TenantLedger] = None, reserve_tokens: int = 0):
+        self.limits = limits
+        self.ledger = ledger
+        self.reserve_tokens = reserve_tokens
+        self.tokens = 0
+        self.llm_calls = 0
+        self.largest_call_tokens = 0
+        self.slowest_call = 0.0
+        # Time already spent before a resume
+        self.elapsed_before = 0.0
+        self._started = time.monotonic()
+
+    @property
+    def wall_time(self) -> float:
+        return self.elapsed_before + time.monotonic() - self._started
+
+    def charge(self, span: Span):
+        """
+        Charge the LLM requests of a finished step (its state span) to the run and its tenant.
+        """
+        tokens, calls, slowest = llm_usage(span)
+        self.tokens += tokens
+        self.llm_calls += calls
+        if calls:
+            self.largest_call_tokens = max(self.largest_call_tokens, tokens // calls)
+        self.slowest_call = max(self.slowest_call, slowest)
+        if self.ledger is not None:
+            self.ledger.charge(tokens, calls)
+
+    def remaining(self) -> dict:
+        """
+        What is left, the smaller of the run's and its tenant's allowance. None where unlimited.
+        """
+        tenant_tokens, tenant_calls = self.ledger.remaining() if self.ledger is not None else (None, None)
+        return {
+            "tokens": _least(
+                None if self.limits.max_tokens is None else self.limits.max_tokens - self.tokens, tenant_tokens
+            ),
+            "llm_calls": _least(
+                None if self.limits.max_llm_calls is None else self.limits.max_llm_calls - self.llm_calls, tenant_calls
+            ),
+            "wall_time": None if self.limits.max_wall_time is None else round(self.limits.max_wall_time - self.wall_time, 3),
+        }
+
+    def status(self) -> tuple[BudgetStatus, Optional[str]]:
+        """
+        ("ok" | "low" | "exhausted", the limit concerned).
+        """
+        remaining = self.remaining()
+        for name, value in remaining.items():
+            if value is not None and value <= 0:
+                return "exhausted", name
+        # A planning step and the summary after it
+        needed = {
+            "tokens": 2 * self.largest_call_tokens + self.reserve_tokens,
+            "llm_calls": 2,
+            "wall_time": 2 * self.slowest_call,
+        }
+        for name, value in remaining.items():
+            if value is not None and value < needed[name]:
+                return "low", name
+        return "ok", None
+
+    def usage(self) -> dict:
+        return {"tokens": self.tokens, "llm_calls": self.llm_calls, "wall_time": round(self.wall_time, 3)}
+
+    def restore(self, usage: dict):
+        """
+        Continue counting from the usage of a checkpoint, see `usage`.
+        """
+        self.tokens = usage.get("tokens", 0)
+        self.llm_calls = usage.get("llm_calls", 0)
+        self.elapsed_before = usage.get("wall_time", 0.0)
+        self._started = time.monotonic()
+
+
+class BudgetManager:
+    """
+    Hands out the budgets of runs: the same per-run limits for every run, and per-tenant limits
+    over a sliding window shared by all the runs of a tenant.
+    """
+
+    def __init__(
+        self,
+        run_limits: Optional[BudgetLimits] = None,
+        tenant_limits: Optional[dict[str, BudgetLimits]] = None,
+        default_tenant_limits: Optional[BudgetLimits] = None,
+        window: float = 3600.0,
+        reserve_tokens: int = 0,
+    ):
+        """
+        Args:
+            run_limits (Optional[BudgetLimits]): Limits of every run.
+            tenant_limits (Optional[dict[str, BudgetLimits]]): Token and LLM call limits of specific tenants over the window.
+            default_tenant_limits (Optional[BudgetLimits]): Limits of the tenants not in `tenant_limits`. None leaves them unlimited.
+            window (float): Seconds over which the usage of a tenant is counted.
+            reserve_tokens (int): Extra tokens to keep for the summary when deciding that a budget is low.
+        """
+        self.run_limits = run_limits or BudgetLimits()
+        self.tenant_limits = tenant_limits or {}
+        self.default_tenant_limits = default_tenant_limits
+        self.window = window
+        self.reserve_tokens = reserve_tokens
+        self._ledgers: dict[str, TenantLedger] = {}
+
+    def ledger(self, tenant: Optional[str]) -> Optional[TenantLedger]:
+        if tenant is None:
+            return None
+        ledger = self._ledgers.get(tenant)
+        if ledger is None:
+            limits = self.tenant_limits.get(tenant, self.default_tenant_limits)
+            if limits is None:
+                return None
+            ledger = self._ledgers[tenant] = TenantLedger(limits, self.window)
+        return ledger
+
+    def start_run(self, tenant: Optional[str] = None) -> RunBudget:
+        return RunBudget(self.run_limits, self.ledger(tenant), self.reserve_tokens)
@@ -0,0 +1,114 @@
+import os
+import json
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+
+class CheckpointStore(ABC):
+    """
+    An append-only log of checkpoint records per run.
+
+    A record holds the state to continue from, its context, the step count and the memory
+    messages added since the previous record (all of them after a memory compaction).
+    Replaying the records of a run in order rebuilds its session, see `StatefulAgent.resume`.
+    The methods are blocking, the agent calls them from a worker thread.
+    """
+
+    @abstractmethod
+    def append(self, run_id: str, record: dict):
+        pass
+
+    @abstractmethod
+    def load(self, run_id: str) -> list[dict]:
+        """
+        The records of a run in the order they were appended, empty if the run is unknown.
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, run_id: str):
+        pass
+
+
+class JSONLCheckpointStore(CheckpointStore):
+    """
+    One JSON Lines file per run in `directory`, every record is one appended line.
+    """
+
+    def __init__(self, directory: str, fsync: bool = False):
+        """
+        Args:
+            directory (str): Where the run files are kept.
+            fsync (bool): Force every record to disk, so it also survives a machine crash and not only a process crash.
+        """
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, run_id: str) -> str:
+        return os.path.join(self.directory, f"{run_id}.jsonl")
+
+    def append(self, run_id: str, record: dict):
+        with open(self._path(run_id), "a", encoding="utf-8") as file:
+            file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            file.flush()
+            if self.fsync:
+                os.fsync(file.fileno())
+
+    def load(self, run_id: str) -> list[dict]:
+        if not os.path.exists(self._path(run_id)):
+            return []
+        records = []
+        with open(self._path(run_id), encoding="utf-8") as file:
+            for line in file:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A line cut short by the crash, everything before it is intact
+                    break
+        return records
+
+    def delete(self, run_id: str):
+        if os.path.exists(self._path(run_id)):
+            os.remove(self._path(run_id))
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    """
+    All runs in one SQLite database, every record is one inserted row.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS checkpoints ("
+            "run_id TEXT NOT NULL, seq INTEGER NOT NULL, record TEXT NOT NULL, PRIMARY KEY (run_id, seq))"
+        )
+        self._conn.commit()
+
+    def append(self, run_id: str, record: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO checkpoints (run_id, seq, record) VALUES (?, ?, ?)",
+                (run_id, record["seq"], json.dumps(record, ensure_ascii=False, default=str)),
+            )
+            self._conn.commit()
+
+    def load(self, run_id: str) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT record FROM checkpoints WHERE run_id = ? ORDER BY seq", (run_id,)
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def delete(self, run_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE run_id = ?", (run_id,))
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
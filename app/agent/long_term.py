@@ -0,0 +1,218 @@
+import math
+import time
+import heapq
+import sqlite3
+import hashlib
+import threading
+from typing import Callable, Optional
+from collections import Counter
+
+from app.agent.memory import estimate_tokens
+from app.tools.index import tokenize
+
+RECALL_HEADER = "Facts from earlier runs, use them instead of calling a tool again when they answer the task:"
+# The items matching an FTS5 query that were created since a time
+MATCH_FRESH = (
+    "SELECT items_index.rowid FROM items_index JOIN items ON items.id = items_index.rowid "
+    "WHERE items_index MATCH ? AND items.created_at >= ?"
+)
+
+
+class LongTermMemory:
+    """
+    Tool results and final answers of past runs, kept across runs in SQLite with an FTS5 inverted index.
+
+    The items are indexed with the tokenizer of the tool index (`app.tools.index.tokenize`). A search only
+    ranks by the rare terms of the query, so it stays fast when common words match millions of items.
+    The methods are blocking, the agent calls them from a worker thread.
+    """
+
+    def __init__(
+        self,
+        path: str = "long_term_memory.db",
+        max_age: Optional[float] = None,
+        max_query_terms: int = 3,
+        max_postings: int = 500,
+        token_counter: Callable[[str], int] = estimate_tokens,
+    ):
+        """
+        Args:
+            path (str): The SQLite database file.
+            max_age (Optional[float]): Seconds an item stays relevant, older items are not recalled. None keeps them forever.
+            max_query_terms (int): How many of the rarest query terms a search looks up.
+            max_postings (int): Terms found in more items than this are too common to rank by, see `search`.
+            token_counter (Callable[[str], int]): Counts the tokens of a text, for the recall budget.
+        """
+        self.path = path
+        self.max_age = max_age
+        self.max_query_terms = max_query_terms
+        self.max_postings = max_postings
+        self.token_counter = token_counter
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY,
+                digest TEXT NOT NULL UNIQUE,
+                kind TEXT NOT NULL,
+                text TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS items_index USING fts5(terms, detail=none);
+            -- How many items hold each term. FTS5 can only tell by reading the whole posting list.
+            CREATE TABLE IF NOT EXISTS term_counts (term TEXT PRIMARY KEY, items INTEGER NOT NULL) WITHOUT ROWID;
+            """
+        )
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def add(self, kind: str, text: str, commit: bool = True) -> bool:
+        """
+        Store an item ("tool_result" or "answer"). An item already stored is only refreshed.
+        Returns False when it was already stored.
+        """
+        digest = hashlib.sha1(f"{kind}\x00{text}".encode("utf-8")).hexdigest()
+        with self._lock:
+            row = self._conn.execute("SELECT id FROM items WHERE digest = ?", (digest,)).fetchone()
+            if row is not None:
+                self._conn.execute("UPDATE items SET created_at = ? WHERE id = ?", (time.time(), row[0]))
+            else:
+                cursor = self._conn.execute(
+                    "INSERT INTO items (digest, kind, text, created_at) VALUES (?, ?, ?, ?)",
+                    (digest, kind, text, time.time()),
+                )
+                terms = tokenize(text)
+                self._conn.execute("INSERT INTO items_index (rowid, terms) VALUES (?, ?)", (cursor.lastrowid, " ".join(terms)))
+                self._conn.executemany(
+                    "INSERT INTO term_counts (term, items) VALUES (?, 1) ON CONFLICT (term) DO UPDATE SET items = items + 1",
+                    [(term,) for term in set(terms)],
+                )
+            if commit:
+                self._conn.commit()
+        return row is None
+
+    def add_many(self, items: list[tuple[str, str]]):
+        """
+        Store several (kind, text) items in one transaction.
+        """
+        for kind, text in items:
+            self.add(kind, text, commit=False)
+        with self._lock:
+            self._conn.commit()
+
+    def _term_counts(self, query: str) -> list[tuple[str, int]]:
+        """
+        The query terms that are in the index, with how many items contain them, rarest first.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        counts = self._conn.execute(
+            f"SELECT term, items FROM term_counts WHERE term IN ({', '.join('?' * len(terms))}) AND items > 0", terms
+        ).fetchall()
+        return sorted(counts, key=lambda item: item[1])
+
+    def _rank(self, terms: list[tuple[str, int]], oldest: float, limit: int) -> list[int]:
+        """
+        Score the items created since `oldest` holding any of the (rare) terms by the idf of the terms they hold.
+        It is BM25 without the term frequency and length parts, which matter little for short items and are costly
+        to get from FTS5.
+        """
+        total = self._conn.execute("SELECT MAX(id) FROM items").fetchone()[0] or 0
+        scores: dict[int, float] = {}
+        for term, count in terms:
+            idf = math.log(1 + (total - count + 0.5) / (count + 0.5))
+            for (rowid,) in self._conn.execute(MATCH_FRESH, (f'"{term}"', oldest)):
+                scores[rowid] = scores.get(rowid, 0.0) + idf
+        # The newest item first among equal scores
+        return [rowid for rowid, _ in heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))]
+
+    def search(self, query: str, limit: int = 8) -> list[dict]:
+        """
+        The stored items best matching `query`, best first, as {"kind", "text", "created_at"}.
+
+        Only the rare query terms rank the items, terms in more than `max_postings` items are left out.
+        When all the terms are that common, the newest items containing all of them are returned instead,
+        a lookup that stops after `limit` items. Either way a search reads a bounded number of postings.
+        Items older than `max_age` are left out before ranking, so they never take the place of fresh ones.
+        """
+        oldest = time.time() - self.max_age if self.max_age is not None else 0.0
+        with self._lock:
+            counts = self._term_counts(query)
+            rare = [item for item in counts if item[1] <= self.max_postings][: self.max_query_terms]
+            if rare:
+                ids = self._rank(rare, oldest, limit)
+            elif counts:
+                match = " AND ".join(f'"{term}"' for term, _ in counts[: self.max_query_terms])
+                ids = [
+                    rowid
+                    for (rowid,) in self._conn.execute(
+                        f"{MATCH_FRESH} ORDER BY items_index.rowid DESC LIMIT ?", (match, oldest, limit)
+                    )
+                ]
+            else:
+                return []
+            rows = self._conn.execute(
+                f"SELECT id, kind, text, created_at FROM items WHERE id IN ({', '.join('?' * len(ids))})", ids
+            ).fetchall()
+        items = {row[0]: row[1:] for row in rows}
+        return [
+            {"kind": items[rowid][0], "text": items[rowid][1], "created_at": items[rowid][2]}
+            for rowid in ids
+            if rowid in items
+        ]
+
+    def recall(self, query: str, budget_tokens: int, limit: int = 8) -> Optional[str]:
+        """
+        The best matching items formatted for the prompt, within `budget_tokens`. None if nothing matches.
+        """
+        lines = []
+        used = self.token_counter(RECALL_HEADER)
+        for item in self.search(query, limit):
+            line = f"- {item['text']}"
+            tokens = self.token_counter(line)
+            if used + tokens > budget_tokens:
+                continue
+            lines.append(line)
+            used += tokens
+        if not lines:
+            return None
+        return "\n".join([RECALL_HEADER, *lines])
+
+    def prune(self, max_age: float) -> int:
+        """
+        Delete the items older than `max_age` seconds. Returns how many were deleted.
+        """
+        with self._lock:
+            cutoff = time.time() - max_age
+            removed = Counter()
+            for (terms,) in self._conn.execute(
+                "SELECT terms FROM items_index WHERE rowid IN (SELECT id FROM items WHERE created_at < ?)", (cutoff,)
+            ):
+                removed.update(set(terms.split()))
+            self._conn.executemany(
+                "UPDATE term_counts SET items = items - ? WHERE term = ?", [(count, term) for term, count in removed.items()]
+            )
+            self._conn.execute("DELETE FROM term_counts WHERE items <= 0")
+            self._conn.execute(
+                "DELETE FROM items_index WHERE rowid IN (SELECT id FROM items WHERE created_at < ?)", (cutoff,)
+            )
+            deleted = self._conn.execute("DELETE FROM items WHERE created_at < ?", (cutoff,)).rowcount
+            self._conn.commit()
+        return deleted
+
+    def optimize(self):
+        """
+        Merge the segments of the index. Worth it after adding many items at once, a search then reads each posting list in one piece.
+        """
+        with self._lock:
+            self._conn.execute("INSERT INTO items_index (items_index) VALUES ('optimize')")
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
@@ -0,0 +1,205 @@
+import hashlib
+from typing import Callable, Iterator, Optional
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of an agent's conversation. "
+    "Merge the new messages into the current summary. Keep every fact, tool result and decision "
+    "that may matter for finishing the user's task, drop everything else. "
+    "Answer with the updated summary only, in at most {max_words} words."
+)
+
+DUPLICATE_NOTE = "(Same result as an earlier tool call, see above.)"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    A cheap token estimate (about 4 characters per token) used when no tokenizer is given.
+    """
+    return len(text) // 4 + 1
+
+
+class AgentMemory:
+    """
+    The conversation memory of one run, with per-message token counts and an optional token budget.
+
+    When the budget is exceeded, the oldest messages are folded into a running summary.
+    Only the evicted messages and the previous summary are sent to the LLM, so a long run is never
+    re-summarized from the start. The first user message (the request) is always kept.
+    """
+
+    def __init__(
+        self,
+        budget_tokens: Optional[int] = None,
+        compact_ratio: float = 0.6,
+        summary_max_words: int = 200,
+        token_counter: Callable[[str], int] = estimate_tokens,
+    ):
+        """
+        Args:
+            budget_tokens (Optional[int]): Token budget of the memory sent to the LLM. None means unbounded.
+            compact_ratio (float): A compaction shrinks the memory to this share of the budget,
+                so compactions (and the prompt cache misses they cause) stay rare.
+            summary_max_words (int): Length limit given to the LLM for the running summary.
+            token_counter (Callable[[str], int]): Counts the tokens of a text.
+        """
+        self.budget_tokens = budget_tokens
+        self.compact_ratio = compact_ratio
+        self.summary_max_words = summary_max_words
+        self.token_counter = token_counter
+
+        self.messages: list[dict] = []
+        self.token_counts: list[int] = []
+        self._hashes: list[Optional[str]] = []
+        self._hash_index: set[str] = set()
+        self.summary: Optional[str] = None
+        self.summary_tokens = 0
+        self.total_tokens = 0
+        self.compactions = 0
+
+    def __iter__(self) -> Iterator[dict]:
+        return iter(self.messages)
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
+
+    def append(self, message: dict, dedupe: bool = False) -> bool:
+        """
+        Add a message. With `dedupe=True`, a content already in memory is replaced by a short note.
+        Returns False when the message was a duplicate.
+        """
+        content_hash = None
+        is_new = True
+        if dedupe:
+            content_hash = self._content_hash(message)
+            if content_hash in self._hash_index:
+                message = {**message, "content": DUPLICATE_NOTE}
+                content_hash = None
+                is_new = False
+            else:
+                self._hash_index.add(content_hash)
+
+        self._add(message, content_hash)
+        return is_new
+
+    @staticmethod
+    def _content_hash(message: dict) -> str:
+        return hashlib.sha1(f"{message['role']}\x00{message['content']}".encode("utf-8")).hexdigest()
+
+    def _add(self, message: dict, content_hash: Optional[str]):
+        tokens = self.token_counter(message["content"])
+        if message.get("thinking"):
+            tokens += self.token_counter(message["thinking"])
+        self.messages.append(message)
+        self.token_counts.append(tokens)
+        self._hashes.append(content_hash)
+        self.total_tokens += tokens
+
+    def snapshot(self, start: int = 0) -> dict:
+        """
+        The messages from index `start` on, in a JSON-serializable form for `restore`.
+        A snapshot from 0 is complete and also carries the running summary.
+        """
+        snapshot = {
+            "start": start,
+            "messages": self.messages[start:],
+            "dedupe": [content_hash is not None for content_hash in self._hashes[start:]],
+        }
+        if start == 0:
+            snapshot["summary"] = self.summary
+            snapshot["compactions"] = self.compactions
+        return snapshot
+
+    def restore(self, snapshot: dict):
+        """
+        Apply a snapshot: the messages before its `start` are kept, the later ones are replaced by its messages.
+        """
+        start = snapshot["start"]
+        for content_hash in self._hashes[start:]:
+            if content_hash is not None:
+                self._hash_index.discard(content_hash)
+        self.total_tokens -= sum(self.token_counts[start:])
+        del self.messages[start:]
+        del self.token_counts[start:]
+        del self._hashes[start:]
+
+        for message, dedupe in zip(snapshot["messages"], snapshot["dedupe"]):
+            content_hash = self._content_hash(message) if dedupe else None
+            if content_hash is not None:
+                self._hash_index.add(content_hash)
+            self._add(message, content_hash)
+
+        if "summary" in snapshot:
+            self.summary = snapshot["summary"]
+            self.summary_tokens = self.token_counter(self.summary) if self.summary else 0
+            self.compactions = snapshot["compactions"]
+
+    def to_messages(self) -> list[dict]:
+        """
+        The messages to send to the LLM: the request, the running summary (if any) and the recent messages.
+        """
+        if self.summary is None or not self.messages:
+            return list(self.messages)
+        summary_message = {
+            "role": "assistant",
+            "content": f"Summary of the earlier steps: {self.summary}",
+        }
+        return [self.messages[0], summary_message] + self.messages[1:]
+
+    @property
+    def needs_compaction(self) -> bool:
+        return (
+            self.budget_tokens is not None
+            and self.total_tokens + self.summary_tokens > self.budget_tokens
+        )
+
+    async def compact(self, llm) -> bool:
+        """
+        Fold the oldest messages into the running summary until the memory fits the budget again.
+        Returns True if a compaction happened.
+        """
+        if not self.needs_compaction or len(self.messages) < 3:
+            return False
+
+        target = int(self.budget_tokens * self.compact_ratio)
+        # Keep the request (index 0) and at least the latest message
+        end = 1
+        remaining = self.total_tokens + self.summary_tokens
+        while end < len(self.messages) - 1 and remaining > target:
+            remaining -= self.token_counts[end]
+            end += 1
+
+        evicted = self.messages[1:end]
+        new_summary = await self._summarize(llm, evicted)
+
+        for content_hash in self._hashes[1:end]:
+            if content_hash is not None:
+                self._hash_index.discard(content_hash)
+        self.total_tokens -= sum(self.token_counts[1:end])
+        del self.messages[1:end]
+        del self.token_counts[1:end]
+        del self._hashes[1:end]
+
+        self.summary = new_summary
+        self.summary_tokens = self.token_counter(new_summary)
+        self.compactions += 1
+        print(f"Memory compacted: {len(evicted)} messages folded into the summary.")
+        return True
+
+    async def _summarize(self, llm, evicted: list[dict]) -> str:
+        new_messages = "\n".join(f"[{message['role']}] {message['content']}" for message in evicted)
+        messages = [
+            {"role": "system", "content": SUMMARY_PROMPT.format(max_words=self.summary_max_words)},
+            {
+                "role": "user",
+                "content": f"Current summary:\n{self.summary or '(empty)'}\n\nNew messages:\n{new_messages}",
+            },
+        ]
+        result = await llm.chat(messages)
+        if isinstance(result, tuple) and result[1]:
+            return result[1].strip()
+
+        # Do not lose the evicted facts if the LLM is not available, keep them verbatim instead
+        return "\n".join(filter(None, [self.summary, new_messages]))
@@ -0,0 +1,79 @@
+import uuid
+from typing import Optional
+from pydantic import BaseModel, Field
+
+from app.agent.base import BaseAgent
+from app.agent.memory import AgentMemory
+from app.agent.budget import RunBudget
+from app.llm.scheduler import INTERACTIVE
+from app.states.base import AgentState
+
+
+class AgentSession(BaseModel):
+    """
+    The per-run state of an agent.
+    The agent itself only holds the shared, read-only parts (llm, toolbox, state table),
+    so one agent can drive many overlapping `run()` calls, each with its own session.
+    """
+
+    run_id: str = Field(default_factory=lambda: uuid.uuid4().hex, description="Unique id of this run.")
+    agent: BaseAgent = Field(..., description="The agent runtime that drives this session.")
+    tenant: Optional[str] = Field(default=None, description="Who the run is for, the usage is charged to this tenant's budget.")
+    priority: int = Field(default=INTERACTIVE, description="Class of the run for the LLM scheduler, such as INTERACTIVE or BATCH.")
+    deadline: Optional[float] = Field(default=None, description="`time.monotonic()` by which the run has to end, its LLM and tool calls get the time left. None for no deadline.")
+    budget: Optional[RunBudget] = Field(default=None, description="The budget of this run, None when the agent has no budget manager.")
+    memory: AgentMemory = Field(default_factory=AgentMemory, description="The conversation memory of this run.")
+    current_state: Optional[AgentState] = Field(default=None, description="The state the run is currently in.")
+    context: dict = Field(default_factory=dict, description="Data passed from the previous state to the next one.")
+    step_count: int = Field(default=0, description="How many steps this run has executed.")
+    tool_names: Optional[list[str]] = Field(default=None, description="The tools shown in the prompt, picked for the request. None shows every tool.")
+    found_tools: list[str] = Field(default_factory=list, description="Tools found with `search_tools` since, callable but not added to the prompt.")
+    observations: list[str] = Field(default_factory=list, description="The successful tool calls of this run with their results, kept in the long-term memory when it finishes.")
+    checkpoint_seq: int = Field(default=0, description="Sequence number of the next checkpoint record.")
+    checkpointed_messages: int = Field(default=0, description="Memory messages already in the checkpoint store.")
+    checkpointed_compactions: int = Field(default=0, description="Memory compactions already in the checkpoint store.")
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def llm(self):
+        """
+        The LLM of the state being executed, falling back to the agent's default LLM.
+        """
+        if self.current_state is not None:
+            state_llm = self.agent.state_llms.get(self.current_state.name)
+            if state_llm is not None:
+                return state_llm
+        return self.agent.llm
+
+    @property
+    def reasoning(self):
+        """
+        The reasoning budget of the state being executed, None leaves it to the model.
+        """
+        if self.current_state is None:
+            return None
+        return self.agent.state_reasoning.get(self.current_state.name)
+
+    @property
+    def toolbox(self):
+        return self.agent.toolbox
+
+    @property
+    def planner_tools(self) -> Optional[list[str]]:
+        """
+        The tools the planner may call, None for every tool.
+        """
+        if self.tool_names is None:
+            return None
+        return self.tool_names + [name for name in self.found_tools if name not in self.tool_names]
+
+    def add_found_tools(self, names: list[str]):
+        for name in names:
+            if name not in self.found_tools:
+                self.found_tools.append(name)
+
+    @property
+    def states(self) -> dict:
+        return self.agent.states
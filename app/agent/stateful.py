@@ -1,67 +1,365 @@
+import time
+import asyncio
 from typing import AsyncGenerator, Optional
 
 from app.agent.base import BaseAgent
+from app.agent.memory import AgentMemory
+from app.agent.checkpoint import CheckpointStore
+from app.agent.long_term import LongTermMemory
+from app.agent.budget import BudgetManager
+from app.agent.session import AgentSession
+from app.llm.scheduler import INTERACTIVE, STATE_PRIORITIES, LLMScheduler, RequestContext, request_context
 from app.tools.tool_box import ToolBox
-from app.states.base import AgentState
 from app.states.base import AgentStepResult
+from app.states.finished import ErrorState, TimeoutState
+
+
+# States that end a run
+TERMINAL_STATES = ("finished", "error", "timeout")
+# States that only lead to the end of a run, they still run once the steps are used up
+CLOSING_STATES = ("summarizing",)
 
 
 class StatefulAgent(BaseAgent):
-    current_state: Optional[AgentState] = None
+    """
+    An agent driven by a state machine. The agent object is shared and immutable during runs,
+    every `run()` call works on its own `AgentSession`, so overlapping runs do not interfere.
+    """
 
-    def __init__(self, llm, toolbox: ToolBox, states: dict, max_steps: int = 5):
+    def __init__(
+        self,
+        llm,
+        toolbox: ToolBox,
+        states: dict,
+        max_steps: int = 5,
+        run_timeout: Optional[float] = None,
+        scheduler: Optional[LLMScheduler] = None,
+        budget_manager: Optional[BudgetManager] = None,
+        memory_budget_tokens: Optional[int] = None,
+        state_llms: Optional[dict] = None,
+        state_reasoning: Optional[dict] = None,
+        store_think: bool = False,
+        finish_policy: str = "direct",
+        checkpoint_store: Optional[CheckpointStore] = None,
+        long_term_memory: Optional[LongTermMemory] = None,
+        recall_budget_tokens: int = 300,
+    ):
         super().__init__(
             name="StatefulAgent",
             llm=llm,
             max_steps=max_steps,
-            memory=[],
+            run_timeout=run_timeout,
+            scheduler=scheduler,
+            budget_manager=budget_manager,
+            memory_budget_tokens=memory_budget_tokens,
+            state_llms=state_llms or {},  # e.g. {"planning": small_or_cascade_llm, "summarizing": large_llm}
+            state_reasoning=state_reasoning or {},  # e.g. {"planning": ReasoningBudget(max_think_tokens=256), "summarizing": ReasoningBudget(think=False)}
+            store_think=store_think,
+            finish_policy=finish_policy,
+            checkpoint_store=checkpoint_store,
+            long_term_memory=long_term_memory,
+            recall_budget_tokens=recall_budget_tokens,
             toolbox=toolbox,
-            states=states,  # Register all the possible states
+            # Register all the possible states, errors and deadlines end in the default ErrorState and TimeoutState unless overridden
+            states={"error": ErrorState(), "timeout": TimeoutState(), **states},
         )
-        self.current_state = self.states["planning"] # Initial state is planning
+        if scheduler is not None:
+            for model in [self.llm, *self.state_llms.values()]:
+                model.use_scheduler(scheduler)
 
-    async def run(self, user_request: str) -> AsyncGenerator[AgentStepResult, None]:
+    def create_session(
+        self, run_id: Optional[str] = None, tenant: Optional[str] = None, priority: int = INTERACTIVE
+    ) -> AgentSession:
+        """
+        Create a fresh session for one run. Initial state is planning.
+        """
+        session = AgentSession(
+            agent=self,
+            current_state=self.states["planning"],
+            memory=AgentMemory(budget_tokens=self.memory_budget_tokens),
+            tenant=tenant,
+            priority=priority,
+            budget=self.budget_manager.start_run(tenant) if self.budget_manager is not None else None,
+        )
+        if run_id is not None:
+            session.run_id = run_id
+        return session
+
+    async def run(
+        self,
+        user_request: str,
+        session: Optional[AgentSession] = None,
+        tenant: Optional[str] = None,
+        priority: int = INTERACTIVE,
+        timeout: Optional[float] = None,
+    ) -> AsyncGenerator[AgentStepResult, None]:
         """
         Streams the Agent's think-act loop as an asynchronous generator.
         Each step yields an AgentStepResult object.
+        The LLM usage of the run is charged to `tenant`, see `BudgetManager`. Its LLM requests are queued
+        with `priority` (e.g. BATCH behind INTERACTIVE runs), and the run only starts once the queue of the scheduler has room.
+        The run ends after `timeout` seconds (default `run_timeout`) with what it has found so far, see `TimeoutState`.
+        Closing or cancelling the generator cancels the LLM requests and tool calls in flight.
+        """
+        deadline = self._deadline(timeout)
+        admitted = await self._admit_run(session.priority if session is not None else priority, deadline)
+        session = session or self.create_session(tenant=tenant, priority=priority)
+        if deadline is not None and (session.deadline is None or deadline < session.deadline):
+            session.deadline = deadline
+        session.memory.append({"role": "user", "content": user_request})
+        session.tool_names = self.toolbox.select_tools(user_request)
+        if admitted:
+            await self._recall(session, user_request)
+        else:
+            session.current_state = self.states["timeout"]
+            session.context = {"error_message": "The run passed its deadline before it could start."}
+        await self._checkpoint(session)
+
+        async for step_result in self._run_session(session):
+            yield step_result
+
+    async def resume(self, run_id: str, timeout: Optional[float] = None) -> AsyncGenerator[AgentStepResult, None]:
+        """
+        Continue a run from its last checkpoint, e.g. after the worker running it died.
+        The steps already checkpointed are not executed again, so their LLM and tool calls are not paid twice.
+        The deadline is not checkpointed, the resumed run gets `timeout` seconds (default `run_timeout`) from now.
+        """
+        session = await self.load_session(run_id)
+        session.deadline = self._deadline(timeout)
+        async for step_result in self._run_session(session, resumed=True):
+            yield step_result
+
+    async def load_session(self, run_id: str) -> AgentSession:
+        """
+        Rebuild the session of a run by replaying its checkpoint records.
+        """
+        if self.checkpoint_store is None:
+            raise ValueError("The agent has no checkpoint store to resume from.")
+        records = await asyncio.to_thread(self.checkpoint_store.load, run_id)
+        if not records:
+            raise KeyError(f"No checkpoint found for the run '{run_id}'.")
+        if records[-1].get("done"):
+            raise ValueError(f"The run '{run_id}' has already finished.")
+
+        last = records[-1]
+        session = self.create_session(run_id=run_id, tenant=last.get("tenant"), priority=last.get("priority", INTERACTIVE))
+        for record in records:
+            session.memory.restore(record["memory"])
+        session.current_state = self.states[last["state"]]
+        session.context = last["context"]
+        session.step_count = last["step_count"]
+        session.tool_names = last.get("tool_names")
+        session.found_tools = last.get("found_tools", [])
+        session.observations = last.get("observations", [])
+        if session.budget is not None and "usage" in last:
+            session.budget.restore(last["usage"])
+        session.checkpoint_seq = last["seq"] + 1
+        session.checkpointed_messages = len(session.memory)
+        session.checkpointed_compactions = session.memory.compactions
+        return session
+
+    def _deadline(self, timeout: Optional[float]) -> Optional[float]:
+        timeout = self.run_timeout if timeout is None else timeout
+        return None if timeout is None else time.monotonic() + timeout
+
+    async def _admit_run(self, priority: int, deadline: Optional[float]) -> bool:
+        """
+        Wait until the scheduler lets a run of class `priority` start. False if the deadline passed first.
+        """
+        if self.scheduler is None:
+            return True
+        try:
+            await asyncio.wait_for(
+                self.scheduler.admit_run(priority), None if deadline is None else max(0.0, deadline - time.monotonic())
+            )
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def _recall(self, session: AgentSession, user_request: str):
+        """
+        Put the facts of earlier runs relevant to the request right after it, so the planner can use them
+        instead of calling the same tools again.
+        """
+        if self.long_term_memory is None:
+            return
+        recalled = await asyncio.to_thread(self.long_term_memory.recall, user_request, self.recall_budget_tokens)
+        if recalled:
+            session.memory.append({"role": "assistant", "content": recalled})
+
+    async def _remember(self, session: AgentSession, final_answer: Optional[str]):
+        """
+        Keep the tool results and the answer of a finished run in the long-term memory.
         """
-        self.memory.append({"role": "user", "content": user_request})
-        step_count = 0
-        context = {}
+        if self.long_term_memory is None:
+            return
+        items = [("tool_result", observation) for observation in session.observations]
+        if final_answer:
+            user_request = next((message["content"] for message in session.memory if message["role"] == "user"), "")
+            items.append(("answer", f"Request: {user_request} Answer: {final_answer}"))
+        if items:
+            await asyncio.to_thread(self.long_term_memory.add_many, items)
 
-        while step_count < self.max_steps:
-            step_count += 1
+    async def _checkpoint(self, session: AgentSession, done: bool = False):
+        """
+        Append what changed since the previous checkpoint of the run: the state to continue from,
+        its context, the step count, the tools picked for the run, the successful tool calls, the budget used and the new memory messages (all of them after a compaction).
+        """
+        if self.checkpoint_store is None:
+            return
+        memory = session.memory
+        start = session.checkpointed_messages
+        if memory.compactions != session.checkpointed_compactions or start > len(memory):
+            start = 0
+        record = {
+            "seq": session.checkpoint_seq,
+            "state": session.current_state.name,
+            "context": session.context,
+            "step_count": session.step_count,
+            "tool_names": session.tool_names,
+            "found_tools": session.found_tools,
+            "observations": session.observations,
+            "tenant": session.tenant,
+            "priority": session.priority,
+            "memory": memory.snapshot(start),
+        }
+        if session.budget is not None:
+            record["usage"] = session.budget.usage()
+        if done:
+            record["done"] = True
+        await asyncio.to_thread(self.checkpoint_store.append, session.run_id, record)
+        session.checkpoint_seq += 1
+        session.checkpointed_messages = len(memory)
+        session.checkpointed_compactions = memory.compactions
+
+    async def _run_session(
+        self, session: AgentSession, resumed: bool = False
+    ) -> AsyncGenerator[AgentStepResult, None]:
+        run_span = self.tracer.start_span("run", self.name, resumed=resumed)
+        run_span.run_id = session.run_id
+        try:
+            async for step_result in self._run_steps(session, run_span):
+                yield step_result
+        finally:
+            run_span.attributes["steps"] = session.step_count
+            run_span.finish()
+            if self.scheduler is not None:
+                self.scheduler.end_run(session.run_id)
+
+    def _apply_budget(self, session: AgentSession) -> bool:
+        """
+        Degrade a run whose budget runs low: instead of planning another step, summarize what it has.
+        An exhausted budget ends the run in the error state, unless only tools are left to run; out of
+        wall time it ends in the timeout state, with the tool results it has.
+        Returns True if the run has to end.
+        """
+        if session.budget is None:
+            return False
+        status, limit = session.budget.status()
+        state = session.current_state.name
+        if status == "exhausted" and (state != "tool_execution" or limit == "wall_time"):
+            session.current_state = self.states["timeout" if limit == "wall_time" else "error"]
+            session.context = {"error_message": f"The run used up its {limit} budget."}
+            return True
+        if status == "low" and state == "planning" and "summarizing" in self.states:
+            print(f"Low on the {limit} budget, summarizing instead of planning another step.")
+            session.current_state = self.states["summarizing"]
+            session.context = {}
+        return False
+
+    def _request_context(self, session: AgentSession) -> RequestContext:
+        # The earlier of the run deadline and the end of its wall time budget
+        deadline = session.deadline
+        if session.budget is not None:
+            remaining = session.budget.remaining()["wall_time"]
+            if remaining is not None and (deadline is None or time.monotonic() + remaining < deadline):
+                deadline = time.monotonic() + remaining
+        return RequestContext(
+            session_id=session.run_id,
+            run_priority=session.priority,
+            state_priority=STATE_PRIORITIES.get(session.current_state.name, 1),
+            progress=session.step_count,
+            deadline=deadline,
+        )
+
+    async def _execute_state(self, session: AgentSession, run_span) -> tuple:
+        """
+        Execute the current state inside a "state" span. Returns (next_state_name, new_context, state_span).
+        Its LLM requests are queued as requests of this run and state, see `LLMScheduler`.
+        A state still running at the deadline of the run is cancelled (its LLM requests and tool calls with it)
+        and the run moves to the timeout state, the terminal states always run to the end.
+        """
+        state = session.current_state
+        with request_context(self._request_context(session)) as request, self.tracer.span(
+            "state", state.name, parent=run_span
+        ) as span:
+            if request.deadline is None or state.name in TERMINAL_STATES:
+                next_state_name, context = await state.execute(session, session.context)
+            else:
+                try:
+                    next_state_name, context = await asyncio.wait_for(
+                        state.execute(session, session.context), max(0.0, request.deadline - time.monotonic())
+                    )
+                except asyncio.TimeoutError:
+                    print(f"The run passed its deadline in the [{state.name}] state.")
+                    span.attributes["deadline_exceeded"] = True
+                    next_state_name, context = "timeout", {"error_message": f"The run passed its deadline in the '{state.name}' state."}
+                else:
+                    # An LLM call cut at the deadline fails the state a moment before it would be cancelled
+                    if next_state_name == "error" and time.monotonic() >= request.deadline:
+                        next_state_name = "timeout"
+        return next_state_name, context, span
+
+    async def _run_steps(
+        self, session: AgentSession, run_span
+    ) -> AsyncGenerator[AgentStepResult, None]:
+        while session.current_state.name not in TERMINAL_STATES:
+            if session.deadline is not None and time.monotonic() >= session.deadline:
+                session.current_state = self.states["timeout"]
+                session.context = {"error_message": "The run passed its deadline."}
+                break
+            if session.step_count >= self.max_steps and session.current_state.name not in CLOSING_STATES:
+                # Out of steps: end through the error state rather than planning or running tools (and paying their LLM call) once more
+                session.current_state = self.states["error"]
+                session.context = {"error_message": f"The task was not finished within {self.max_steps} steps."}
+                break
+            if self._apply_budget(session):
+                break
+
+            session.step_count += 1
 
             # Record current state
-            state_before_execution = self.current_state.name
+            state_before_execution = session.current_state.name
 
             # Execute
-            next_state_name, context = await self.current_state.execute(self, context)
-            
-            # --- Yield current result ---
+            next_state_name, session.context, state_span = await self._execute_state(
+                session, run_span
+            )
+            if session.budget is not None:
+                session.budget.charge(state_span)
+
+            # --- Current result ---
+            tool_calls = session.context.get("tool_calls") or []
             step_result = AgentStepResult(
                 current_state=state_before_execution,
-                tool_name=context.get("tool_call", {}).get("tool_name"),
-                tool_input=context.get("tool_call", {}).get("arguments"),
+                tool_name=tool_calls[0].get("tool_name") if tool_calls else None,
+                tool_input=tool_calls[0].get("arguments") if tool_calls else None,
+                tool_calls=tool_calls or None,
                 tool_output=(
-                    self.memory[-1]["content"]
-                    if self.memory and self.memory[-1]["role"] == "tool"
+                    session.memory[-1]["content"]
+                    if session.memory and session.memory[-1]["role"] == "tool"
                     else None
                 ),
+                think=session.context.get("think"),
+                trace=state_span.to_dict(),
+                budget=session.budget.remaining() if session.budget is not None else None,
             )
 
-            yield step_result
-            # -----------------------------------
-
-            # Break if it is the final/error step
-            if next_state_name in ["finished", "error"]:
-                self.current_state = self.states[next_state_name]
-                break
-
             # Move to the next state
-            self.current_state = self.states.get(next_state_name)
+            next_state = self.states.get(next_state_name)
 
-            if not self.current_state:
+            if next_state is None:
+                yield step_result
                 final_error_result = AgentStepResult(
                     current_state="error",
                     is_final=True,
@@ -70,14 +368,28 @@ class StatefulAgent(BaseAgent):
                 yield final_error_result
                 return
 
+            # Checkpoint before handing the step out, a crash from here on only loses the next step
+            session.current_state = next_state
+            await self._checkpoint(session)
+
+            yield step_result
+            # -----------------------------------
+
         # Get the final answer
-        _, final_context = await self.current_state.execute(self, context)
+        _, final_context, state_span = await self._execute_state(session, run_span)
+        if session.budget is not None:
+            session.budget.charge(state_span)
         final_answer = final_context.get("final_answer")
+        await self._checkpoint(session, done=True)
+        if session.current_state.name == "finished":
+            await self._remember(session, final_answer)
 
         # Yield the final answer
         final_step_result = AgentStepResult(
-            current_state=self.current_state.name,
+            current_state=session.current_state.name,
             is_final=True,
             final_answer=final_answer,
+            trace=state_span.to_dict(),
+            budget=session.budget.remaining() if session.budget is not None else None,
         )
         yield final_step_result
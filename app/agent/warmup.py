@@ -0,0 +1,52 @@
+import time
+import asyncio
+from typing import Sequence
+
+from app.agent.base import BaseAgent
+
+
+async def warmup(agent: BaseAgent, preload: bool = True, requests: Sequence[str] = ()) -> dict:
+    """
+    Get an agent ready for its first request: check that every model is served, then load the weights,
+    while the tool definitions are serialized and the tool worker processes started.
+    Returns the seconds each part took, and the total under "warmup".
+
+    Args:
+        agent (BaseAgent): The agent, with its LLMs created but not checked yet (see `app.llm.registry.build_llm`).
+        preload (bool): Load the weights now instead of on the first request.
+        requests (Sequence[str]): Typical requests. With a `tool_top_k` every request shows its own selection
+            of tools, the prompts of these are prepared too.
+    """
+    started = time.perf_counter()
+    timings = {}
+
+    async def timed(name: str, coroutine):
+        begin = time.perf_counter()
+        await coroutine
+        timings[name] = time.perf_counter() - begin
+
+    async def prime_tool_definitions():
+        # The same tools (and prompt) as a run of each request gets, see `ToolBox.select_tools`
+        for request in requests or [""]:
+            names = agent.toolbox.select_tools(request)
+            agent.toolbox.get_llm_tool_definitions_json(names)
+            agent.toolbox.get_planner_schema(names)
+
+    # The same LLM may serve several states
+    llms = list({id(llm): llm for llm in [agent.llm, *agent.state_llms.values()]}.values())
+
+    async def prepare_llms():
+        # A missing model ends the process, so nothing is loaded before every model is known to be served
+        await asyncio.gather(*[timed(f"check:{llm.model_name}", llm._check_model_exists()) for llm in llms])
+        if preload:
+            await asyncio.gather(*[timed(f"preload:{llm.model_name}", llm.preload()) for llm in llms])
+
+    await asyncio.gather(
+        timed("tool_definitions", prime_tool_definitions()),
+        timed("tool_workers", asyncio.to_thread(agent.toolbox.start_workers)),
+        prepare_llms(),
+    )
+
+    timings["warmup"] = time.perf_counter() - started
+    print(f"Warmed up in {timings['warmup']:.2f}s ({len(llms)} LLM(s), {len(agent.toolbox.tools)} tools)")
+    return timings
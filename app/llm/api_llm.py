@@ -1,18 +1,30 @@
 import os
 import json
+import time
 import asyncio
-from typing import Optional
+from typing import Optional, Union, AsyncIterator
 
 import openai
 from openai import AsyncOpenAI
 
-from app.llm.base import BaseLLM
+from app.llm.reasoning import ReasoningBudget, ThinkInliner
+from app.llm.base import BaseLLM, is_json_format
+from app.llm.cache import LLMCache
+from app.llm.scheduler import LLMScheduler
+from app.tracing.tracer import current_span
 
 class API_LLM(BaseLLM):
     """ """
 
-    def __init__(self, model_name: str):
-        super().__init__(model_name=model_name)
+    def __init__(
+        self,
+        model_name: str,
+        cache: Optional[LLMCache] = None,
+        scheduler: Optional[LLMScheduler] = None,
+        coalesce: bool = True,
+    ):
+        # keep_alive / num_ctx 是Ollama的参数，OpenAI API不需要
+        super().__init__(model_name=model_name, cache=cache, scheduler=scheduler, coalesce=coalesce)
 
     def _create_client(self):
         """ """
@@ -28,39 +40,136 @@ class API_LLM(BaseLLM):
             )
             raise e
 
-    async def chat(self, messages: list, format_type: Optional[str] = None) -> tuple:
+    async def preload(self):
+        """
+        远程API的模型由服务方加载，无需预热。
+        """
+        return None
+
+    @staticmethod
+    def _hit_response_time():
+        """
+        缓存命中的响应时间：和 `response.created` 一样用Unix时间戳。
+        """
+        return int(time.time())
+
+    def _build_chat_options(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> dict:
+        """
+        构建 `chat.completions.create` 的请求参数。
+        """
+        if any("thinking" in message for message in messages):
+            # 记忆中保存的思考内容不能再发回给API
+            messages = [{key: value for key, value in message.items() if key != "thinking"} for message in messages]
+        chat_options = {
+            "model": self.model_name,
+            "messages": messages,
+        }
+
+        if isinstance(format_type, dict) and "anyOf" not in format_type:
+            # 结构化输出：回复必须符合给定的JSON Schema
+            chat_options["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "reply", "schema": format_type},
+            }
+        elif is_json_format(format_type):
+            # OpenAI API需要这样来指定JSON模式。根节点为anyOf的Schema（如规划器的工具调用Schema）
+            # 不被结构化输出接受，也退回JSON模式，回复仍由调用方按Schema校验
+            chat_options["response_format"] = {"type": "json_object"}
+        if reasoning is not None and reasoning.num_predict is not None:
+            # 推理模型（如deepseek-reasoner）无法关闭思考，只能限制总的生成长度
+            chat_options["max_tokens"] = reasoning.num_predict
+        if options:
+            # 采样参数 (temperature, top_p, seed...) 在OpenAI API中是顶层参数
+            chat_options.update(options)
+        return chat_options
+
+    async def _chat(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> tuple:
         """
         【异步】通过OpenAI API与LLM通信。
 
         Args:
             messages (list): 发送给模型的完整消息列表。
-            format_type (Optional[str], optional): 如果为 "json"，则强制模型返回JSON。
+            format_type (Optional[Union[str, dict]], optional): 如果为 "json"，则强制模型返回JSON；如果为dict，则作为JSON Schema约束输出。
+            options (Optional[dict], optional): 采样参数。
+            reasoning (Optional[ReasoningBudget], optional): 思考预算，API只支持 `num_predict`。
 
         Returns:
-            tuple: (content, response_time)。
+            tuple: (think, content, response_time)。出错时response_time为None。
         """
         try:
-            chat_options = {
-                "model": self.model_name,
-                "messages": messages,
-            }
-
-            if format_type == "json":
-                # OpenAI API需要这样来指定JSON模式
-                chat_options["response_format"] = {"type": "json_object"}
+            chat_options = self._build_chat_options(messages, format_type, options, reasoning)
 
             response = await self.client.chat.completions.create(**chat_options)
 
-            content = response.choices[0].message.content
+            message = response.choices[0].message
+            content = message.content
             # OpenAI的响应中没有直接的created_at，但我们可以用完成时间戳
             response_time = response.created
+            self._record_usage(response.usage)
 
-            return "", content, response_time
+            # DeepSeek的推理模型把思考放在 reasoning_content 中
+            think_part = getattr(message, "reasoning_content", None)
+            return think_part, content, response_time
 
         except openai.APIError as e:
             error_message = f"OpenAI API返回错误: {e}"
             print(error_message)
-            if format_type == "json":
-                return f'{{"error": "{error_message}"}}', None
-            else:
-                return "", error_message, None
\ No newline at end of file
+            # 和其它后端一样返回三元组，由调用方决定如何处理
+            return "", error_message, None
+
+    def _record_usage(self, usage):
+        """
+        把OpenAI返回的token用量记录到当前的LLM span上。
+        """
+        span = current_span.get()
+        if span is None or span.kind != "llm" or usage is None:
+            return
+        span.prompt_tokens = usage.prompt_tokens
+        span.eval_tokens = usage.completion_tokens
+
+    async def _chat_stream(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> AsyncIterator[str]:
+        """
+        【异步】以流的形式返回模型输出的增量文本。
+        提前关闭迭代器会关闭HTTP连接，从而停止剩余的生成。
+        """
+        chat_options = self._build_chat_options(messages, format_type, options, reasoning)
+        chat_options["stream"] = True
+        # 让最后一个chunk带上token用量
+        chat_options["stream_options"] = {"include_usage": True}
+
+        stream = await self.client.chat.completions.create(**chat_options)
+        # 把 reasoning_content 还原为<think>块，和其它后端的流格式一致
+        inliner = ThinkInliner()
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    self._record_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                choice_delta = chunk.choices[0].delta
+                delta = inliner.feed(getattr(choice_delta, "reasoning_content", None), choice_delta.content)
+                if delta:
+                    yield delta
+            delta = inliner.close()
+            if delta:
+                yield delta
+        finally:
+            await stream.close()
@@ -1,16 +1,48 @@
-import re
 import sys
+import time
 import asyncio
-from typing import Optional
+import contextlib
+from typing import Optional, Union, AsyncIterator
 from abc import ABC, abstractmethod
 
+from app.llm.cache import LLMCache, make_cache_key
+from app.llm.coalescing import InflightRequests, is_deterministic
+from app.llm.scheduler import DeadlineExceeded, LLMScheduler, RequestContext, time_left
+from app.utils.json_stream import THINK_OPEN, THINK_CLOSE, IncrementalJSONParser
+from app.llm.reasoning import (
+    ReasoningBudget,
+    ThinkInliner,
+    ThinkSplitter,
+    estimate_think_tokens,
+    split_think,
+)
+from app.tracing.tracer import current_span, start_span, trace_span
+
+# Error of an LLM request cut at the deadline of its run
+DEADLINE_MESSAGE = "The deadline of the run passed before the LLM replied."
+
+
+def is_json_format(format_type: Optional[Union[str, dict]]) -> bool:
+    """
+    "json" asks for any JSON object, a dict is the JSON schema the reply has to follow.
+    """
+    return format_type == "json" or isinstance(format_type, dict)
+
 
 class BaseLLM(ABC):
     """
     An abstract LLM class
     """
 
-    def __init__(self, model_name: str):
+    def __init__(
+        self,
+        model_name: str,
+        cache: Optional[LLMCache] = None,
+        keep_alive: Optional[Union[str, float]] = None,
+        num_ctx: Optional[int] = None,
+        scheduler: Optional[LLMScheduler] = None,
+        coalesce: bool = True,
+    ):
         """
         Initialize the LLM based on the name of the model
 
@@ -19,10 +51,20 @@ class BaseLLM(ABC):
             More model details can be found in:
                 - https://ollama.com
                 - https://huggingface.co/models
+            cache (Optional[LLMCache]): Reuse the replies of identical requests. None disables caching.
+            keep_alive (Optional[Union[str, float]]): How long the server keeps the model (and its prompt cache) loaded, such as "30m" or -1 for forever.
+            num_ctx (Optional[int]): Context window size. Keeping it fixed avoids reloading the model between requests.
+            scheduler (Optional[LLMScheduler]): Queues the requests sent to the server, see `use_scheduler`. None sends them right away.
+            coalesce (bool): Identical requests in flight at the same time share one request to the server, see `InflightRequests`.
         """
 
         print(f"Start initializing the LLM: {model_name}...")
         self.model_name = model_name
+        self.cache = cache
+        self.keep_alive = keep_alive
+        self.num_ctx = num_ctx
+        self.scheduler = scheduler
+        self.inflight = InflightRequests(on_requeue=self._requeue) if coalesce else None
         self.client = self._create_client()
         # self._check_model_exists()
 
@@ -63,42 +105,475 @@ class BaseLLM(ABC):
             # TODO: I am not sure if it is safe or not
             sys.exit(1)
 
-    async def chat(self, messages: list, format_type: Optional[str] = None) -> tuple:
+    def use_scheduler(self, scheduler: Optional[LLMScheduler]):
+        """
+        Admit the requests of this LLM through `scheduler`, usually the one shared by every LLM of an agent.
+        """
+        self.scheduler = scheduler
+
+    def _requeue(self, context: RequestContext):
+        # A shared request got a more (or less) urgent caller while it waits for a slot
+        if self.scheduler is not None:
+            self.scheduler.requeue(context)
+
+    @property
+    def scheduler_key(self) -> tuple[str, int]:
+        """
+        (The queue of the scheduler the requests wait in, how many servers serve that queue).
+        Ollama runs the parallel requests of each model apart, so by default every model has its own queue.
+        """
+        return self.model_name, 1
+
+    @contextlib.asynccontextmanager
+    async def _admitted(self):
+        """
+        Hold a request slot of the scheduler, if any, while the body sends the request.
+        """
+        if self.scheduler is None:
+            yield
+            return
+        key, hosts = self.scheduler_key
+        async with self.scheduler.slot(key, hosts) as waited:
+            span = current_span.get()
+            if span is not None and span.kind == "llm":
+                span.attributes["scheduler_wait"] = round(waited, 6)
+            yield
+
+    async def preload(self):
+        """
+        Load the model into memory before the first real request. Ollama loads the weights (and keeps
+        them for `keep_alive`) when it gets a chat request without messages.
+        """
+        request = {"model": self.model_name, "messages": []}
+        if self.keep_alive is not None:
+            request["keep_alive"] = self.keep_alive
+        await self.client.chat(**request)
+
+    def _build_chat_options(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> dict:
+        """
+        Build the keyword arguments for an Ollama `client.chat` request.
+        """
+        chat_options = {
+            "model": self.model_name,
+            "messages": messages,
+            # "options": {"temperature": 0}
+        }
+        if is_json_format(format_type):
+            # Ollama takes either "json" or a JSON schema to constrain the output to
+            chat_options["format"] = format_type
+        if self.num_ctx is not None:
+            options = {"num_ctx": self.num_ctx, **(options or {})}
+        if reasoning is not None:
+            if reasoning.think is not None:
+                chat_options["think"] = reasoning.think
+            if reasoning.num_predict is not None:
+                options = {"num_predict": reasoning.num_predict, **(options or {})}
+        if options:
+            chat_options["options"] = options
+        if self.keep_alive is not None:
+            chat_options["keep_alive"] = self.keep_alive
+        return chat_options
+
+    def _cache_key(
+        self, messages: list, format_type, options: Optional[dict], reasoning: Optional[ReasoningBudget]
+    ) -> str:
+        if reasoning is not None:
+            options = {**(options or {}), "reasoning": reasoning.cache_key()}
+        return make_cache_key(self.model_name, messages, format_type, options)
+
+    async def chat(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> tuple:
         """
         This method could communicate with the LLM. Return the Tuple(think part, result part, response time).
-        If the selected model is not a reasoning model, the think part would be None.
+        If the selected model is not a reasoning model, the think part would be None. The response time is None if the request failed.
+
+        Args:
+            messages (list): The full message list sent to the model.
+            format_type (Optional[Union[str, dict]]): "json" forces the model to reply with JSON, a JSON schema (dict) with JSON that follows it.
+            options (Optional[dict]): Sampling options such as temperature or seed.
+            reasoning (Optional[ReasoningBudget]): Thinking switch and token caps. `max_think_tokens` needs
+                a stream to be enforced, see `chat_stream_parts`; here only `think` and `num_predict` apply.
         """
+        # Timing and token usage of the call are recorded on an "llm" span
+        with trace_span("llm", self.model_name, stream=False) as span:
+            try:
+                # No longer than the run has left, the request is cancelled at its deadline
+                result = await asyncio.wait_for(self._cached_chat(messages, format_type, options, reasoning), time_left())
+            except asyncio.TimeoutError:
+                # Like a failed request: no response time, the caller decides what to do
+                print(f"Some error occur when interacting: {DEADLINE_MESSAGE}")
+                span.attributes["deadline_exceeded"] = True
+                result = "", DEADLINE_MESSAGE, None
+            if result[0]:
+                span.attributes["think_tokens"] = estimate_think_tokens(result[0])
+            return result
 
-        try:
-            chat_options = {
-                "model": self.model_name,
-                "messages": messages,
-                # "options": {"temperature": 0}
-            }
-            if format_type == "json":
-                chat_options["format"] = "json"
+    async def _cached_chat(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> tuple:
+        if self.cache is None:
+            return await self._coalesced_chat(messages, format_type, options, reasoning)
 
-            response = await self.client.chat(**chat_options)
-            content = response["message"]["content"]
-            response_time = response["created_at"]
+        span = current_span.get()
+        key = self._cache_key(messages, format_type, options, reasoning)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            span.attributes["cache"] = "hit"
+            think_part, content = cached
+            # A response time like any successful reply, None is left to mean a failed request
+            return think_part, content, self._hit_response_time()
 
-            print("???", content)
+        span.attributes["cache"] = "miss"
+        result = await self._coalesced_chat(messages, format_type, options, reasoning)
+        # Only successful replies carry a response time, errors are never cached
+        if result[2] is not None:
+            self.cache.put(key, (result[0], result[1]))
+        return result
 
-            return "", content, response_time
+    @staticmethod
+    def _hit_response_time():
+        """
+        The response time of a reply served from the cache: now, in the form of Ollama's `created_at`.
+        """
+        return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
 
-            if "<think>" not in content:
-                # Not a resoning model
-                return None, content, response_time
-            else:
-                think_pattern = r"<think>(.*?)</think>"
+    @staticmethod
+    def _mark_coalesced():
+        # The reply of another caller's request, that request is the one counted
+        span = current_span.get()
+        if span is not None and span.kind == "llm":
+            span.attributes["coalesced"] = True
 
-                think_part = (
-                    re.search(think_pattern, content, re.DOTALL).group(1).strip()
-                )
-                response_part = content.split("</think>")[1]
+    async def _coalesced_chat(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> tuple:
+        if self.inflight is None or not is_deterministic(options):
+            return await self._scheduled_chat(messages, format_type, options, reasoning)
+        key = self._cache_key(messages, format_type, options, reasoning)
+        result, coalesced = await self.inflight.chat(
+            key, lambda: self._scheduled_chat(messages, format_type, options, reasoning)
+        )
+        if coalesced:
+            self._mark_coalesced()
+        return result
+
+    async def _scheduled_chat(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> tuple:
+        try:
+            async with self._admitted():
+                return await self._chat(messages, format_type, options, reasoning)
+        except DeadlineExceeded as e:
+            # Like a failed request: no response time, the caller decides what to do
+            print(f"Some error occur when interacting: {e}")
+            return "", str(e), None
+
+    async def _chat(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> tuple:
+        """
+        Send one chat request to the Ollama backend.
+        """
+
+        try:
+            chat_options = self._build_chat_options(messages, format_type, options, reasoning)
 
-                return think_part, response_part, response_time
+            response = await self.client.chat(**chat_options)
+            return self._parse_response(response)
         except Exception as e:
             error_message = f"Some error occur when interacting: {e}"
             print(error_message)
-            return error_message
+            return "", error_message, None
+
+    def _parse_response(self, response) -> tuple:
+        """
+        Turn an Ollama chat response into the Tuple(think part, result part, response time).
+        """
+        message = response["message"]
+        content = message["content"]
+        response_time = response["created_at"]
+        self._record_usage(response)
+
+        # With `think` set, Ollama returns the thinking apart from the answer
+        thinking = message.get("thinking")
+        if thinking:
+            return thinking.strip(), content, response_time
+
+        # Otherwise a reasoning model puts it in a <think> block before the answer
+        think_part, response_part = split_think(content)
+        return think_part, response_part, response_time
+
+    def _record_usage(self, response):
+        """
+        Copy the token counts and durations (nanoseconds) reported by Ollama to the current LLM span.
+        """
+        span = current_span.get()
+        if span is None or span.kind != "llm":
+            return
+
+        def seconds(name):
+            value = response.get(name)
+            return value / 1e9 if value is not None else None
+
+        span.prompt_tokens = response.get("prompt_eval_count")
+        span.eval_tokens = response.get("eval_count")
+        span.prompt_eval_duration = seconds("prompt_eval_duration")
+        span.eval_duration = seconds("eval_duration")
+        span.server_time = seconds("total_duration")
+        load_duration = seconds("load_duration")
+        if span.ttft is None and span.prompt_eval_duration is not None:
+            # Without streaming the first token is not observable, use the server's estimate
+            span.ttft = (load_duration or 0.0) + span.prompt_eval_duration
+
+    async def chat_stream(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream the answer of the LLM as an async iterator of content deltas, without the thinking.
+        Closing the iterator early (e.g. `aclose()` or `break`) stops the generation on the server.
+        """
+        parts = self.chat_stream_parts(messages, format_type, options, reasoning)
+        try:
+            async for kind, delta in parts:
+                if kind == "content":
+                    yield delta
+        finally:
+            await parts.aclose()
+
+    async def chat_stream_parts(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> AsyncIterator[tuple[str, str]]:
+        """
+        Stream the reply as ("think", delta) and ("content", delta) pairs.
+        When the thinking exceeds `reasoning.max_think_tokens` before the answer started, the
+        generation is stopped and the request is sent again with thinking disabled.
+        """
+        span = start_span("llm", self.model_name, stream=True)
+        error = None
+        think_tokens = 0
+        generated_chars = 0
+        try:
+            while True:
+                splitter = ThinkSplitter()
+                capped = False
+                stream = self._cached_chat_stream(messages, format_type, options, reasoning)
+                try:
+                    while True:
+                        # The span is only current while the backend runs, never across our own yields
+                        token = current_span.set(span)
+                        try:
+                            left = time_left()
+                            if left is None:
+                                delta = await stream.__anext__()
+                            else:
+                                delta = await asyncio.wait_for(stream.__anext__(), left)
+                        except StopAsyncIteration:
+                            break
+                        except asyncio.TimeoutError:
+                            # The stream was cancelled at the deadline of the run, and its request with it
+                            span.attributes["deadline_exceeded"] = True
+                            raise DeadlineExceeded(DEADLINE_MESSAGE) from None
+                        finally:
+                            current_span.reset(token)
+                        if span.ttft is None:
+                            span.ttft = span.elapsed()
+                        generated_chars += len(delta)
+                        for part in splitter.feed(delta):
+                            yield part
+                        if (
+                            reasoning is not None
+                            and reasoning.max_think_tokens is not None
+                            and not splitter.content_started
+                            and splitter.think_tokens > reasoning.max_think_tokens
+                        ):
+                            capped = True
+                            break
+                    if not capped:
+                        for part in splitter.flush():
+                            yield part
+                finally:
+                    think_tokens += splitter.think_tokens
+                    token = current_span.set(span)
+                    try:
+                        await stream.aclose()
+                    finally:
+                        current_span.reset(token)
+
+                if not capped:
+                    break
+                print(f"Thinking of '{self.model_name}' exceeded {reasoning.max_think_tokens} tokens, answering without it.")
+                span.attributes["think_capped"] = True
+                reasoning = reasoning.without_thinking()
+        except GeneratorExit:
+            # Closed early by the consumer, not an error
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if think_tokens:
+                span.attributes["think_tokens"] = think_tokens
+            self._estimate_usage(span, messages, generated_chars)
+            span.finish(error)
+
+    @staticmethod
+    def _estimate_usage(span, messages: list, generated_chars: int):
+        """
+        A stream closed before its last chunk never gets the token counts of the server, estimate them
+        (about 4 characters per token) so budgets still see the request.
+        """
+        if span.prompt_tokens is not None or span.attributes.get("cache") == "hit" or span.attributes.get("coalesced"):
+            return
+        if any(child.kind == "llm" for child in span.children):
+            # A wrapping LLM, the requests of its backends are counted
+            return
+        span.prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4
+        span.eval_tokens = generated_chars // 4
+        span.attributes["usage"] = "estimated"
+
+    async def _cached_chat_stream(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> AsyncIterator[str]:
+        span = current_span.get()
+        if self.cache is None:
+            async for delta in self._coalesced_chat_stream(messages, format_type, options, reasoning):
+                yield delta
+            return
+
+        key = self._cache_key(messages, format_type, options, reasoning)
+        cached = await self.cache.get(key)
+        if cached is not None:
+            span.attributes["cache"] = "hit"
+            think_part, content = cached
+            yield f"{THINK_OPEN}{think_part}{THINK_CLOSE}{content}" if think_part else content
+            return
+
+        span.attributes["cache"] = "miss"
+        splitter = ThinkSplitter()
+        completed = False
+        # A JSON reply closed right after its object is complete is still worth caching
+        parser = IncrementalJSONParser() if is_json_format(format_type) else None
+        try:
+            async for delta in self._coalesced_chat_stream(messages, format_type, options, reasoning):
+                splitter.feed(delta)
+                if parser is not None and not parser.done:
+                    try:
+                        parser.feed(delta)
+                    except ValueError:
+                        parser = None
+                yield delta
+            completed = True
+        finally:
+            splitter.flush()
+            if completed:
+                self.cache.put(key, (splitter.think, splitter.content))
+            elif parser is not None and parser.done:
+                self.cache.put(key, (splitter.think, parser.raw))
+
+    async def _coalesced_chat_stream(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> AsyncIterator[str]:
+        if self.inflight is None or not is_deterministic(options):
+            stream = self._scheduled_chat_stream(messages, format_type, options, reasoning)
+        else:
+            stream = self.inflight.chat_stream(
+                self._cache_key(messages, format_type, options, reasoning),
+                lambda: self._scheduled_chat_stream(messages, format_type, options, reasoning),
+                on_coalesced=self._mark_coalesced,
+            )
+        try:
+            async for delta in stream:
+                yield delta
+        finally:
+            await stream.aclose()
+
+    async def _scheduled_chat_stream(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> AsyncIterator[str]:
+        """
+        The stream of `_chat_stream`, holding its request slot until the stream ends or is closed.
+        """
+        async with self._admitted():
+            stream = self._chat_stream(messages, format_type, options, reasoning)
+            try:
+                async for delta in stream:
+                    yield delta
+            finally:
+                await stream.aclose()
+
+    async def _chat_stream(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream one chat request from the Ollama backend.
+        """
+        chat_options = self._build_chat_options(messages, format_type, options, reasoning)
+        chat_options["stream"] = True
+
+        stream = await self.client.chat(**chat_options)
+        inliner = ThinkInliner()
+        try:
+            async for chunk in stream:
+                if chunk.get("done"):
+                    self._record_usage(chunk)
+                message = chunk["message"]
+                delta = inliner.feed(message.get("thinking"), message["content"])
+                if delta:
+                    yield delta
+            delta = inliner.close()
+            if delta:
+                yield delta
+        finally:
+            # Closing the underlying HTTP stream cancels the rest of the generation
+            await stream.aclose()
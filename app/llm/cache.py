@@ -0,0 +1,192 @@
+import json
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+from typing import Optional, Union
+from collections import OrderedDict
+
+
+def make_cache_key(
+    model_name: str,
+    messages: list,
+    format_type: Optional[Union[str, dict]] = None,
+    options: Optional[dict] = None,
+) -> str:
+    """
+    Build a stable cache key from everything that decides the reply of the LLM.
+    Messages and options are serialized canonically, so dict ordering and whitespace do not matter.
+    """
+    payload = json.dumps(
+        {
+            "model": model_name,
+            "messages": messages,
+            "format": format_type,
+            "options": options or {},
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryLRUCache:
+    """
+    The in-memory tier: a bounded least-recently-used mapping.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key: str) -> Optional[tuple]:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: tuple):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """
+    The on-disk tier. Entries older than `ttl` seconds are ignored and purged,
+    and the least recently used entries are evicted once there are more than `max_entries`.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000, ttl: Optional[float] = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._writes_since_eviction = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[tuple]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return tuple(json.loads(row[0]))
+
+    def put(self, key: str, value: tuple):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(list(value), ensure_ascii=False), now, now),
+            )
+            self._writes_since_eviction += 1
+            # Counting rows is not free, so only evict every few writes
+            if self._writes_since_eviction >= max(1, self.max_entries // 100):
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        self._writes_since_eviction = 0
+        if self.ttl is not None:
+            self._conn.execute("DELETE FROM llm_cache WHERE created < ?", (time.time() - self.ttl,))
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY accessed ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class LLMCache:
+    """
+    A two-tier cache for LLM replies: an in-memory LRU in front of an optional SQLite file.
+    The cached value is the (think part, result part) of a reply.
+    """
+
+    def __init__(
+        self,
+        max_memory_entries: int = 1024,
+        path: Optional[str] = None,
+        max_disk_entries: int = 100_000,
+        ttl: Optional[float] = None,
+    ):
+        """
+        Args:
+            max_memory_entries (int): Size of the in-memory LRU tier.
+            path (Optional[str]): SQLite file for the on-disk tier. None keeps the cache in memory only.
+            max_disk_entries (int): Size limit of the on-disk tier.
+            ttl (Optional[float]): Seconds after which an on-disk entry expires. None means never.
+        """
+        self.memory = MemoryLRUCache(max_memory_entries)
+        self.disk = SQLiteCache(path, max_disk_entries, ttl) if path else None
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0}
+        self._pending_writes: set = set()
+
+    @property
+    def hit_rate(self) -> float:
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    async def get(self, key: str) -> Optional[tuple]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.stats["memory_hits"] += 1
+            return value
+
+        if self.disk is not None:
+            value = await asyncio.to_thread(self.disk.get, key)
+            if value is not None:
+                self.stats["disk_hits"] += 1
+                # Promote to the memory tier
+                self.memory.put(key, value)
+                return value
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key: str, value: tuple):
+        """
+        Store a reply. The memory tier is updated right away, the disk write runs in the background.
+        """
+        self.stats["writes"] += 1
+        self.memory.put(key, value)
+        if self.disk is not None:
+            task = asyncio.get_running_loop().create_task(asyncio.to_thread(self.disk.put, key, value))
+            self._pending_writes.add(task)
+            task.add_done_callback(self._pending_writes.discard)
+
+    async def flush(self):
+        """
+        Wait until every background disk write is done.
+        """
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes)
@@ -0,0 +1,193 @@
+import time
+import asyncio
+from typing import AsyncIterator, Optional, Union
+
+from app.llm.reasoning import ReasoningBudget, ThinkInliner
+from app.llm.base import BaseLLM, is_json_format
+from app.tools.tool_box import ToolBox
+from app.utils.json_stream import IncrementalJSONParser
+
+
+class Cascade_LLM(BaseLLM):
+    """
+    This is a class that tries a cheap model first and escalates to a large model only when needed.
+
+    A JSON reply of the small model is escalated when it cannot be parsed, does not match the tool schema
+    or names an unknown tool. A plain text reply is only escalated when the small model failed.
+    """
+
+    def __init__(
+        self,
+        small: BaseLLM,
+        large: BaseLLM,
+        toolbox: Optional[ToolBox] = None,
+        ewma_alpha: float = 0.2,
+        model_name: Optional[str] = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            small (BaseLLM): The cheap model that answers first, such as "qwen3:1.7b".
+            large (BaseLLM): The model used when the small one's answer is not usable, such as "deepseek-r1:14b".
+            toolbox (Optional[ToolBox]): Used to validate tool calls. Without it only the JSON syntax is checked.
+            ewma_alpha (float): Weight of the newest sample in the latency averages.
+            model_name (Optional[str]): Name of the cascade in logs and traces, "<small>-><large>" by default.
+            kwargs: Options of `BaseLLM`, such as `cache`.
+        """
+        self.small = small
+        self.large = large
+        self.toolbox = toolbox
+        self.ewma_alpha = ewma_alpha
+        self.calls = 0
+        self.escalations = 0
+        self.small_ewma: Optional[float] = None
+        self.large_ewma: Optional[float] = None
+        self.latency_saved = 0.0
+        super().__init__(model_name=model_name or f"{small.model_name}->{large.model_name}", **kwargs)
+        if self.scheduler is not None:
+            self.use_scheduler(self.scheduler)
+
+    def _create_client(self):
+        # The tiers own their clients
+        return None
+
+    async def _check_model_exists(self):
+        await asyncio.gather(self.small._check_model_exists(), self.large._check_model_exists())
+
+    async def preload(self):
+        await asyncio.gather(self.small.preload(), self.large.preload())
+
+    def use_scheduler(self, scheduler):
+        # The tiers send the requests, each waits for its own server
+        self.scheduler = None
+        self.small.use_scheduler(scheduler)
+        self.large.use_scheduler(scheduler)
+
+    @property
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "escalations": self.escalations,
+            "escalation_rate": self.escalations / self.calls if self.calls else 0.0,
+            "small_ewma_latency": self.small_ewma,
+            "large_ewma_latency": self.large_ewma,
+            "latency_saved": self.latency_saved,
+        }
+
+    def _update_ewma(self, current: Optional[float], sample: float) -> float:
+        if current is None:
+            return sample
+        return self.ewma_alpha * sample + (1 - self.ewma_alpha) * current
+
+    def _record(self, small_latency: float, large_latency: Optional[float] = None):
+        """
+        Account one call. Time is saved when the large model was not needed,
+        and lost (the small model's attempt) when it was.
+        """
+        self.calls += 1
+        self.small_ewma = self._update_ewma(self.small_ewma, small_latency)
+        if large_latency is None:
+            if self.large_ewma is not None:
+                self.latency_saved += self.large_ewma - small_latency
+        else:
+            self.escalations += 1
+            self.large_ewma = self._update_ewma(self.large_ewma, large_latency)
+            self.latency_saved -= small_latency
+
+    def rejection_reason(self, content: Optional[str], format_type: Optional[Union[str, dict]]) -> Optional[str]:
+        """
+        Why a reply of the small model cannot be used, or None if it can.
+        """
+        if not content:
+            return "empty reply"
+        if not is_json_format(format_type):
+            return None
+
+        parser = IncrementalJSONParser()
+        try:
+            decision = parser.feed(content)
+        except ValueError:
+            return "invalid JSON"
+        if decision is None:
+            return "incomplete JSON"
+        if self.toolbox is not None:
+            return self.toolbox.validate_tool_calls(decision)
+        return None
+
+    async def _chat(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> tuple:
+        started = time.monotonic()
+        result = await self.small.chat(messages, format_type, options, reasoning)
+        small_latency = time.monotonic() - started
+
+        reason = "small model failed" if result[2] is None else self.rejection_reason(result[1], format_type)
+        if reason is None:
+            self._record(small_latency)
+            return result
+
+        print(f"Escalating from '{self.small.model_name}' to '{self.large.model_name}': {reason}")
+        started = time.monotonic()
+        result = await self.large.chat(messages, format_type, options, reasoning)
+        self._record(small_latency, time.monotonic() - started)
+        return result
+
+    async def _chat_stream(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> AsyncIterator[str]:
+        """
+        The small model's reply is held back until it is validated (for JSON, until its object is complete),
+        then either released or replaced by the large model's stream.
+        """
+        started = time.monotonic()
+        parts = []
+        think_parts = []
+        parser = IncrementalJSONParser() if is_json_format(format_type) else None
+        reason = None
+        stream = self.small.chat_stream_parts(messages, format_type, options, reasoning)
+        try:
+            async for kind, delta in stream:
+                if kind == "think":
+                    think_parts.append(delta)
+                    continue
+                parts.append(delta)
+                if parser is not None and parser.feed(delta) is not None:
+                    break
+        except ValueError:
+            reason = "invalid JSON"
+        except Exception as e:
+            reason = f"small model failed: {e}"
+        finally:
+            await stream.aclose()
+        small_latency = time.monotonic() - started
+
+        content = parser.raw if parser is not None and parser.done else "".join(parts)
+        reason = reason or self.rejection_reason(content, format_type)
+        if reason is None:
+            self._record(small_latency)
+            # Pass the thinking on in the same <think> form as the other backends
+            inliner = ThinkInliner()
+            yield inliner.feed("".join(think_parts), content)
+            return
+
+        print(f"Escalating from '{self.small.model_name}' to '{self.large.model_name}': {reason}")
+        started = time.monotonic()
+        inliner = ThinkInliner()
+        stream = self.large.chat_stream_parts(messages, format_type, options, reasoning)
+        try:
+            async for kind, delta in stream:
+                yield inliner.feed(delta if kind == "think" else None, delta if kind == "content" else None)
+            delta = inliner.close()
+            if delta:
+                yield delta
+        finally:
+            await stream.aclose()
+            self._record(small_latency, time.monotonic() - started)
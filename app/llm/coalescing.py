@@ -0,0 +1,201 @@
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from app.llm.scheduler import RequestContext, current_request, request_context
+
+
+def is_deterministic(options: Optional[dict]) -> bool:
+    """
+    Whether identical requests are meant to get the same reply. Like the cache, requests without
+    sampling options are taken as having one answer; a temperature without a seed asks for variety.
+    """
+    if not options:
+        return True
+    return not options.get("temperature") or "seed" in options
+
+
+def _urgency(context: RequestContext) -> tuple:
+    # The order of `LLMScheduler`, without the fairness between sessions
+    return (
+        context.run_priority,
+        context.state_priority,
+        context.deadline if context.deadline is not None else float("inf"),
+        -context.progress,
+    )
+
+
+class _Shared:
+    """
+    The callers of a shared request. The request runs in a request context of its own, that of the
+    most urgent caller still waiting, so joining an earlier caller's request never queues behind it.
+    """
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters: list[RequestContext] = []
+        self.context = RequestContext(shared=True)
+
+    def start(self, awaitable: Awaitable):
+        self.task = asyncio.get_running_loop().create_task(self._run(awaitable))
+
+    async def _run(self, awaitable: Awaitable):
+        with request_context(self.context):
+            return await awaitable
+
+    def join(self) -> RequestContext:
+        waiter = current_request.get() or RequestContext()
+        self.waiters.append(waiter)
+        return waiter
+
+    def leave(self, waiter: RequestContext):
+        self.waiters.remove(waiter)
+
+    def update(self) -> bool:
+        """
+        Take on the context of the most urgent waiter. Returns True if that changed the context.
+        """
+        if not self.waiters:
+            return False
+        best = min(self.waiters, key=_urgency)
+        fields = {
+            "session_id": best.session_id,
+            "run_priority": best.run_priority,
+            "state_priority": best.state_priority,
+            "progress": best.progress,
+            "deadline": best.deadline,
+        }
+        if all(getattr(self.context, name) == value for name, value in fields.items()):
+            return False
+        for name, value in fields.items():
+            setattr(self.context, name, value)
+        return True
+
+
+class _SharedStream(_Shared):
+    """
+    One upstream stream read by a background task, replayed to every subscriber from its first delta.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.deltas: list[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self._wake = asyncio.Event()
+
+    def _notify(self):
+        self._wake.set()
+        self._wake = asyncio.Event()
+
+    async def produce(self, stream: AsyncIterator[str]):
+        try:
+            async for delta in stream:
+                self.deltas.append(delta)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._notify()
+            # Closing the upstream stream stops the generation on the server
+            await stream.aclose()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        index = 0
+        while True:
+            while index < len(self.deltas):
+                yield self.deltas[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            await self._wake.wait()
+
+
+class InflightRequests:
+    """
+    Identical requests in flight at the same time share one upstream request.
+
+    The first caller of a key starts the request in a task of its own, later callers of the same key
+    wait for that task (or replay its stream) instead of sending theirs. The request goes on as long
+    as one caller still waits for it, a caller leaving early (cancelled, or closing its stream) never
+    cancels it for the others; the last one leaving does, which stops the generation on the server.
+    Unlike the cache it also helps with replies that are never stored, such as failed or closed streams.
+
+    The request is sent with the request context of its most urgent waiting caller (see `_Shared`),
+    `on_requeue` is called with that context when a caller joining or leaving changed it.
+    """
+
+    def __init__(self, on_requeue: Optional[Callable[[RequestContext], None]] = None):
+        self._replies: dict[str, _Shared] = {}
+        self._streams: dict[str, _SharedStream] = {}
+        self.on_requeue = on_requeue
+        self.stats = {"requests": 0, "coalesced": 0}
+
+    def _forget(self, table: dict, key: str, shared):
+        if table.get(key) is shared:
+            del table[key]
+
+    def _update(self, shared: _Shared):
+        if shared.update() and shared.task is not None and self.on_requeue is not None:
+            self.on_requeue(shared.context)
+
+    def _leave(self, table: dict, key: str, shared: _Shared, waiter: RequestContext):
+        shared.leave(waiter)
+        if shared.task.done():
+            return
+        if not shared.waiters:
+            shared.task.cancel()
+            self._forget(table, key, shared)
+        else:
+            self._update(shared)
+
+    async def chat(self, key: str, send: Callable[[], Awaitable[tuple]]) -> tuple[tuple, bool]:
+        """
+        The reply of `send()` for `key`, and whether it was shared with an earlier caller.
+        """
+        shared = self._replies.get(key)
+        coalesced = shared is not None
+        if shared is None:
+            shared = self._replies[key] = _Shared()
+            self.stats["requests"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        waiter = shared.join()
+        self._update(shared)
+        if shared.task is None:
+            shared.start(send())
+            shared.task.add_done_callback(lambda _: self._forget(self._replies, key, shared))
+        try:
+            return await asyncio.shield(shared.task), coalesced
+        finally:
+            self._leave(self._replies, key, shared, waiter)
+
+    async def chat_stream(
+        self, key: str, open_stream: Callable[[], AsyncIterator[str]], on_coalesced: Optional[Callable[[], None]] = None
+    ) -> AsyncIterator[str]:
+        """
+        The deltas of `open_stream()` for `key`, from the first one. `on_coalesced` is called when the
+        stream of an earlier caller is shared.
+        """
+        shared = self._streams.get(key)
+        if shared is None:
+            shared = self._streams[key] = _SharedStream()
+            self.stats["requests"] += 1
+        else:
+            self.stats["coalesced"] += 1
+            if on_coalesced is not None:
+                on_coalesced()
+        waiter = shared.join()
+        self._update(shared)
+        if shared.task is None:
+            shared.start(shared.produce(open_stream()))
+            shared.task.add_done_callback(lambda _: self._forget(self._streams, key, shared))
+        subscription = shared.subscribe()
+        try:
+            async for delta in subscription:
+                yield delta
+        finally:
+            await subscription.aclose()
+            self._leave(self._streams, key, shared, waiter)
@@ -0,0 +1,131 @@
+import time
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+
+class HedgePolicy:
+    """
+    When to send a duplicate of a slow request to another host, and how often that is allowed.
+
+    A request is hedged once it has been waiting longer than the `percentile` of the recent
+    latencies of its kind ("chat": the whole reply, "stream": the first chunk), so only the slowest
+    few percent of requests get a duplicate. Every request earns `budget` of a hedge (up to
+    `max_tokens` saved up) and a hedge spends a whole one, so hedges stay at about `budget` of the
+    requests however slow the hosts get, and never double the load of an overloaded pool.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        budget: float = 0.1,
+        max_tokens: float = 10.0,
+        min_delay: float = 0.05,
+        initial_delay: float = 1.0,
+        min_samples: int = 20,
+        window: int = 500,
+    ):
+        """
+        Args:
+            percentile (float): Latency percentile after which a request is hedged.
+            budget (float): Hedges per request in the long run, 0.1 allows one for every 10 requests.
+            max_tokens (float): Hedges that can be saved up for a burst of slow requests.
+            min_delay (float): Lower bound of the hedge delay, in seconds.
+            initial_delay (float): Delay used until `min_samples` latencies are known.
+            min_samples (int): Latencies needed before the percentile is trusted.
+            window (int): Recent latencies kept per kind.
+        """
+        self.percentile = percentile
+        self.budget = budget
+        self.max_tokens = max_tokens
+        self.min_delay = min_delay
+        self.initial_delay = initial_delay
+        self.min_samples = min_samples
+        self.window = window
+        self._latencies: dict[str, deque] = {}
+        self._tokens = max_tokens
+        self.stats = {"requests": 0, "hedged": 0, "hedge_won": 0, "over_budget": 0, "no_slot": 0}
+
+    def record(self, kind: str, latency: float):
+        samples = self._latencies.get(kind)
+        if samples is None:
+            samples = self._latencies[kind] = deque(maxlen=self.window)
+        samples.append(latency)
+
+    def delay(self, kind: str) -> float:
+        samples = self._latencies.get(kind)
+        if samples is None or len(samples) < self.min_samples:
+            return self.initial_delay
+        ordered = sorted(samples)
+        return max(self.min_delay, ordered[min(len(ordered) - 1, int(len(ordered) * self.percentile))])
+
+    def _try_spend(self, acquire: Optional[Callable[[], bool]]) -> bool:
+        if self._tokens < 1:
+            self.stats["over_budget"] += 1
+            return False
+        if acquire is not None and not acquire():
+            self.stats["no_slot"] += 1
+            return False
+        self._tokens -= 1
+        return True
+
+    async def race(
+        self,
+        kind: str,
+        attempt: Callable[[], Awaitable],
+        is_valid: Callable[[object], bool] = lambda result: True,
+        discard: Optional[Callable[[object], Awaitable]] = None,
+        acquire: Optional[Callable[[], bool]] = None,
+        release: Optional[Callable[[], Awaitable]] = None,
+    ):
+        """
+        Run `attempt()`, and a second `attempt()` if the first one is still running after the hedge delay.
+        Returns the first valid result and cancels the other attempt, a result that is not used is passed
+        to `discard` (e.g. to close a stream). When neither result is valid, one of them is returned (or the hedge's error raised).
+        `attempt` has to pick a different host each time it is called.
+        The hedge is only sent if `acquire()` gets it a request slot (e.g. of the scheduler), given back with `release()` once the race is over.
+        """
+        self.stats["requests"] += 1
+        self._tokens = min(self.max_tokens, self._tokens + self.budget)
+        started = time.monotonic()
+        primary = asyncio.ensure_future(attempt())
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.delay(kind))
+            if done or not self._try_spend(acquire):
+                return await primary
+        except BaseException:
+            primary.cancel()
+            raise
+
+        self.stats["hedged"] += 1
+        hedge = asyncio.ensure_future(attempt())
+        attempts = [primary, hedge]
+        pending = set(attempts)
+        winner = None
+        try:
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # The primary first when both finished at once
+                for task in attempts:
+                    if task in done and not task.cancelled() and task.exception() is None and is_valid(task.result()):
+                        winner = task
+                        break
+            if winner is None:
+                # Neither is valid: a result rather than an error, the hedge's if both have one
+                winner = next((task for task in reversed(attempts) if task.exception() is None), hedge)
+            elif winner is hedge:
+                self.stats["hedge_won"] += 1
+            return winner.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+            if primary in pending:
+                # A straggler beaten by its hedge took at least this long, leaving it out would pull the delay down
+                self.record(kind, time.monotonic() - started)
+            if release is not None:
+                await release()
+            if discard is not None:
+                for task in attempts:
+                    if task is not winner and task.done() and not task.cancelled() and task.exception() is None:
+                        await discard(task.result())
@@ -7,18 +7,23 @@ class LAN_LLM(BaseLLM):
     This is a class for user to select the desired LLM and run it on your own Lan-server.
     """
 
-    def __init__(self, model_name: str, host: str):
+    def __init__(self, model_name: str, host: str, **kwargs):
         """
         Initialize the LLM using Ollama based on the name of the model and the ip of the local server.
 
         Args:
             host (str): Ollama server ip address, such as "http://192.168.1.100:10000".
                 - you can test your service by using `curl ip_address` to check if Ollama is running or not.
+            kwargs: Options of `BaseLLM`, such as `cache`, `keep_alive` and `num_ctx`.
         """
 
         self.host = host
         print(f"Start connecting to the host: {host}...")
-        super().__init__(model_name=model_name)
+        super().__init__(model_name=model_name, **kwargs)
 
     def _create_client(self):
-        return ollama.AsyncClient(host=self.host)
\ No newline at end of file
+        return ollama.AsyncClient(host=self.host)
+
+    @property
+    def scheduler_key(self) -> tuple[str, int]:
+        return f"{self.host}/{self.model_name}", 1
\ No newline at end of file
@@ -10,8 +10,12 @@ class Ollama_LLM(BaseLLM):
     More model details can be found in: https://ollama.com.
     """
 
-    def __init__(self, model_name: str):
-        super().__init__(model_name=model_name)
+    def __init__(self, model_name: str, **kwargs):
+        """
+        Args:
+            kwargs: Options of `BaseLLM`, such as `cache`, `keep_alive` and `num_ctx`.
+        """
+        super().__init__(model_name=model_name, **kwargs)
     
     def _create_client(self):
         return ollama.AsyncClient()
\ No newline at end of file
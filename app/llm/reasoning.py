@@ -0,0 +1,143 @@
+from typing import Optional
+from pydantic import BaseModel, Field
+
+from app.utils.json_stream import THINK_OPEN, THINK_CLOSE
+
+
+class ReasoningBudget(BaseModel):
+    """
+    How much a reasoning model (e.g. deepseek-r1, qwen3) may think for one request.
+    """
+
+    think: Optional[bool] = Field(default=None, description="False disables thinking, True enables it, None keeps the model's default.")
+    max_think_tokens: Optional[int] = Field(default=None, description="Cap on the thinking of a streamed reply. Beyond it the request is sent again with thinking disabled.")
+    num_predict: Optional[int] = Field(default=None, description="Cap on all the tokens generated for the reply, thinking included.")
+
+    def without_thinking(self) -> "ReasoningBudget":
+        return self.model_copy(update={"think": False, "max_think_tokens": None})
+
+    def cache_key(self) -> dict:
+        return self.model_dump(exclude_none=True)
+
+
+def estimate_think_tokens(text: str) -> int:
+    # About 4 characters per token, like the memory's estimate
+    return len(text) // 4
+
+
+class ThinkSplitter:
+    """
+    Separates the `<think>...</think>` block at the start of a streamed reply from the answer.
+    Tags split across chunks are handled, and a `<think>` after the answer started is kept as text.
+    """
+
+    def __init__(self):
+        self.in_think = False
+        self.content_started = False
+        self.think_parts: list[str] = []
+        self.content_parts: list[str] = []
+        self._pending = ""
+
+    @property
+    def think(self) -> Optional[str]:
+        return "".join(self.think_parts).strip() or None
+
+    @property
+    def content(self) -> str:
+        return "".join(self.content_parts)
+
+    @property
+    def think_tokens(self) -> int:
+        return estimate_think_tokens("".join(self.think_parts))
+
+    def _emit(self, parts: list, text: str):
+        if not text:
+            return
+        if self.in_think:
+            self.think_parts.append(text)
+            parts.append(("think", text))
+        else:
+            if not self.content_started:
+                # Whitespace between the think block and the answer
+                text = text.lstrip()
+                if not text:
+                    return
+            self.content_started = True
+            self.content_parts.append(text)
+            parts.append(("content", text))
+
+    def feed(self, delta: str) -> list[tuple[str, str]]:
+        """
+        Add a chunk. Returns its ("think" | "content", text) parts.
+        """
+        text = self._pending + delta
+        self._pending = ""
+        parts = []
+        while text:
+            if self.in_think:
+                tag = THINK_CLOSE
+            elif not self.content_started:
+                tag = THINK_OPEN
+            else:
+                self._emit(parts, text)
+                break
+
+            index = text.find(tag)
+            if index >= 0:
+                self._emit(parts, text[:index])
+                text = text[index + len(tag) :]
+                self.in_think = not self.in_think
+                continue
+
+            # Hold back the end of the chunk if it may be the start of the tag
+            keep = next((size for size in range(len(tag) - 1, 0, -1) if text.endswith(tag[:size])), 0)
+            self._emit(parts, text[: len(text) - keep])
+            self._pending = text[len(text) - keep :]
+            break
+        return parts
+
+    def flush(self) -> list[tuple[str, str]]:
+        parts = []
+        self._emit(parts, self._pending)
+        self._pending = ""
+        return parts
+
+
+def split_think(text: str) -> tuple[Optional[str], str]:
+    """
+    Split a complete reply into (think part or None, answer).
+    """
+    splitter = ThinkSplitter()
+    splitter.feed(text)
+    splitter.flush()
+    return splitter.think, splitter.content
+
+
+class ThinkInliner:
+    """
+    Puts thinking that a backend delivers separately (Ollama's `message.thinking`, DeepSeek's
+    `reasoning_content`) back into the text stream as a `<think>` block, so every backend streams the same format.
+    """
+
+    def __init__(self):
+        self.open = False
+
+    def feed(self, thinking: Optional[str], content: Optional[str]) -> str:
+        text = ""
+        if thinking:
+            if not self.open:
+                text += THINK_OPEN
+                self.open = True
+            text += thinking
+        if content:
+            if self.open:
+                text += THINK_CLOSE
+                self.open = False
+            text += content
+        return text
+
+    def close(self) -> str:
+        if self.open:
+            self.open = False
+            return THINK_CLOSE
+        return ""
@@ -0,0 +1,42 @@
+from typing import Type
+
+from app.llm.base import BaseLLM
+from app.utils.lazy_import import import_object
+
+# Backends are referenced by import path, so only the selected backend (and its SDK, such as
+# `ollama` or `openai`) is imported
+LLM_BACKENDS = {
+    "ollama": "app.llm.ollama_llm:Ollama_LLM",
+    "lan": "app.llm.lan_llm:LAN_LLM",
+    "api": "app.llm.api_llm:API_LLM",
+    "router": "app.llm.router_llm:Router_LLM",
+    "cascade": "app.llm.cascade_llm:Cascade_LLM",
+    "scripted": "app.llm.scripted_llm:Scripted_LLM",
+}
+
+
+def register_llm(name: str, path: str):
+    """
+    Register a backend under `name`, such as `register_llm("my_llm", "my_package.my_llm:My_LLM")`.
+    """
+    LLM_BACKENDS[name] = path
+
+
+def get_llm_class(name: str) -> Type[BaseLLM]:
+    if name not in LLM_BACKENDS:
+        raise KeyError(f"Unknown LLM backend '{name}', choose from: {', '.join(LLM_BACKENDS)}.")
+    return import_object(LLM_BACKENDS[name])
+
+
+def build_llm(name: str, model_name: str, **kwargs) -> BaseLLM:
+    """
+    Create an LLM of the named backend without contacting the server, see `app.agent.warmup` for that.
+    """
+    return get_llm_class(name)(model_name=model_name, **kwargs)
+
+
+async def create_llm(name: str, model_name: str, **kwargs) -> BaseLLM:
+    """
+    Create an LLM of the named backend and check that its model is available.
+    """
+    return await get_llm_class(name).create(model_name=model_name, **kwargs)
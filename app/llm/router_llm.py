@@ -0,0 +1,427 @@
+import time
+import asyncio
+from typing import AsyncIterator, Optional, Union
+
+import httpx
+import ollama
+
+from app.llm.reasoning import ReasoningBudget, ThinkInliner
+from app.llm.base import BaseLLM
+from app.llm.hedging import HedgePolicy
+
+
+class HostState:
+    """
+    Balancing and health bookkeeping of one Ollama host.
+    """
+
+    def __init__(self, host: str, client: ollama.AsyncClient):
+        self.host = host
+        self.client = client
+        self.outstanding = 0
+        self.ewma_latency: Optional[float] = None
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.last_error: Optional[str] = None
+        self.requests = 0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def score(self, default_latency: float) -> float:
+        """
+        Expected wait on this host: (outstanding requests + this one) x EWMA latency.
+        """
+        return (self.outstanding + 1) * (self.ewma_latency or default_latency)
+
+    def to_dict(self) -> dict:
+        return {
+            "host": self.host,
+            "outstanding": self.outstanding,
+            "ewma_latency": self.ewma_latency,
+            "failures": self.failures,
+            "ejected": not self.available,
+            "requests": self.requests,
+            "last_error": self.last_error,
+        }
+
+
+class HostPool:
+    """
+    A pool of Ollama hosts sharing one pooled HTTP transport.
+    Picks hosts by least outstanding requests weighted with their EWMA latency, ejects failing hosts
+    with exponential backoff and re-admits them once a health check (or a retry after the backoff) succeeds.
+    """
+
+    def __init__(
+        self,
+        hosts: list[str],
+        max_connections: int = 100,
+        ewma_alpha: float = 0.3,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ):
+        # One transport means one connection pool (keyed by host) for every client
+        self.transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        self.hosts = [HostState(host, ollama.AsyncClient(host=host, transport=self.transport)) for host in hosts]
+        self.ewma_alpha = ewma_alpha
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+    def acquire(self, exclude: tuple = ()) -> Optional[HostState]:
+        """
+        Pick the best host and count the request as outstanding on it.
+        """
+        candidates = [state for state in self.hosts if state not in exclude]
+        if not candidates:
+            return None
+
+        available = [state for state in candidates if state.available]
+        if available:
+            known = [state.ewma_latency for state in self.hosts if state.ewma_latency is not None]
+            default_latency = sum(known) / len(known) if known else 1.0
+            state = min(available, key=lambda state: state.score(default_latency))
+        else:
+            # Every host is ejected, try the one that recovers first rather than failing outright
+            state = min(candidates, key=lambda state: state.ejected_until)
+
+        state.outstanding += 1
+        state.requests += 1
+        return state
+
+    def release(self, state: HostState, latency: Optional[float] = None, error: Optional[BaseException] = None):
+        """
+        Finish a request on a host, recording either its latency or its failure.
+        """
+        state.outstanding -= 1
+        if error is not None:
+            self.mark_failure(state, error)
+        elif latency is not None:
+            self.mark_success(state, latency)
+
+    def mark_success(self, state: HostState, latency: Optional[float] = None):
+        state.failures = 0
+        state.ejected_until = 0.0
+        if latency is not None:
+            if state.ewma_latency is None:
+                state.ewma_latency = latency
+            else:
+                state.ewma_latency = self.ewma_alpha * latency + (1 - self.ewma_alpha) * state.ewma_latency
+
+    def mark_failure(self, state: HostState, error: BaseException):
+        state.failures += 1
+        state.last_error = str(error)
+        backoff = min(self.base_backoff * 2 ** (state.failures - 1), self.max_backoff)
+        state.ejected_until = time.monotonic() + backoff
+        print(f"Host '{state.host}' ejected for {backoff:.1f}s: {error}")
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def is_host_failure(error: BaseException) -> bool:
+    """
+    Connection problems, timeouts, 5xx and missing models are the host's fault, other errors are the request's.
+    """
+    if isinstance(error, ollama.ResponseError):
+        return error.status_code >= 500 or error.status_code == 404
+    return isinstance(error, (ConnectionError, httpx.TransportError, asyncio.TimeoutError))
+
+
+class Router_LLM(BaseLLM):
+    """
+    This is a class that serves one model from a pool of Ollama hosts (e.g. several GPU boxes) behind the `BaseLLM` interface.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        hosts: list[str],
+        max_connections: int = 100,
+        health_interval: float = 10.0,
+        health_timeout: float = 5.0,
+        ewma_alpha: float = 0.3,
+        base_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        hedge: Optional[HedgePolicy] = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            hosts (list[str]): Ollama server addresses, such as ["http://192.168.1.100:11434", "http://192.168.1.101:11434"].
+            max_connections (int): Size of the HTTP connection pool shared by all hosts.
+            health_interval (float): Seconds between two background health checks.
+            health_timeout (float): Timeout of one health check request.
+            ewma_alpha (float): Weight of the newest sample in the latency average.
+            base_backoff (float): Ejection time after the first failure, doubled on each further failure.
+            max_backoff (float): Upper bound of the ejection time.
+            hedge (Optional[HedgePolicy]): Also send a request slower than usual to a second host, the first valid reply wins. None never hedges.
+            kwargs: Options of `BaseLLM`, such as `cache`, `keep_alive` and `num_ctx`.
+        """
+        self.host_addresses = hosts
+        self.max_connections = max_connections
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.ewma_alpha = ewma_alpha
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self._health_task: Optional[asyncio.Task] = None
+        print(f"Start connecting to the hosts: {', '.join(hosts)}...")
+        super().__init__(model_name=model_name, **kwargs)
+
+    def _create_client(self) -> HostPool:
+        return HostPool(
+            self.host_addresses,
+            max_connections=self.max_connections,
+            ewma_alpha=self.ewma_alpha,
+            base_backoff=self.base_backoff,
+            max_backoff=self.max_backoff,
+        )
+
+    @property
+    def stats(self) -> list[dict]:
+        return [state.to_dict() for state in self.client.hosts]
+
+    @property
+    def scheduler_key(self) -> tuple[str, int]:
+        # One queue for the pool, as wide as the hosts not ejected
+        available = sum(state.available for state in self.client.hosts)
+        return f"{','.join(self.host_addresses)}/{self.model_name}", available
+
+    async def _check_model_exists(self):
+        """
+        Run a first health check on every host and start the background checks.
+        Unlike the single-host check, an unavailable host does not stop the process, it is only ejected.
+        """
+        healthy = await self.check_health()
+        if not healthy:
+            raise RuntimeError(f"No host serves the model '{self.model_name}'.")
+        print(f"Found the model '{self.model_name}' on {healthy}/{len(self.client.hosts)} hosts!")
+        self.start_health_checks()
+
+    async def preload(self):
+        """
+        Load the model on every available host at the same time. A host that fails is ejected.
+        """
+        request = {"model": self.model_name, "messages": []}
+        if self.keep_alive is not None:
+            request["keep_alive"] = self.keep_alive
+
+        async def preload_host(state: HostState):
+            try:
+                await state.client.chat(**request)
+            except Exception as e:
+                if is_host_failure(e):
+                    self.client.mark_failure(state, e)
+
+        await asyncio.gather(*(preload_host(state) for state in self.client.hosts if state.available))
+
+    async def _check_host(self, state: HostState) -> bool:
+        try:
+            response = await asyncio.wait_for(state.client.list(), self.health_timeout)
+            server_models = [model["model"] for model in response["models"]]
+            if self.model_name not in server_models:
+                raise ValueError(f"The model '{self.model_name}' is not on the server's list.")
+        except Exception as e:
+            self.client.mark_failure(state, e)
+            return False
+        self.client.mark_success(state)
+        return True
+
+    async def check_health(self) -> int:
+        """
+        Check every host at the same time. Returns the number of healthy hosts.
+        """
+        results = await asyncio.gather(*(self._check_host(state) for state in self.client.hosts))
+        return sum(results)
+
+    def start_health_checks(self):
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.get_running_loop().create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health()
+
+    async def close(self):
+        """
+        Stop the health checks and close the pooled connections.
+        """
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        await self.client.aclose()
+
+    async def _chat(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> tuple:
+        """
+        Send one chat request to the best host, retrying on another host if it fails.
+        With a hedge policy, a request still unanswered after the hedge delay is also sent to another host.
+        """
+        chat_options = self._build_chat_options(messages, format_type, options, reasoning)
+        tried = []
+        if self.hedge is None:
+            return await self._chat_on_hosts(chat_options, tried)
+        # Both attempts share `tried`, so the hedge goes to a host the primary is not on
+        acquire, release = self._hedge_slot()
+        return await self.hedge.race(
+            "chat",
+            lambda: self._chat_on_hosts(chat_options, tried),
+            is_valid=lambda result: result[2] is not None,
+            acquire=acquire,
+            release=release,
+        )
+
+    def _hedge_slot(self) -> tuple:
+        """
+        (acquire, release) of the scheduler slot of a hedge: it is one more request on the hosts, so it is
+        only sent when a slot is free and no other request waits for one.
+        """
+        if self.scheduler is None:
+            return None, None
+        key, hosts = self.scheduler_key
+        return lambda: self.scheduler.try_acquire(key, hosts), lambda: self.scheduler.release(key, hosts)
+
+    async def _chat_on_hosts(self, chat_options: dict, tried: list) -> tuple:
+        last_error = None
+
+        while True:
+            state = self.client.acquire(exclude=tuple(tried))
+            if state is None:
+                break
+            tried.append(state)
+
+            started = time.monotonic()
+            try:
+                response = await state.client.chat(**chat_options)
+            except asyncio.CancelledError:
+                self.client.release(state)
+                raise
+            except Exception as e:
+                last_error = e
+                if not is_host_failure(e):
+                    self.client.release(state)
+                    break
+                self.client.release(state, error=e)
+                continue
+
+            latency = time.monotonic() - started
+            self.client.release(state, latency=latency)
+            if self.hedge is not None:
+                self.hedge.record("chat", latency)
+            return self._parse_response(response)
+
+        error_message = f"Some error occur when interacting: {last_error}"
+        print(error_message)
+        return "", error_message, None
+
+    async def _chat_stream(
+        self,
+        messages: list,
+        format_type: Optional[Union[str, dict]] = None,
+        options: Optional[dict] = None,
+        reasoning: Optional[ReasoningBudget] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream one chat request from the best host. A host that fails before its first chunk is
+        replaced by the next one, after the first chunk errors are raised to the caller.
+        With a hedge policy, a stream without a first chunk after the hedge delay is also opened on
+        another host, the first one to answer is read and the other one closed (which stops its generation).
+        """
+        chat_options = self._build_chat_options(messages, format_type, options, reasoning)
+        chat_options["stream"] = True
+        tried = []
+        if self.hedge is None:
+            state, stream, first_chunk, first_chunk_latency = await self._open_stream(chat_options, tried)
+        else:
+            acquire, release = self._hedge_slot()
+            state, stream, first_chunk, first_chunk_latency = await self.hedge.race(
+                "stream",
+                lambda: self._open_stream(chat_options, tried),
+                discard=self._discard_stream,
+                acquire=acquire,
+                release=release,
+            )
+
+        inliner = ThinkInliner()
+
+        def feed(chunk: dict) -> str:
+            if chunk.get("done"):
+                self._record_usage(chunk)
+            message = chunk["message"]
+            return inliner.feed(message.get("thinking"), message["content"])
+
+        error = None
+        try:
+            if first_chunk is not None:
+                delta = feed(first_chunk)
+                if delta:
+                    yield delta
+                async for chunk in stream:
+                    delta = feed(chunk)
+                    if delta:
+                        yield delta
+            delta = inliner.close()
+            if delta:
+                yield delta
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            await stream.aclose()
+            if error is not None and is_host_failure(error):
+                self.client.release(state, error=error)
+            else:
+                # Balance on the time until the host started answering
+                self.client.release(state, latency=first_chunk_latency)
+
+    async def _open_stream(self, chat_options: dict, tried: list) -> tuple:
+        """
+        Open the stream on the best host and wait for its first chunk, moving on to the next host when one
+        fails before that. Returns (host, stream, first chunk, seconds to the first chunk).
+        """
+        while True:
+            state = self.client.acquire(exclude=tuple(tried))
+            if state is None:
+                raise ConnectionError(f"No host could serve the model '{self.model_name}'.")
+            tried.append(state)
+
+            started = time.monotonic()
+            stream = None
+            try:
+                stream = await state.client.chat(**chat_options)
+                first_chunk = await anext(stream, None)
+            except asyncio.CancelledError:
+                # E.g. the other attempt of a hedged request answered first
+                if stream is not None:
+                    await stream.aclose()
+                self.client.release(state)
+                raise
+            except Exception as e:
+                if stream is not None:
+                    await stream.aclose()
+                if not is_host_failure(e):
+                    self.client.release(state)
+                    raise
+                self.client.release(state, error=e)
+                continue
+
+            latency = time.monotonic() - started
+            if self.hedge is not None:
+                self.hedge.record("stream", latency)
+            return state, stream, first_chunk, latency
+
+    async def _discard_stream(self, opened: tuple):
+        state, stream, _, _ = opened
+        await stream.aclose()
+        self.client.release(state)
@@ -0,0 +1,279 @@
+import time
+import heapq
+import asyncio
+import itertools
+import contextlib
+from collections import deque
+from contextvars import ContextVar
+from typing import Iterator, Optional
+from pydantic import BaseModel, Field
+
+# Run priority classes, a lower class is served first
+INTERACTIVE = 0
+BATCH = 1
+
+# Within a class, states closer to the answer go first: a summary ends its run with one more call
+STATE_PRIORITIES = {"summarizing": 0, "planning": 1}
+
+
+class RequestContext(BaseModel):
+    """
+    Who an LLM request is for. The agent sets it around every state execution, the scheduler of the backend reads it.
+    """
+
+    session_id: Optional[str] = Field(default=None, description="The run the request belongs to, for fairness between runs.")
+    run_priority: int = Field(default=INTERACTIVE, description="Class of the run, such as INTERACTIVE or BATCH.")
+    state_priority: int = Field(default=1, description="Class of the request within its run class, see STATE_PRIORITIES.")
+    progress: int = Field(default=0, description="Steps the run has done, runs further along go first.")
+    deadline: Optional[float] = Field(default=None, description="`time.monotonic()` by which the run has to be done.")
+    shared: bool = Field(default=False, description="The context of a request shared by several callers, see `InflightRequests`. It changes with its callers and never expires, each caller stops waiting at its own deadline.")
+
+
+# The request context of the state currently running in this task
+current_request: ContextVar[Optional[RequestContext]] = ContextVar("current_request", default=None)
+
+
+@contextlib.contextmanager
+def request_context(context: RequestContext) -> Iterator[RequestContext]:
+    token = current_request.set(context)
+    try:
+        yield context
+    finally:
+        current_request.reset(token)
+
+
+def time_left() -> Optional[float]:
+    """
+    Seconds left until the deadline of the current request context (0 once it passed), None without a deadline.
+    """
+    context = current_request.get()
+    if context is None or context.deadline is None:
+        return None
+    return max(0.0, context.deadline - time.monotonic())
+
+
+class DeadlineExceeded(Exception):
+    """
+    A request whose deadline passed while it was waiting for a slot, or for the reply of the server.
+    """
+
+
+class _HostQueue:
+    def __init__(self):
+        self.in_flight = 0
+        self.waiters: list = []
+        self.admitted = 0
+        self.expired = 0
+
+
+class LLMScheduler:
+    """
+    Admission control in front of the LLM servers, shared by every session of an agent.
+
+    Each host runs at most `per_host_concurrency` requests, the others wait in a queue ordered by
+    run class, state class, deadline, run progress and then by how many requests the session already
+    got (so one busy session cannot starve the others), in arrival order otherwise.
+    Cache hits never reach the scheduler. `StatefulAgent.run` waits before starting a run while
+    more than `max_queue` requests are queued, so overload pushes back on the callers instead of piling up.
+    """
+
+    def __init__(self, per_host_concurrency: int = 4, max_queue: Optional[int] = None, wait_samples: int = 1000):
+        """
+        Args:
+            per_host_concurrency (int): Requests one server processes at the same time, e.g. its OLLAMA_NUM_PARALLEL.
+            max_queue (Optional[int]): Queued requests beyond which new runs wait to start. None never holds them back.
+            wait_samples (int): How many recent wait times per class are kept for the metrics.
+        """
+        self.per_host_concurrency = per_host_concurrency
+        self.max_queue = max_queue
+        self._hosts: dict[str, _HostQueue] = {}
+        self._sequence = itertools.count()
+        # Requests granted per session over the whole run, for fairness, dropped by `end_run`
+        self._served: dict[str, int] = {}
+        self._waits: dict[str, deque] = {}
+        self._wait_samples = wait_samples
+        self._room = asyncio.Condition()
+        # Runs waiting in `admit_run` per class
+        self._held: dict[int, int] = {}
+        self.runs_held = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(host.waiters) for host in self._hosts.values())
+
+    def _capacity(self, hosts: int) -> int:
+        return self.per_host_concurrency * max(1, hosts)
+
+    def _order(self, context: RequestContext, sequence: int) -> tuple:
+        return (
+            context.run_priority,
+            context.state_priority,
+            context.deadline if context.deadline is not None else float("inf"),
+            -context.progress,
+            self._served.get(context.session_id, 0),
+            sequence,
+        )
+
+    def requeue(self, context: RequestContext):
+        """
+        Move the queued requests of `context` to their place after the context changed, keeping their arrival order.
+        """
+        for host in self._hosts.values():
+            changed = False
+            for entry in host.waiters:
+                if entry[2] is context:
+                    entry[0] = self._order(context, entry[0][-1])
+                    changed = True
+            if changed:
+                heapq.heapify(host.waiters)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, key: str, hosts: int = 1):
+        """
+        Hold one request slot of `key` (a server, or a pool of `hosts` servers) while the request runs.
+        Yields the seconds spent waiting for it.
+        """
+        context = current_request.get() or RequestContext()
+        host = self._hosts.setdefault(key, _HostQueue())
+        session_id = context.session_id
+        started = time.monotonic()
+        try:
+            if host.in_flight >= self._capacity(hosts) or host.waiters:
+                await self._wait(host, hosts, context)
+            else:
+                host.in_flight += 1
+            waited = time.monotonic() - started
+            host.admitted += 1
+            self._record_wait(context, waited)
+            if session_id is not None:
+                self._served[session_id] = self._served.get(session_id, 0) + 1
+            try:
+                yield waited
+            finally:
+                host.in_flight -= 1
+                self._grant(host, hosts)
+        finally:
+            await self._notify_room()
+
+    def end_run(self, session_id: str):
+        """
+        Forget the requests granted to a run that ended. Called by the agent, a caller setting the
+        request context itself calls it once its session is done.
+        """
+        self._served.pop(session_id, None)
+
+    def try_acquire(self, key: str, hosts: int = 1) -> bool:
+        """
+        Take a request slot of `key` only if one is free and no request is waiting for one, e.g. for
+        the hedged duplicate of a request. Give it back with `release`.
+        """
+        host = self._hosts.setdefault(key, _HostQueue())
+        if host.in_flight >= self._capacity(hosts) or host.waiters:
+            return False
+        host.in_flight += 1
+        host.admitted += 1
+        return True
+
+    async def release(self, key: str, hosts: int = 1):
+        host = self._hosts[key]
+        host.in_flight -= 1
+        self._grant(host, hosts)
+        await self._notify_room()
+
+    async def _wait(self, host: _HostQueue, hosts: int, context: RequestContext):
+        future = asyncio.get_running_loop().create_future()
+        entry = [self._order(context, next(self._sequence)), future, context]
+        heapq.heappush(host.waiters, entry)
+        timeout = None if context.deadline is None or context.shared else max(0.0, context.deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if future.done():
+                # Granted at the deadline, use it
+                return
+            future.cancel()
+            self._drop(host, entry)
+            host.expired += 1
+            raise DeadlineExceeded("The deadline passed while waiting for the LLM server.") from None
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted at the same moment, pass the slot on
+                host.in_flight -= 1
+                self._grant(host, hosts)
+            else:
+                future.cancel()
+                self._drop(host, entry)
+            raise
+
+    @staticmethod
+    def _drop(host: _HostQueue, entry: list):
+        host.waiters.remove(entry)
+        heapq.heapify(host.waiters)
+
+    def _grant(self, host: _HostQueue, hosts: int):
+        while host.waiters and host.in_flight < self._capacity(hosts):
+            _, future, _ = heapq.heappop(host.waiters)
+            if future.done():
+                continue
+            host.in_flight += 1
+            future.set_result(None)
+
+    def _record_wait(self, context: RequestContext, waited: float):
+        name = f"{context.run_priority}.{context.state_priority}"
+        samples = self._waits.get(name)
+        if samples is None:
+            samples = self._waits[name] = deque(maxlen=self._wait_samples)
+        samples.append(waited)
+
+    async def _notify_room(self):
+        if self.max_queue is not None:
+            async with self._room:
+                self._room.notify_all()
+
+    def _has_room(self, priority: int) -> bool:
+        # Runs of a lower class held back go first
+        return self.queue_depth < self.max_queue and not any(
+            count for held_priority, count in self._held.items() if held_priority < priority
+        )
+
+    async def admit_run(self, priority: int = INTERACTIVE):
+        """
+        Wait until the queue is short enough to start another run of class `priority`.
+        """
+        if self.max_queue is None:
+            return
+        async with self._room:
+            if self._has_room(priority):
+                return
+            self.runs_held += 1
+            self._held[priority] = self._held.get(priority, 0) + 1
+            try:
+                await self._room.wait_for(lambda: self._has_room(priority))
+            finally:
+                self._held[priority] -= 1
+                self._room.notify_all()
+
+    def stats(self) -> dict:
+        """
+        Queue depth and in-flight requests per host, and the recent wait times per "run class.state class".
+        """
+        waits = {}
+        for name, samples in self._waits.items():
+            ordered = sorted(samples)
+            waits[name] = {
+                "count": len(ordered),
+                "mean": sum(ordered) / len(ordered),
+                "p50": ordered[len(ordered) // 2],
+                "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+                "max": ordered[-1],
+            }
+        return {
+            "queue_depth": self.queue_depth,
+            "runs_held": self.runs_held,
+            "runs_waiting": sum(self._held.values()),
+            "hosts": {
+                key: {"in_flight": host.in_flight, "queued": len(host.waiters), "admitted": host.admitted, "expired": host.expired}
+                for key, host in self._hosts.items()
+            },
+            "wait": waits,
+        }
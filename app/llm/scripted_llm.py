@@ -0,0 +1,139 @@
+import json
+import time
+import asyncio
+from typing import Optional
+
+from app.llm.base import BaseLLM
+from app.tools.tool_box import is_decision_message
+
+DEFAULT_PLAN = [
+    {"tool_name": "get_todays_weather", "arguments": {"city": "Tokyo"}},
+    {"tool_name": "finish_task", "arguments": {"final_answer": "Tokyo is sunny and 28°C today."}},
+]
+
+
+class ScriptedPolicy:
+    """
+    Decides the reply to a request deterministically from the request itself, so concurrent sessions
+    sharing one backend each get their own consistent script.
+
+    JSON requests (planning) get the next decision of `plan`, picked by how many planner decisions
+    are already in the conversation. Other requests (summarizing) get `summary`.
+    With `think`, replies start with that `<think>` block like a reasoning model's, unless thinking is disabled.
+    """
+
+    def __init__(
+        self,
+        plan: Optional[list[dict]] = None,
+        summary: str = "Tokyo is sunny and 28°C today.",
+        think: Optional[str] = None,
+    ):
+        self.plan = plan or DEFAULT_PLAN
+        self.summary = summary
+        self.think = think
+
+    def __call__(self, messages: list, format_type=None, think: Optional[bool] = None) -> str:
+        if not format_type:
+            reply = self.summary
+        else:
+            step = sum(1 for message in messages if is_decision_message(message))
+            reply = json.dumps(self.plan[min(step, len(self.plan) - 1)], ensure_ascii=False)
+        if self.think and think is not False:
+            reply = f"<think>{self.think}</think>\n{reply}"
+        return reply
+
+
+class ScriptedClient:
+    """
+    An in-process stand-in for `ollama.AsyncClient.chat` with a configurable time to first token and decode rate.
+    Replies have the same shape (and usage fields) as Ollama's.
+    """
+
+    def __init__(self, policy: ScriptedPolicy, first_token_latency: float = 0.0, tokens_per_second: Optional[float] = None):
+        self.policy = policy
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.requests = 0
+
+    @staticmethod
+    def _tokens(text: str) -> list[str]:
+        # About 4 characters per token
+        return [text[index : index + 4] for index in range(0, len(text), 4)] or [""]
+
+    def _usage(self, messages: list, tokens: list, started: float) -> dict:
+        total = time.perf_counter() - started
+        return {
+            "done": True,
+            "prompt_eval_count": sum(len(message.get("content", "")) for message in messages) // 4,
+            "eval_count": len(tokens),
+            "prompt_eval_duration": int(self.first_token_latency * 1e9),
+            "eval_duration": int(max(0.0, total - self.first_token_latency) * 1e9),
+            "total_duration": int(total * 1e9),
+        }
+
+    async def chat(self, model: str, messages: list, stream: bool = False, format=None, think=None, **kwargs):
+        self.requests += 1
+        started = time.perf_counter()
+        tokens = self._tokens(self.policy(messages, format, think))
+        created_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+
+        if not stream:
+            await asyncio.sleep(self.first_token_latency + self._decode_time(len(tokens)))
+            return {
+                "model": model,
+                "created_at": created_at,
+                "message": {"role": "assistant", "content": "".join(tokens)},
+                **self._usage(messages, tokens, started),
+            }
+
+        async def chunks():
+            await asyncio.sleep(self.first_token_latency)
+            for token in tokens:
+                yield {"model": model, "created_at": created_at, "message": {"role": "assistant", "content": token}, "done": False}
+                if self.tokens_per_second:
+                    await asyncio.sleep(1 / self.tokens_per_second)
+            yield {"model": model, "created_at": created_at, "message": {"role": "assistant", "content": ""}, **self._usage(messages, tokens, started)}
+
+        return chunks()
+
+    def _decode_time(self, token_count: int) -> float:
+        return token_count / self.tokens_per_second if self.tokens_per_second else 0.0
+
+    async def list(self):
+        return {"models": [{"model": "scripted"}]}
+
+
+class Scripted_LLM(BaseLLM):
+    """
+    This is a deterministic in-process LLM for tests and benchmarks. It replays scripted planning
+    and summarizing replies, so the framework can be measured without a model server.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "scripted",
+        policy: Optional[ScriptedPolicy] = None,
+        first_token_latency: float = 0.0,
+        tokens_per_second: Optional[float] = None,
+        **kwargs,
+    ):
+        """
+        Args:
+            policy (Optional[ScriptedPolicy]): Decides the replies. Defaults to one weather lookup, then finish.
+            first_token_latency (float): Simulated seconds before the first token (prompt processing).
+            tokens_per_second (Optional[float]): Simulated decode rate. None generates instantly.
+            kwargs: Options of `BaseLLM`, such as `cache`.
+        """
+        self.policy = policy or ScriptedPolicy()
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        super().__init__(model_name=model_name, **kwargs)
+
+    def _create_client(self) -> ScriptedClient:
+        return ScriptedClient(self.policy, self.first_token_latency, self.tokens_per_second)
+
+    async def _check_model_exists(self):
+        return None
+
+    async def preload(self):
+        return None
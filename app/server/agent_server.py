@@ -0,0 +1,270 @@
+import json
+import asyncio
+import contextlib
+from typing import AsyncIterator, Optional
+
+from app.agent.stateful import StatefulAgent
+from app.llm.scheduler import BATCH, INTERACTIVE
+from app.server.http import HTTPError, HTTPRequest, json_response, read_request, response_head
+
+PRIORITIES = {"interactive": INTERACTIVE, "batch": BATCH}
+
+
+def sse_event(event: str, data: str, event_id: Optional[int] = None) -> bytes:
+    # `data` is compact JSON, so it never spans lines
+    prefix = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{prefix}event: {event}\ndata: {data}\n\n".encode("utf-8")
+
+
+def ndjson_event(event: str, data: str) -> bytes:
+    return f'{{"event":"{event}","data":{data}}}\n'.encode("utf-8")
+
+
+class AgentServer:
+    """
+    An asyncio HTTP/1.1 front-end streaming the steps of agent runs, as Server-Sent Events or NDJSON.
+
+    Every request shares the one agent (its LLM clients, toolbox, scheduler and caches), each run gets
+    its own session. The run is pulled by the response: a step is only computed once the previous one
+    was written to the client, so a slow reader slows its own run down instead of buffering its steps,
+    and a client that disconnects has its run cancelled (in-flight LLM requests and tool calls included).
+    At most `max_active_runs` runs stream at once, up to `max_waiting_runs` more wait for a slot and the
+    others are turned away with 503, so an overloaded process answers quickly instead of piling up connections.
+
+    Endpoints:
+        POST /runs       {"request": str, "tenant"?: str, "priority"?: "interactive" | "batch", "run_id"?: str, "timeout"?: seconds}.
+                         Streams "run" ({"run_id"}), "step" and "final" (`AgentStepResult`) events, or "error".
+                         NDJSON with `?format=ndjson` or `Accept: application/x-ndjson`, SSE otherwise.
+        GET  /health     Liveness, with the number of active runs.
+        GET  /stats      Run counters and the scheduler metrics of the agent.
+    """
+
+    def __init__(
+        self,
+        agent: StatefulAgent,
+        max_active_runs: int = 256,
+        max_waiting_runs: int = 1024,
+        max_body: int = 64 * 1024,
+        heartbeat: float = 15.0,
+        idle_timeout: float = 30.0,
+        write_buffer: int = 64 * 1024,
+    ):
+        """
+        Args:
+            agent (StatefulAgent): The agent serving every request.
+            max_active_runs (int): Runs streamed at the same time.
+            max_waiting_runs (int): Runs waiting for a slot, beyond that new runs get 503.
+            max_body (int): Largest request body in bytes.
+            heartbeat (float): Seconds without a step after which an SSE comment keeps the connection alive.
+            idle_timeout (float): Seconds a kept-alive connection may wait for its next request.
+            write_buffer (int): Bytes buffered for a client before the run waits for it to read.
+        """
+        self.agent = agent
+        self.max_active_runs = max_active_runs
+        self.max_waiting_runs = max_waiting_runs
+        self.max_body = max_body
+        self.heartbeat = heartbeat
+        self.idle_timeout = idle_timeout
+        self.write_buffer = write_buffer
+        self._run_slots = asyncio.Semaphore(max_active_runs)
+        self._connections: set[asyncio.Task] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.stats = {"active_runs": 0, "waiting_runs": 0, "runs": 0, "rejected": 0, "disconnected": 0, "failed": 0}
+
+    async def start(
+        self, host: str = "127.0.0.1", port: int = 8000, reuse_port: bool = False, backlog: int = 1024
+    ) -> asyncio.AbstractServer:
+        """
+        Start listening. With `reuse_port`, several worker processes can listen on the same port.
+        `backlog` bounds the connections the kernel accepts before the loop gets to them, bursts beyond it are reset.
+        """
+        self._server = await asyncio.start_server(
+            self._handle_connection, host, port, reuse_port=reuse_port or None, backlog=backlog
+        )
+        return self._server
+
+    async def close(self):
+        """
+        Stop listening and cancel the open connections, with their runs.
+        """
+        if self._server is not None:
+            self._server.close()
+        for task in list(self._connections):
+            task.cancel()
+        await asyncio.gather(*self._connections, return_exceptions=True)
+        if self._server is not None:
+            await self._server.wait_closed()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._connections.add(task)
+        writer.transport.set_write_buffer_limits(high=self.write_buffer)
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await asyncio.wait_for(read_request(reader, self.max_body), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    break
+                except HTTPError as e:
+                    writer.write(json_response(e.status, {"error": e.message}, keep_alive=False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                keep_alive = await self._dispatch(request, reader, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # Closed by `close()`, the task is the connection's own and ends here
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+    async def _dispatch(self, request: HTTPRequest, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        """
+        Answer one request. Returns whether the connection can take another one.
+        """
+        try:
+            if request.path == "/runs" and request.method == "POST":
+                await self._serve_run(request, reader, writer)
+                return False
+            if request.path == "/health" and request.method == "GET":
+                payload = {"status": "ok", "active_runs": self.stats["active_runs"]}
+            elif request.path == "/stats" and request.method == "GET":
+                scheduler = self.agent.scheduler
+                payload = {"runs": self.stats, "scheduler": scheduler.stats() if scheduler is not None else None}
+            elif request.path in ("/runs", "/health", "/stats"):
+                raise HTTPError(405, f"{request.method} is not allowed on {request.path}.")
+            else:
+                raise HTTPError(404, f"No endpoint {request.path}.")
+        except HTTPError as e:
+            writer.write(json_response(e.status, {"error": e.message}, request.keep_alive, e.headers))
+            await writer.drain()
+            return request.keep_alive
+        writer.write(json_response(200, payload, request.keep_alive))
+        await writer.drain()
+        return request.keep_alive
+
+    def _parse_run(self, request: HTTPRequest) -> dict:
+        payload = request.json()
+        user_request = payload.get("request")
+        if not isinstance(user_request, str) or not user_request.strip():
+            raise HTTPError(400, 'The body needs a non-empty "request" string.')
+        priority = payload.get("priority", "interactive")
+        if priority not in PRIORITIES:
+            raise HTTPError(400, f"Unknown priority '{priority}', choose from: {', '.join(PRIORITIES)}.")
+        timeout = payload.get("timeout")
+        if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or timeout <= 0):
+            raise HTTPError(400, 'The "timeout" has to be a positive number of seconds.')
+        return {
+            "user_request": user_request,
+            "tenant": payload.get("tenant"),
+            "priority": PRIORITIES[priority],
+            "run_id": payload.get("run_id"),
+            "timeout": timeout,
+        }
+
+    async def _serve_run(self, request: HTTPRequest, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        run = self._parse_run(request)
+        if self.stats["active_runs"] + self.stats["waiting_runs"] >= self.max_active_runs + self.max_waiting_runs:
+            self.stats["rejected"] += 1
+            raise HTTPError(503, "Too many runs, try again later.", {"Retry-After": "1"})
+        # Counted right away, the next request may be checked before this run's task starts
+        self.stats["waiting_runs"] += 1
+
+        # The client is not expected to send anything else, end of input means it went away
+        disconnected = asyncio.ensure_future(self._wait_disconnect(reader))
+        streaming = asyncio.ensure_future(self._stream_run(request, writer, run))
+        try:
+            await asyncio.wait({disconnected, streaming}, return_when=asyncio.FIRST_COMPLETED)
+            if not streaming.done():
+                self.stats["disconnected"] += 1
+                streaming.cancel()
+            with contextlib.suppress(asyncio.CancelledError, ConnectionError):
+                await streaming
+        finally:
+            disconnected.cancel()
+            streaming.cancel()
+
+    @staticmethod
+    async def _wait_disconnect(reader: asyncio.StreamReader):
+        with contextlib.suppress(ConnectionError):
+            while await reader.read(1024):
+                pass
+
+    async def _stream_run(self, request: HTTPRequest, writer: asyncio.StreamWriter, run: dict):
+        try:
+            await self._run_slots.acquire()
+        finally:
+            self.stats["waiting_runs"] -= 1
+        self.stats["active_runs"] += 1
+        self.stats["runs"] += 1
+        try:
+            ndjson = request.query.get("format") == "ndjson" or "application/x-ndjson" in request.headers.get("accept", "")
+            writer.write(
+                response_head(
+                    200,
+                    {
+                        "Content-Type": "application/x-ndjson" if ndjson else "text/event-stream",
+                        "Cache-Control": "no-cache",
+                        "Connection": "close",
+                        # Tell proxies such as nginx not to buffer the stream
+                        "X-Accel-Buffering": "no",
+                    },
+                )
+            )
+            session = self.agent.create_session(run_id=run["run_id"], tenant=run["tenant"], priority=run["priority"])
+
+            def encode(event: str, data: str, event_id: Optional[int] = None) -> bytes:
+                return ndjson_event(event, data) if ndjson else sse_event(event, data, event_id)
+
+            writer.write(encode("run", json.dumps({"run_id": session.run_id})))
+            await writer.drain()
+            steps = self.agent.run(run["user_request"], session=session, timeout=run["timeout"])
+            index = 0
+            try:
+                async for step in self._with_heartbeat(steps, writer, ndjson):
+                    writer.write(encode("final" if step.is_final else "step", step.model_dump_json(), index))
+                    await writer.drain()
+                    index += 1
+            except (ConnectionError, asyncio.CancelledError):
+                raise
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"Run {session.run_id} failed: {e}")
+                writer.write(encode("error", json.dumps({"error": str(e)})))
+                await writer.drain()
+        finally:
+            self.stats["active_runs"] -= 1
+            self._run_slots.release()
+
+    async def _with_heartbeat(self, steps: AsyncIterator, writer: asyncio.StreamWriter, ndjson: bool) -> AsyncIterator:
+        """
+        The steps of a run. While a step takes longer than `heartbeat`, SSE comments keep idle proxies
+        from closing the connection; a write to a closed connection also ends the run early.
+        """
+        pending = None
+        try:
+            while True:
+                pending = asyncio.ensure_future(anext(steps))
+                while not ndjson:
+                    done, _ = await asyncio.wait({pending}, timeout=self.heartbeat)
+                    if done:
+                        break
+                    writer.write(b": keep-alive\n\n")
+                    await writer.drain()
+                try:
+                    step = await pending
+                except StopAsyncIteration:
+                    return
+                yield step
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
+                with contextlib.suppress(asyncio.CancelledError, Exception):
+                    await pending
+            await steps.aclose()
@@ -0,0 +1,98 @@
+import json
+import asyncio
+from typing import Optional
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+
+class HTTPError(Exception):
+    """
+    An error answered with `status` and a JSON body {"error": message}.
+    """
+
+    def __init__(self, status: int, message: str, headers: Optional[dict] = None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+
+class HTTPRequest:
+    def __init__(self, method: str, target: str, version: str, headers: dict, body: bytes):
+        self.method = method
+        self.version = version
+        self.headers = headers
+        self.body = body
+        url = urlsplit(target)
+        self.path = url.path
+        self.query = dict(parse_qsl(url.query))
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    def json(self) -> dict:
+        try:
+            payload = json.loads(self.body or b"{}")
+        except ValueError as e:
+            raise HTTPError(400, f"The body is not valid JSON: {e}")
+        if not isinstance(payload, dict):
+            raise HTTPError(400, "The body has to be a JSON object.")
+        return payload
+
+
+async def read_request(reader: asyncio.StreamReader, max_body: int) -> Optional[HTTPRequest]:
+    """
+    Read one HTTP/1.1 request. Returns None when the client closed the connection before sending one.
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if not e.partial.strip():
+            return None
+        raise HTTPError(400, "Incomplete request.")
+    except asyncio.LimitOverrunError:
+        raise HTTPError(431, "The request headers are too large.")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ")
+    except ValueError:
+        raise HTTPError(400, "Malformed request line.")
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        raise HTTPError(411, "Send the body with a Content-Length.")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPError(400, "Invalid Content-Length.")
+    if length > max_body:
+        raise HTTPError(413, f"The body is larger than {max_body} bytes.")
+    body = await reader.readexactly(length) if length else b""
+    return HTTPRequest(method.upper(), target, version, headers, body)
+
+
+def response_head(status: int, headers: dict) -> bytes:
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+def json_response(status: int, payload, keep_alive: bool = True, headers: Optional[dict] = None) -> bytes:
+    body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+    head = {
+        "Content-Type": "application/json; charset=utf-8",
+        "Content-Length": str(len(body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+        **(headers or {}),
+    }
+    return response_head(status, head) + body
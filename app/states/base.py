@@ -2,6 +2,8 @@ from typing import Any, Optional
 from abc import ABC, abstractmethod
 from pydantic import BaseModel, Field
 
+from app.prompts.agent import AGENT_SYSTEM_PROMPT
+
 """
 State workflow:
 [Initialize] -> [planning] -> [tool execution] -> [result evaluating] -> (back to planning) -> [finish or fail]
@@ -15,12 +17,12 @@ class AgentState(ABC):
         self.system_prompt = system_prompt
 
     @abstractmethod
-    async def execute(self, agent: 'StatefulAgent', context: dict = None) -> tuple[str, dict]:
+    async def execute(self, session: 'AgentSession', context: dict = None) -> tuple[str, dict]:
         """
         Execute the core logic of the current state.
         
         Args:
-            agent: Current used Agent
+            session: The session of the current run. It exposes the agent's llm and toolbox and the run's own memory.
             context: Data passed from the previous state.
 
         Returns:
@@ -28,6 +30,21 @@ class AgentState(ABC):
         """
         pass
 
+    def build_messages(self, session: 'AgentSession', instruction: Optional[str] = None) -> list:
+        """
+        Assemble the messages sent to the LLM: the shared system prompt, the session memory (with its running summary)
+        and, optionally, a state specific instruction at the very end.
+        All states share the same prefix and memory is append-only, so the server can keep
+        reusing its prompt (KV) cache from one call to the next. For the same reason the tools in the prompt
+        are picked once per run, the ones found later with `search_tools` are only in the memory.
+        """
+        tools_json = session.toolbox.get_llm_tool_definitions_json(session.tool_names)
+        messages = [{"role": "system", "content": AGENT_SYSTEM_PROMPT.format(tools_json=tools_json)}]
+        messages.extend(session.memory.to_messages())
+        if instruction:
+            messages.append({"role": "user", "content": instruction})
+        return messages
+
 class AgentStepResult(BaseModel):
     """
     A standardized container for real-time “reporting” on the status and results of each step in the Agent's execution.
@@ -35,7 +52,11 @@ class AgentStepResult(BaseModel):
     current_state: str = Field(..., description="The state in which the Agent is executing this step.")
     tool_name: Optional[str] = Field(default=None, description="Name of the tool called in this step.")
     tool_input: Optional[dict] = Field(default=None, description="Parameters passed to the tool.")
+    tool_calls: Optional[list[dict]] = Field(default=None, description="All the tool calls of this step when the planner batched several of them.")
     tool_output: Optional[str] = Field(default=None, description="Output returned by the tool after execution.")
+    think: Optional[str] = Field(default=None, description="The reasoning of the LLM behind this step, if it is a reasoning model.")
+    trace: Optional[dict] = Field(default=None, description="Timing of this step: the state span with the spans of its LLM and tool calls.")
+    budget: Optional[dict] = Field(default=None, description="What the run has left after this step: tokens, llm_calls and wall_time (None where unlimited).")
     is_final: bool = Field(default=False, description="Check if it is the final step.")
     final_answer: Optional[str] = Field(default=None, description="If it is the final step, this should be the answer.")
 
@@ -44,7 +65,11 @@ class AgentStepResult(BaseModel):
             return f"✅ [State: {self.current_state}] Final answer: {self.final_answer}"
         
         log = f"🔄 [State: {self.current_state}]"
-        if self.tool_name:
+        if self.tool_calls and len(self.tool_calls) > 1:
+            for tool_call in self.tool_calls:
+                log += f"\n  - Action: tool_to_use: '{tool_call.get('tool_name')}'"
+                log += f"\n  - Input: {tool_call.get('arguments')}"
+        elif self.tool_name:
             log += f"\n  - Action: tool_to_use: '{self.tool_name}'"
             log += f"\n  - Input: {self.tool_input}"
         if self.tool_output:
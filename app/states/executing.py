@@ -1,58 +1,87 @@
+import json
+
 from app.states.base import AgentState
+from app.tools.tool_box import is_decision_message
 
 
 class ToolExecutionState(AgentState):
-    """Tool Execution State: Executes the tool chosen by the PlanningState."""
+    """Tool Execution State: Executes the tool calls chosen by the PlanningState."""
 
     def __init__(self):
         # This state is purely procedural and doesn't need its own system prompt for the LLM.
         super().__init__(name="tool_execution", system_prompt="")
 
     async def execute(
-        self, agent: "StatefulAgent", context: dict = None
+        self, session: "AgentSession", context: dict = None
     ) -> tuple[str, dict]:
         """
-        Executes the tool call passed from the context, records the result,
-        and transitions back to the planning state.
+        Executes the tool calls passed from the context concurrently, records the results
+        in the order of the calls, and transitions back to the planning state.
         """
         print("Entering to [Tool Execution] Status...")
 
-        # 1. Safely get the tool call decision from the context
-        tool_call = context.get("tool_call")
-        if not tool_call or not isinstance(tool_call, dict):
+        # 1. Safely get the tool call decisions from the context
+        tool_calls = context.get("tool_calls")
+        if tool_calls is None and isinstance(context.get("tool_call"), dict):
+            tool_calls = [context["tool_call"]]
+
+        if not tool_calls or not isinstance(tool_calls, list):
             # If no valid tool call is provided, transition to an error state
             return "error", {
                 "error_message": "No valid tool call provided from the planning state."
             }
 
-        tool_name = tool_call.get("tool_name")
-        arguments = tool_call.get("arguments", {})
+        for tool_call in tool_calls:
+            if not isinstance(tool_call, dict) or not tool_call.get("tool_name"):
+                return "error", {
+                    "error_message": "Planning state decided to use a tool but did not provide a name."
+                }
 
-        if not tool_name:
-            return "error", {
-                "error_message": "Planning state decided to use a tool but did not provide a name."
-            }
+        for tool_call in tool_calls:
+            print(
+                f"Executing tool: '{tool_call['tool_name']}' with arguments: {tool_call.get('arguments', {})}"
+            )
 
-        print(f"Executing tool: '{tool_name}' with arguments: {arguments}")
+        # A simple request: a single tool call, in the first decision of the run (the planner recorded
+        # it before this state, and no earlier one is in memory or was folded into its summary)
+        simple_request = (
+            len(tool_calls) == 1
+            and session.memory.summary is None
+            and sum(1 for message in session.memory if is_decision_message(message)) == 1
+        )
 
-        # 2. Call the tool using the agent's toolbox
-        # The toolbox's call method will handle finding and running the tool
-        result = await agent.toolbox.call(tool_name, **arguments)
+        # 2. Call the tools using the agent's toolbox
+        # The toolbox runs them at the same time and keeps the results in call order
+        results = await session.toolbox.call_many(tool_calls)
 
-        print(f"Tool '{tool_name}' executed with result: {result}")
+        # 3. Record the results of the tool execution into the session's memory
+        # This is crucial for the next planning step, as the LLM will see these results.
+        # Entries are appended in the order of the calls, not the order they finished in.
+        # A result identical to an earlier one is only referenced, not repeated.
+        for tool_call, result in zip(tool_calls, results):
+            print(f"Tool '{tool_call['tool_name']}' executed with result: {result}")
+            session.memory.append(
+                {
+                    "role": "assistant",
+                    "content": str(
+                        result
+                    ),  # Convert result to string to ensure it's serializable
+                },
+                dedupe=True,
+            )
+            if tool_call["tool_name"] == "search_tools":
+                if result.error is None and result.result.startswith("["):
+                    # The planner may call the tools it found from now on
+                    session.add_found_tools([tool["function"]["name"] for tool in json.loads(result.result)])
+            elif result.error is None:
+                arguments = json.dumps(tool_call.get("arguments", {}), ensure_ascii=False, sort_keys=True)
+                session.observations.append(f"{tool_call['tool_name']}({arguments}) returned: {result}")
 
-        # 3. Record the result of the tool execution into the agent's memory
-        # This is crucial for the next planning step, as the LLM will see this result.
-        agent.memory.append(
-            {
-                "role": "assistant",
-                "content": str(
-                    result
-                ),  # Convert result to string to ensure it's serializable
-            }
-        )
+        # With the 'tool_result' policy, a single successful tool call answers a simple request directly
+        if session.agent.finish_policy == "tool_result" and simple_request and not results[0].error:
+            return "finished", {"final_answer": str(results[0])}
 
         # 4. Transition back to the planning state to decide the next action
-        # The context can be empty because the new information (the tool result)
-        # is now in the agent's memory, which the PlanningState will read.
+        # The context can be empty because the new information (the tool results)
+        # is now in the session's memory, which the PlanningState will read.
         return "planning", {}
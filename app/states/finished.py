@@ -8,19 +8,33 @@ class FinishedState(AgentState):
         super().__init__(name="finished", system_prompt="")
 
     async def execute(
-        self, agent: "StatefulAgent", context: dict = None
+        self, session: "AgentSession", context: dict = None
     ) -> tuple[str, dict]:
         print("Entering to [Finished] Status...")
         final_answer = context.get("final_answer", "Task is done.")
         return "finished", {"final_answer": final_answer}
 
 
-# class ErrorState(AgentState):
-#     """Error status: handling errors in execution"""
-#     def __init__(self):
-#         super().__init__(name="error", system_prompt="")
+class ErrorState(AgentState):
+    """Error status: handling errors in execution"""
+    def __init__(self):
+        super().__init__(name="error", system_prompt="")
+
+    async def execute(self, session: 'AgentSession', context: dict = None) -> tuple[str, dict]:
+        error_message = (context or {}).get("error_message", "Unknown error occurs")
+        print(f"Entering to [Error] Status: {error_message}")
+        return "finished", {"final_answer": f"任务因错误而终止: {error_message}"}
+
+
+class TimeoutState(AgentState):
+    """Timeout status: the run passed its deadline, answer with what it found so far without another LLM call"""
+    def __init__(self):
+        super().__init__(name="timeout", system_prompt="")
 
-#     async def execute(self, agent: 'StatefulAgent', context: dict = None) -> tuple[str, dict]:
-#         error_message = context.get("error_message", "Unknown error occurs")
-#         print(f"Entering to [Error] Status: {error_message}")
-#         return "finished", {"final_answer": f"任务因错误而终止: {error_message}"}
+    async def execute(self, session: 'AgentSession', context: dict = None) -> tuple[str, dict]:
+        reason = (context or {}).get("error_message", "The run passed its deadline.")
+        print(f"Entering to [Timeout] Status: {reason}")
+        if not session.observations:
+            return "finished", {"final_answer": "The request could not be completed in time."}
+        found = "\n".join(f"- {observation}" for observation in session.observations)
+        return "finished", {"final_answer": f"The request could not be completed in time. What was found so far:\n{found}"}
@@ -1,54 +1,144 @@
 import json
+from typing import Optional
 
 from app.states.base import AgentState
+from app.tools.tool_box import malformed_tool_calls, normalize_tool_calls
+from app.tracing.tracer import current_span
+from app.utils.json_repair import repair_json
+from app.utils.json_stream import IncrementalJSONParser
+from app.prompts.agent import INVALID_JSON_INSTRUCTION
 from app.prompts.planning import PLANNING_SYSTEM_PROMPT
 
 
 class PlanningState(AgentState):
     """Planning status: deciding which tool to use next"""
 
-    def __init__(self):
+    def __init__(self, use_schema: bool = True, max_retries: int = 1):
+        """
+        Args:
+            use_schema (bool): Constrain the reply to the toolbox's tool-call schema (structured output), instead of any JSON.
+            max_retries (int): Extra LLM round trips for a reply that cannot be repaired locally.
+        """
         super().__init__(
             name="planning",
             # system_prompt=PLANNING_SYSTEM_PROMPT
-            system_prompt=(
-                "You are an expert Planning Agent tasked with solving problems efficiently through structured plans, Your goal is to accomplish the user's task. You have the following tools at your disposal: \n"
-                "{tools_json}\n"  # insert all the available tools
-                "Based on the user's request and conversation history, choose the most appropriate tool to execute. If the task is completed, use the 'finish_task' tool to reply with the final answer based on the conversation memory.\n"
-                "Your answer must be a JSON object in the following format. \n"
-                '{{"tool_name": "name of the tool", "arguments": {{"parameter name": "parameter value"}}}}'
-            ),
+            # The planning instructions are the shared system prompt (app.prompts.agent),
+            # so this state adds nothing after the memory.
+            system_prompt="",
         )
+        self.use_schema = use_schema
+        self.max_retries = max_retries
+        # How the replies were parsed, over all the sessions using this state
+        self.parse_stats = {"parsed": 0, "repaired": 0, "retried": 0, "failed": 0}
 
     async def execute(
-        self, agent: "StatefulAgent", context: dict = None
+        self, session: "AgentSession", context: dict = None
     ) -> tuple[str, dict]:
         print("Entering to [Planning] Status...")
 
-        tools_json = json.dumps(
-            agent.toolbox.get_llm_tool_definitions(), indent=2, ensure_ascii=False
-        )
-        formatted_prompt = self.system_prompt.format(tools_json=tools_json)
-
-        # Building messages to LLM
-        messages = [{"role": "system", "content": formatted_prompt}] + agent.memory
+        # Keep the memory within its token budget, then build the messages to LLM
+        await session.memory.compact(session.llm)
+        messages = self.build_messages(session)
 
         # Calling LLM for decision making
-        _, response_json_str, _ = await agent.llm.chat(
-            messages=messages, format_type="json"
-        )
+        tool_call_decision, think = await self._decide(session, messages)
+        if tool_call_decision is None:
+            return "error", {"error_message": "The planner did not return a valid JSON decision.", "think": think}
 
-        tool_call_decision = json.loads(response_json_str)
+        # Recording LLM decisions into memory, the thinking only if asked to (it would be re-sent with every later prompt)
+        decision_message = {"role": "assistant", "content": json.dumps(tool_call_decision)}
+        if think and session.agent.store_think:
+            decision_message["thinking"] = think
+        session.memory.append(decision_message)
 
-        # Recording LLM decisions into memory
-        agent.memory.append(
-            {"role": "assistant", "content": json.dumps(tool_call_decision)}
-        )
+        tool_calls = normalize_tool_calls(tool_call_decision)
+        finish_calls = [call for call in tool_calls if call["tool_name"] == "finish_task"]
+        other_calls = [call for call in tool_calls if call["tool_name"] != "finish_task"]
 
-        tool_name = tool_call_decision.get("tool_name")
-
-        if tool_name == "finish_task":
-            return "summarizing", {}
+        if finish_calls and not other_calls:
+            # The planner already wrote the answer, only summarize when asked to or when it is unusable
+            final_answer = finish_calls[0]["arguments"].get("final_answer")
+            if session.agent.finish_policy != "summarize" and isinstance(final_answer, str) and final_answer.strip():
+                return "finished", {"final_answer": final_answer.strip(), "think": think}
+            return "summarizing", {"think": think}
         else:
-            # Otherwise, transition to the tool execution state
-            return "tool_execution", {"tool_call": tool_call_decision}
+            # Otherwise, transition to the tool execution state.
+            # A `finish_task` batched with other calls is dropped, the planner will
+            # finish on the next step once it has seen their results.
+            return "tool_execution", {"tool_calls": other_calls, "think": think}
+
+    def _format(self, session: "AgentSession"):
+        return session.toolbox.get_planner_schema(session.planner_tools) if self.use_schema else "json"
+
+    def _record_parse(self, outcome: str, fixes: Optional[list] = None):
+        self.parse_stats[outcome] += 1
+        span = current_span.get()
+        if span is not None:
+            span.attributes["parse"] = outcome
+            if fixes:
+                span.attributes["repairs"] = fixes
+
+    async def _decide(self, session: "AgentSession", messages: list) -> tuple[Optional[dict], Optional[str]]:
+        """
+        Get the planner decision and the thinking behind it. A malformed reply is first repaired locally,
+        and only if that fails the LLM is asked again (up to `max_retries` times), as well as for tool calls
+        that cannot be dispatched (see `malformed_tool_calls`). The decision is None if nothing worked.
+        """
+        decision, raw, think = await self._stream_decision(session, messages)
+        if decision is not None and malformed_tool_calls(decision) is None:
+            self._record_parse("parsed")
+            return decision, think
+
+        for attempt in range(self.max_retries + 1):
+            decision, fixes = repair_json(raw)
+            error = "it could not be parsed"
+            if decision is not None:
+                error = malformed_tool_calls(decision)
+                if error is None:
+                    self._record_parse("repaired" if fixes else "parsed", fixes)
+                    return decision, think
+            if attempt == self.max_retries:
+                break
+
+            self._record_parse("retried")
+            print(f"Planner reply is not valid JSON, asking again: {raw[:200]!r}")
+            retry_messages = messages + [
+                {"role": "assistant", "content": raw},
+                {"role": "user", "content": INVALID_JSON_INSTRUCTION.format(error=error)},
+            ]
+            think, raw, _ = await session.llm.chat(
+                messages=retry_messages, format_type=self._format(session), reasoning=session.reasoning
+            )
+            raw = raw or ""
+
+        self._record_parse("failed")
+        return None, think
+
+    async def _stream_decision(
+        self, session: "AgentSession", messages: list
+    ) -> tuple[Optional[dict], str, Optional[str]]:
+        """
+        Stream the LLM reply and return the tool call as soon as its JSON object is complete.
+        The rest of the generation is cancelled by closing the stream.
+        Returns (decision, raw answer, thinking), the decision is None if the answer is not a valid JSON object.
+        """
+        parser = IncrementalJSONParser()
+        think_parts = []
+        stream = session.llm.chat_stream_parts(
+            messages=messages, format_type=self._format(session), reasoning=session.reasoning
+        )
+        try:
+            async for kind, delta in stream:
+                if kind == "think":
+                    think_parts.append(delta)
+                elif parser.feed(delta) is not None:
+                    break
+        except ValueError:
+            # A complete but invalid object, left to the repair
+            pass
+        except Exception as e:
+            print(f"Planner stream failed: {e}")
+        finally:
+            await stream.aclose()
+
+        return parser.result, parser.buffer, "".join(think_parts).strip() or None
@@ -1,6 +1,9 @@
+import pickle
+import functools
+import asyncio
 import traceback
 from abc import ABC, abstractmethod
-from typing import Any, Optional
+from typing import Any, Literal, Optional
 from pydantic import BaseModel, Field
 
 class ToolResult(BaseModel):
@@ -20,6 +23,9 @@ class BaseTool(BaseModel, ABC):
 	name: str = Field(..., description="The unique name of the tool")
 	description: str = Field(..., description="Clear and brief usage description of the tool")
 	parameters: Optional[dict] = None
+	cache_ttl: Optional[float] = Field(default=None, description="Seconds a successful result may be reused by the ToolBox. None disables caching.")
+	cache_key_args: Optional[list[str]] = Field(default=None, description="The arguments that identify a result in the cache. None means all of them.")
+	timeout: Optional[float] = Field(default=None, description="Timeout in seconds for a call of this tool, overrides the toolbox's `call_timeout`.")
 
 	@abstractmethod
 	async def _execute(self, **kwargs) -> Any:
@@ -33,8 +39,11 @@ class BaseTool(BaseModel, ABC):
 		"""
 		A convenient method that allows tool instances to be called directly with built-in unified error handling.
 		"""
+		return await self._guarded(self._execute(**kwargs))
+
+	async def _guarded(self, awaitable) -> ToolResult:
 		try:
-			result = await self._execute(**kwargs)
+			result = await awaitable
 			return ToolResult(result=result)
 		except Exception as e:
 			error_info = f"Tool '{self.name}' failed with error: {e}"
@@ -53,3 +62,79 @@ class BaseTool(BaseModel, ABC):
                 "parameters": self.parameters,
             },
 		}
+
+
+
+def _run_pickled(tool: "BlockingTool", kwargs: dict) -> bytes:
+	"""
+	The entry point of a worker process. The result is pickled here, so a result that cannot be
+	sent back fails with a clear error instead of breaking the pool.
+	"""
+	result = tool._run(**kwargs)
+	try:
+		return pickle.dumps(result)
+	except Exception as e:
+		raise TypeError(f"the result of type {type(result).__name__} cannot be sent back from the worker process: {e}") from None
+
+
+class BlockingTool(BaseTool):
+	"""
+	A tool whose work blocks: synchronous I/O or heavy computation. It implements the synchronous
+	`_run` instead of `_execute`, and the ToolBox runs it in a worker so the event loop stays free
+	for the other sessions.
+
+	With `execution="process"` the tool, its arguments and its result are pickled, so the tool class
+	must be importable by its module path and its fields must be picklable.
+	"""
+	execution: Literal["thread", "process"] = Field(default="thread", description="Where the ToolBox runs the tool: its thread pool (blocking I/O) or its process pool (CPU-bound work).")
+	max_concurrency: Optional[int] = Field(default=None, description="How many calls of this tool may occupy workers at the same time. None means the pool size.")
+
+	@abstractmethod
+	def _run(self, **kwargs) -> Any:
+		"""
+		The blocking core logic of the tool.
+		"""
+		pass
+
+	async def _execute(self, **kwargs) -> Any:
+		# Called without a ToolBox: the default thread pool of the loop
+		return await asyncio.to_thread(self._run, **kwargs)
+
+	async def run_in(self, executor, kwargs: dict, slots: Optional[asyncio.Semaphore] = None) -> ToolResult:
+		"""
+		Run the tool in `executor` with the same error handling as calling it.
+		With `slots`, the call holds one of them until the worker is done with it.
+		"""
+		return await self._guarded(self._submit(executor, kwargs, slots))
+
+	async def _submit(self, executor, kwargs: dict, slots: Optional[asyncio.Semaphore]) -> Any:
+		if self.execution == "process":
+			try:
+				pickle.dumps((self, kwargs))
+			except Exception as e:
+				raise TypeError(f"the arguments cannot be sent to a worker process: {e}") from None
+
+		loop = asyncio.get_running_loop()
+		if slots is not None:
+			await slots.acquire()
+		try:
+			if self.execution == "process":
+				future = executor.submit(_run_pickled, self, kwargs)
+			else:
+				future = executor.submit(functools.partial(self._run, **kwargs))
+		except Exception:
+			if slots is not None:
+				slots.release()
+			raise
+		if slots is not None:
+			# A caller that gives up (timeout, cancellation) cannot stop a worker that already started,
+			# so the slot is only released when the worker is done
+			future.add_done_callback(lambda _: _release_soon(loop, slots))
+
+		result = await asyncio.wrap_future(future)
+		return pickle.loads(result) if self.execution == "process" else result
+
+
+def _release_soon(loop: asyncio.AbstractEventLoop, slots: asyncio.Semaphore):
+	if not loop.is_closed():
+		loop.call_soon_threadsafe(slots.release)
@@ -26,6 +26,9 @@ class GetWeatherTool(BaseTool):
         },
         "required": ["city"],
     }
+    # Today's weather does not change from one call to the next
+    cache_ttl: float = 600.0
+    cache_key_args: list[str] = ["city"]
 
     async def _execute(self, city: str) -> str:
         """
@@ -0,0 +1,104 @@
+import re
+import math
+from collections import Counter
+
+from app.tools.base import BaseTool
+
+WORD = re.compile(r"[a-z0-9]+|[一-鿿]")
+CAMEL_CASE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from i in is it me my of on or s the this that to with you your".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    """
+    Lower-case words without the stopwords, with snake_case and camelCase identifiers split up,
+    and every CJK character as a word of its own.
+    """
+    return [word for word in WORD.findall(CAMEL_CASE.sub(" ", text).lower()) if word not in STOPWORDS]
+
+
+def _schema_text(schema, parts: list):
+    """
+    Collect the parameter names, descriptions and enum values of a JSON schema.
+    """
+    if isinstance(schema, dict):
+        for name, value in schema.get("properties", {}).items():
+            parts.append(name)
+            _schema_text(value, parts)
+        if isinstance(schema.get("description"), str):
+            parts.append(schema["description"])
+        for value in schema.get("enum", []):
+            parts.append(str(value))
+        _schema_text(schema.get("items"), parts)
+
+
+def tool_terms(tool: BaseTool) -> list[str]:
+    # The name counts twice, it is the most telling part of a tool
+    parts = [tool.name, tool.name, tool.description]
+    _schema_text(tool.parameters, parts)
+    return tokenize(" ".join(parts))
+
+
+class ToolIndex:
+    """
+    An in-memory BM25 index over the names, descriptions and parameter docs of tools.
+    Adding or removing a tool only updates that tool's postings, the scores are computed at query time.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # tool name -> term frequencies of its document
+        self._documents: dict[str, Counter] = {}
+        self._lengths: dict[str, int] = {}
+        # term -> the tools whose document contains it
+        self._postings: dict[str, set[str]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add(self, tool: BaseTool):
+        """
+        Index a tool, replacing the document of a tool with the same name.
+        """
+        self.remove(tool.name)
+        terms = Counter(tool_terms(tool))
+        self._documents[tool.name] = terms
+        self._lengths[tool.name] = sum(terms.values())
+        self._total_length += self._lengths[tool.name]
+        for term in terms:
+            self._postings.setdefault(term, set()).add(tool.name)
+
+    def remove(self, tool_name: str):
+        terms = self._documents.pop(tool_name, None)
+        if terms is None:
+            return
+        self._total_length -= self._lengths.pop(tool_name)
+        for term in terms:
+            names = self._postings[term]
+            names.discard(tool_name)
+            if not names:
+                del self._postings[term]
+
+    def search(self, query: str, limit: int) -> list[tuple[str, float]]:
+        """
+        The best matching tools for `query` as (name, score), best first. Tools sharing no term with it are left out.
+        """
+        if not self._documents:
+            return []
+        count = len(self._documents)
+        average_length = self._total_length / count
+        scores: dict[str, float] = {}
+        for term in set(tokenize(query)):
+            names = self._postings.get(term)
+            if not names:
+                continue
+            idf = math.log(1 + (count - len(names) + 0.5) / (len(names) + 0.5))
+            for name in names:
+                frequency = self._documents[name][term]
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[name] / average_length)
+                scores[name] = scores.get(name, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
@@ -0,0 +1,25 @@
+from app.tools.base import BaseTool
+from app.utils.lazy_import import import_object
+
+# Tools are referenced by import path and only imported when an agent asks for them
+TOOLS = {
+    "get_todays_weather": "app.tools.get_weather:GetWeatherTool",
+    "finish_task": "app.tools.finish:FinishTool",
+}
+
+
+def register_tool(name: str, path: str):
+    """
+    Register a tool under `name`, such as `register_tool("search", "my_package.search:SearchTool")`.
+    """
+    TOOLS[name] = path
+
+
+def load_tools(names: list[str]) -> list[BaseTool]:
+    """
+    Instantiate the named tools.
+    """
+    unknown = [name for name in names if name not in TOOLS]
+    if unknown:
+        raise KeyError(f"Unknown tools: {', '.join(unknown)}.")
+    return [import_object(TOOLS[name])() for name in names]
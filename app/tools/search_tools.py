@@ -0,0 +1,39 @@
+import json
+from typing import Any
+from pydantic import Field
+
+from app.tools.base import BaseTool
+
+
+class SearchToolsTool(BaseTool):
+    """
+    Lets the planner look up tools that were left out of its prompt. Enrolled by a ToolBox that
+    only shows the top-k tools of each request.
+    """
+
+    name: str = "search_tools"
+    description: str = (
+        "Find more tools when none of the listed tools can do what is needed. "
+        "Describe the needed capability, the definitions of the best matching tools are returned and those tools can then be called."
+    )
+    parameters: dict = {
+        "type": "object",
+        "properties": {
+            "query": {
+                "type": "string",
+                "description": "What the tool should do, e.g. 'convert a currency' or 'send an email'.",
+            },
+            "limit": {
+                "type": "integer",
+                "description": "How many tools to return, 5 by default.",
+            },
+        },
+        "required": ["query"],
+    }
+    toolbox: Any = Field(default=None, exclude=True, description="The ToolBox whose index is searched.")
+
+    async def _execute(self, query: str, limit: int = 5) -> str:
+        names = self.toolbox.search_tools(query, limit)
+        if not names:
+            return f"No tool matches '{query}'."
+        return json.dumps([self.toolbox.tools[name].to_llm_format() for name in names], ensure_ascii=False)
@@ -1,24 +1,429 @@
-from app.tools.base import BaseTool, ToolResult
+import json
+import time
+import asyncio
+import multiprocessing
+from typing import Optional
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+
+from app.tools.base import BaseTool, BlockingTool, ToolResult
+from app.tools.index import ToolIndex
+from app.tools.search_tools import SearchToolsTool
+from app.llm.scheduler import time_left
+from app.tracing.tracer import current_span, trace_span
+
+
+def normalize_tool_calls(decision: dict) -> list[dict]:
+    """
+    Turn a planner decision into a list of tool calls.
+    Accepts both the single form `{"tool_name": ..., "arguments": {...}}`
+    and the batched form `{"tool_calls": [{"tool_name": ..., "arguments": {...}}, ...]}`.
+    """
+    if not isinstance(decision, dict):
+        return []
+
+    if "tool_calls" in decision:
+        calls = decision.get("tool_calls") or []
+    else:
+        calls = [decision]
+
+    return [
+        {"tool_name": call.get("tool_name"), "arguments": call.get("arguments") or {}}
+        for call in calls
+        if isinstance(call, dict)
+    ]
+
+
+def is_decision_message(message: dict) -> bool:
+    """
+    Whether a memory message is a planner decision, which the planner records as the JSON of its tool calls.
+    """
+    if message.get("role") != "assistant" or not message.get("content", "").startswith("{"):
+        return False
+    try:
+        decision = json.loads(message["content"])
+    except ValueError:
+        return False
+    return isinstance(decision, dict) and ("tool_name" in decision or "tool_calls" in decision)
+
+
+def malformed_tool_calls(decision: dict) -> Optional[str]:
+    """
+    Why the tool calls of a planner decision cannot be dispatched at all: none of them, a name that
+    is not a string or arguments that are not an object. None if they can.
+    """
+    tool_calls = normalize_tool_calls(decision)
+    if not tool_calls:
+        return "it contains no tool call"
+    for call in tool_calls:
+        if not isinstance(call["tool_name"], str) or not call["tool_name"]:
+            return "a tool call has no tool name"
+        if not isinstance(call["arguments"], dict):
+            return f"the arguments of '{call['tool_name']}' are not an object"
+    return None
+
+
+JSON_SCHEMA_TYPES = {
+    "string": str,
+    "number": (int, float),
+    "integer": int,
+    "boolean": bool,
+    "object": dict,
+    "array": list,
+}
+
 
 class ToolBox:
-    def __init__(self, tools: list[BaseTool]):
+    def __init__(
+        self,
+        tools: list[BaseTool],
+        max_concurrency: Optional[int] = None,
+        call_timeout: Optional[float] = None,
+        max_cache_entries: int = 1024,
+        thread_workers: int = 8,
+        process_workers: int = 2,
+        tool_top_k: Optional[int] = None,
+        pinned_tools: tuple[str, ...] = ("finish_task",),
+    ):
+        """
+        Args:
+            tools (list[BaseTool]): The tools that the agent can use.
+            max_concurrency (Optional[int]): How many tool calls of this toolbox may run at the same time. None means unlimited.
+            call_timeout (Optional[float]): Timeout in seconds for each tool call. None means no timeout.
+                A call made by a run with a deadline never gets longer than the run has left.
+            max_cache_entries (int): Size of the result cache of the tools that declare a `cache_ttl`.
+            thread_workers (int): Size of the thread pool shared by the blocking tools with `execution="thread"`.
+            process_workers (int): Size of the process pool shared by the blocking tools with `execution="process"`.
+            tool_top_k (Optional[int]): Show the planner only the k tools that best match the request (plus the pinned ones
+                and `search_tools` to find the others). None shows every tool.
+            pinned_tools (tuple[str, ...]): Tools shown with every request when `tool_top_k` is set.
+        """
         self.tools = {tool.name: tool for tool in tools}
+        self.tool_top_k = tool_top_k
+        self.pinned_tools = pinned_tools
+        if tool_top_k is not None and "search_tools" not in self.tools:
+            self.tools["search_tools"] = SearchToolsTool(toolbox=self)
+        # Bumped on every change of the tool set, invalidates the serialized definitions
+        self.version = 0
+        # (version, tool names or None for all) -> serialized definitions / planner schema
+        self._definitions_json: OrderedDict = OrderedDict()
+        self._planner_schemas: OrderedDict = OrderedDict()
+        self.index = ToolIndex()
+        for tool in self.tools.values():
+            self.index.add(tool)
+        self.max_concurrency = max_concurrency
+        self.call_timeout = call_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        self.max_cache_entries = max_cache_entries
+        # key -> (expires at, result), in least recently used order
+        self._result_cache: OrderedDict = OrderedDict()
+        # key -> the running execution that identical calls wait for
+        self._inflight: dict[str, asyncio.Task] = {}
+        # running execution -> how many callers still wait for it
+        self._waiters: dict[asyncio.Task, int] = {}
+        self.cache_stats = {"hits": 0, "misses": 0, "coalesced": 0}
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        # Created on the first call that needs them, shared by all the sessions of the agent
+        self._executors: dict[str, Executor] = {}
+        # tool name -> the slots of a blocking tool with a `max_concurrency`
+        self._tool_slots: dict[str, asyncio.Semaphore] = {}
         print("The tools:", end=' ')
-        for tool in tools:
+        for tool in self.tools.values():
             print("'" + tool.name + "'", end=', ')
         print("has been enrolled.")
     
-    def get_llm_tool_definitions(self) -> list[dict]:
+    def get_llm_tool_definitions(self, names: Optional[list[str]] = None) -> list[dict]:
+        """
+        Generate a tool list that llm can understand, of the named tools or of all of them
+        """
+        if names is None:
+            return [tool.to_llm_format() for tool in self.tools.values()]
+        return [self.tools[name].to_llm_format() for name in names if name in self.tools]
+
+    def get_llm_tool_definitions_json(self, names: Optional[list[str]] = None) -> str:
+        """
+        The tool definitions serialized for the prompt. Serialized once per toolbox version and tool selection,
+        so every prompt gets the exact same bytes until the tool set changes.
+        """
+        return self._memoized(
+            self._definitions_json,
+            names,
+            lambda: json.dumps(self.get_llm_tool_definitions(names), indent=2, ensure_ascii=False),
+        )
+
+    def get_planner_schema(self, names: Optional[list[str]] = None) -> dict:
+        """
+        JSON schema of a planner decision (one tool call, or a batch of them) restricted to the
+        enrolled tools (or the named ones) and their parameters. Backends pass it to their structured-output mode,
+        so the model can only produce valid tool calls. Built once per toolbox version and tool selection.
+        """
+        return self._memoized(self._planner_schemas, names, lambda: self._build_planner_schema(names))
+
+    def _build_planner_schema(self, names: Optional[list[str]]) -> dict:
+        tools = self.tools.values() if names is None else [self.tools[name] for name in names if name in self.tools]
+        calls = [
+            {
+                "type": "object",
+                "properties": {
+                    "tool_name": {"type": "string", "enum": [tool.name]},
+                    "arguments": tool.parameters or {"type": "object"},
+                },
+                "required": ["tool_name", "arguments"],
+            }
+            for tool in tools
+        ]
+        batch = {
+            "type": "object",
+            "properties": {"tool_calls": {"type": "array", "items": {"anyOf": calls}, "minItems": 1}},
+            "required": ["tool_calls"],
+        }
+        return {"type": "object", "anyOf": [*calls, batch]}
+
+    def _memoized(self, cache: OrderedDict, names: Optional[list[str]], build):
+        key = (self.version, None if names is None else tuple(names))
+        value = cache.get(key)
+        if value is None:
+            value = cache[key] = build()
+            # A handful of selections are shared by many sessions, keep the recent ones
+            while len(cache) > 128:
+                cache.popitem(last=False)
+        else:
+            cache.move_to_end(key)
+        return value
+
+    def select_tools(self, query: str) -> Optional[list[str]]:
+        """
+        The tools to show the planner for a request: the pinned tools, `search_tools` and the `tool_top_k`
+        best matches of the index, in enrollment order so equal selections serialize to equal prompts.
+        None when the toolbox shows every tool.
+        """
+        if self.tool_top_k is None:
+            return None
+        selected = {name for name in (*self.pinned_tools, "search_tools") if name in self.tools}
+        selected.update(self.search_tools(query, self.tool_top_k))
+        return [name for name in self.tools if name in selected]
+
+    def search_tools(self, query: str, limit: int) -> list[str]:
+        """
+        The names of the best matching tools, best first. The tool search itself and the pinned tools are left out.
+        """
+        excluded = {"search_tools", *self.pinned_tools}
+        matches = self.index.search(query, limit + len(excluded))
+        return [name for name, _ in matches if name not in excluded][:limit]
+
+    def validate_tool_calls(self, decision: dict) -> Optional[str]:
+        """
+        Check a planner decision against the enrolled tools: known names, an arguments object,
+        the required parameters and their basic JSON types.
+        Returns None if the decision is valid, otherwise the reason it is not.
+        """
+        tool_calls = normalize_tool_calls(decision)
+        if not tool_calls:
+            return "The decision contains no tool call."
+
+        for call in tool_calls:
+            tool = self.tools.get(call["tool_name"])
+            if tool is None:
+                return f"Unknown tool '{call['tool_name']}'."
+            if not isinstance(call["arguments"], dict):
+                return f"The arguments of '{tool.name}' must be an object."
+
+            schema = tool.parameters or {}
+            for name in schema.get("required", []):
+                if name not in call["arguments"]:
+                    return f"Missing required argument '{name}' for '{tool.name}'."
+            for name, value in call["arguments"].items():
+                expected = JSON_SCHEMA_TYPES.get(schema.get("properties", {}).get(name, {}).get("type"))
+                if expected is not None and not isinstance(value, expected):
+                    return f"Argument '{name}' of '{tool.name}' has the wrong type."
+        return None
+
+    def add_tool(self, tool: BaseTool):
         """
-        Generate a tool list that llm can understand
+        Enroll a new tool (or replace the one with the same name).
+        """
+        self.tools[tool.name] = tool
+        self.index.add(tool)
+        self.version += 1
+
+    def remove_tool(self, tool_name: str):
         """
-        return [tool.to_llm_format() for tool in self.tools.values()]
+        Remove a tool by name.
+        """
+        if self.tools.pop(tool_name, None) is not None:
+            self.index.remove(tool_name)
+            self.version += 1
     
     async def call(self, tool_name: str, **kwargs) -> ToolResult:
         """
         Calling tools by name
         """
+        with trace_span("tool", tool_name):
+            return await self._call(tool_name, kwargs)
+
+    async def _call(self, tool_name: str, kwargs: dict) -> ToolResult:
         if tool_name not in self.tools:
             return ToolResult(error=f"Tool {tool_name} does not exist.")
         tool_to_call = self.tools[tool_name]
-        return await tool_to_call(**kwargs)
+        if tool_to_call.cache_ttl is None:
+            return await self._execute(tool_to_call, kwargs)
+        return await self._call_cached(tool_to_call, kwargs)
+
+    def _executor(self, execution: str) -> Executor:
+        executor = self._executors.get(execution)
+        if executor is None:
+            if execution == "process":
+                # Spawned workers do not inherit the threads and the event loop of this process
+                executor = ProcessPoolExecutor(
+                    self.process_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                executor = ThreadPoolExecutor(self.thread_workers, thread_name_prefix="tool")
+            self._executors[execution] = executor
+        return executor
+
+    async def _execute(self, tool: BaseTool, kwargs: dict) -> ToolResult:
+        """
+        Run a tool where it declares: on the event loop, or in the thread or process pool.
+        """
+        if not isinstance(tool, BlockingTool):
+            return await tool(**kwargs)
+        slots = None
+        if tool.max_concurrency is not None:
+            slots = self._tool_slots.get(tool.name)
+            if slots is None:
+                slots = self._tool_slots[tool.name] = asyncio.Semaphore(tool.max_concurrency)
+        return await tool.run_in(self._executor(tool.execution), kwargs, slots)
+
+    def start_workers(self):
+        """
+        Start the process pool of the process tools now rather than on their first call.
+        Blocking, spawning the workers takes a while.
+        """
+        if any(isinstance(tool, BlockingTool) and tool.execution == "process" for tool in self.tools.values()):
+            executor = self._executor("process")
+            # Every worker picks up one no-op
+            for future in [executor.submit(int) for _ in range(self.process_workers)]:
+                future.result()
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the worker pools. Queued calls are dropped.
+        """
+        for executor in self._executors.values():
+            executor.shutdown(wait=wait, cancel_futures=True)
+        self._executors.clear()
+
+    def _cache_key(self, tool: BaseTool, kwargs: dict) -> str:
+        key_args = tool.cache_key_args if tool.cache_key_args is not None else sorted(kwargs)
+        return json.dumps(
+            [tool.name, {name: kwargs.get(name) for name in key_args}],
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str,
+        )
+
+    async def _call_cached(self, tool: BaseTool, kwargs: dict) -> ToolResult:
+        """
+        Serve a cacheable tool: reuse a fresh cached result, or join an identical call that is
+        already running (single-flight), or run the tool and cache a successful result.
+        """
+        key = self._cache_key(tool, kwargs)
+        span = current_span.get()
+
+        cached = self._result_cache.get(key)
+        if cached is not None:
+            expires_at, result = cached
+            if expires_at > time.monotonic():
+                self._result_cache.move_to_end(key)
+                self.cache_stats["hits"] += 1
+                if span is not None:
+                    span.attributes["cache"] = "hit"
+                return result
+            del self._result_cache[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.cache_stats["misses"] += 1
+            outcome = "miss"
+            task = asyncio.get_running_loop().create_task(self._run_and_cache(key, tool, kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.cache_stats["coalesced"] += 1
+            outcome = "coalesced"
+        if span is not None:
+            span.attributes["cache"] = outcome
+
+        # A cancelled caller must not cancel the execution the other callers are waiting for,
+        # but once none of them is left it is cancelled too rather than holding its worker
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    task.cancel()
+                    # Right away, an identical call arriving before the task ends must start a new one
+                    if self._inflight.get(key) is task:
+                        del self._inflight[key]
+
+    async def _run_and_cache(self, key: str, tool: BaseTool, kwargs: dict) -> ToolResult:
+        result = await self._execute(tool, kwargs)
+        if result.error is None:
+            self._result_cache[key] = (time.monotonic() + tool.cache_ttl, result)
+            self._result_cache.move_to_end(key)
+            while len(self._result_cache) > self.max_cache_entries:
+                self._result_cache.popitem(last=False)
+        return result
+
+    async def _call_limited(self, tool_name: str, arguments: dict) -> ToolResult:
+        """
+        Call one tool under the toolbox concurrency limit and the per-call timeout.
+        """
+        # The calls come straight from the planner's JSON, a malformed one is an error the planner sees
+        if not isinstance(tool_name, str) or tool_name not in self.tools:
+            return ToolResult(error=f"Tool {tool_name} does not exist.")
+        if not isinstance(arguments, dict):
+            return ToolResult(error=f"The arguments of '{tool_name}' must be an object.")
+        with trace_span("tool", tool_name) as span:
+            if self._semaphore is None:
+                return await self._call_with_timeout(tool_name, arguments)
+            async with self._semaphore:
+                # Time spent waiting for a free slot of the toolbox
+                span.queue_delay = span.elapsed()
+                return await self._call_with_timeout(tool_name, arguments)
+
+    async def _call_with_timeout(self, tool_name: str, arguments: dict) -> ToolResult:
+        tool = self.tools.get(tool_name)
+        timeout = tool.timeout if tool is not None and tool.timeout is not None else self.call_timeout
+        # Never longer than the run calling the tool has left
+        left = time_left()
+        at_deadline = left is not None and (timeout is None or left < timeout)
+        if at_deadline:
+            timeout = left
+        try:
+            # A timed out or cancelled blocking tool leaves the queue of its pool, but a worker
+            # that already started it cannot be interrupted: it runs to the end and the result is dropped
+            return await asyncio.wait_for(self._call(tool_name, arguments), timeout=timeout)
+        except asyncio.TimeoutError:
+            if at_deadline:
+                return ToolResult(error=f"Tool '{tool_name}' was stopped at the deadline of the run.")
+            return ToolResult(
+                error=f"Tool '{tool_name}' timed out after {timeout} seconds."
+            )
+
+    async def call_many(self, tool_calls: list[dict]) -> list[ToolResult]:
+        """
+        Run several independent tool calls at the same time.
+        The results are returned in the same order as `tool_calls`.
+        """
+        return await asyncio.gather(
+            *(
+                self._call_limited(call["tool_name"], call.get("arguments") or {})
+                for call in tool_calls
+            )
+        )
@@ -0,0 +1,70 @@
+import json
+import math
+from collections import defaultdict, deque
+from typing import Optional
+
+from app.tracing.tracer import Span
+
+METRICS = ("wall_time", "ttft", "queue_delay", "prompt_tokens", "eval_tokens")
+
+
+class JSONLExporter:
+    """
+    Appends every finished span as one JSON line (without its children, they are exported on their own).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, span: Span):
+        self._file.write(json.dumps(span.to_dict(with_children=False), ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def percentile(sorted_values: list, fraction: float) -> Optional[float]:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class InMemoryAggregator:
+    """
+    Keeps the latest samples of every metric per span kind and name, and reports count/mean/p50/p95/p99.
+    """
+
+    def __init__(self, max_samples: int = 10_000):
+        self.max_samples = max_samples
+        self._samples = defaultdict(lambda: defaultdict(lambda: deque(maxlen=self.max_samples)))
+
+    def export(self, span: Span):
+        samples = self._samples[f"{span.kind}:{span.name}"]
+        for metric in METRICS:
+            value = getattr(span, metric)
+            if value is not None:
+                samples[metric].append(value)
+
+    def summary(self) -> dict:
+        report = {}
+        for key, samples in self._samples.items():
+            report[key] = {}
+            for metric, values in samples.items():
+                ordered = sorted(values)
+                report[key][metric] = {
+                    "count": len(ordered),
+                    "mean": sum(ordered) / len(ordered),
+                    "p50": percentile(ordered, 0.50),
+                    "p95": percentile(ordered, 0.95),
+                    "p99": percentile(ordered, 0.99),
+                }
+        return report
+
+    def reset(self):
+        self._samples.clear()
@@ -0,0 +1,130 @@
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional
+from pydantic import BaseModel, Field, PrivateAttr
+
+# The span of the operation currently running in this task (state, LLM call or tool call).
+# LLM backends and the toolbox attach their spans to it without it being passed around.
+current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span(BaseModel):
+    """
+    Timing and usage record of one operation: a run, a state execution, an LLM call or a tool call.
+    All durations are in seconds.
+    """
+
+    span_id: str = Field(default_factory=lambda: uuid.uuid4().hex[:16], description="Unique id of the span.")
+    parent_id: Optional[str] = Field(default=None, description="Id of the enclosing span.")
+    run_id: Optional[str] = Field(default=None, description="The agent run this span belongs to.")
+    kind: str = Field(..., description="One of 'run', 'state', 'llm' or 'tool'.")
+    name: str = Field(..., description="State name, model name or tool name.")
+    start_time: float = Field(default_factory=time.time, description="Unix timestamp of the start.")
+    wall_time: Optional[float] = Field(default=None, description="Total time as seen by the caller.")
+    ttft: Optional[float] = Field(default=None, description="Time to the first token of an LLM reply.")
+    queue_delay: Optional[float] = Field(default=None, description="Time spent waiting before the work started.")
+    server_time: Optional[float] = Field(default=None, description="Processing time reported by the LLM server.")
+    prompt_tokens: Optional[int] = Field(default=None, description="Tokens of the prompt processed by the LLM.")
+    eval_tokens: Optional[int] = Field(default=None, description="Tokens generated by the LLM.")
+    prompt_eval_duration: Optional[float] = Field(default=None, description="Time the LLM spent on the prompt.")
+    eval_duration: Optional[float] = Field(default=None, description="Time the LLM spent generating.")
+    attributes: dict = Field(default_factory=dict, description="Free-form details, such as cache hits.")
+    error: Optional[str] = Field(default=None, description="The error that ended the operation, if any.")
+    children: list["Span"] = Field(default_factory=list, description="Spans of the operations inside this one.")
+
+    _started: float = PrivateAttr(default_factory=time.perf_counter)
+    _tracer: Optional["Tracer"] = PrivateAttr(default=None)
+    _parent: Optional["Span"] = PrivateAttr(default=None)
+
+    def finish(self, error: Optional[BaseException] = None):
+        """
+        Close the span, attach it to its parent and hand it to the exporters.
+        """
+        self.wall_time = time.perf_counter() - self._started
+        if error is not None:
+            self.error = repr(error)
+        if self.server_time is not None and self.queue_delay is None:
+            # Whatever the server did not account for was spent in queues and on the network
+            self.queue_delay = max(0.0, self.wall_time - self.server_time)
+        if self._parent is not None:
+            self._parent.children.append(self)
+        if self._tracer is not None:
+            self._tracer.export(self)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._started
+
+    def to_dict(self, with_children: bool = True) -> dict:
+        return self.model_dump(exclude=None if with_children else {"children"})
+
+
+class Tracer:
+    """
+    Creates spans and passes every finished span to the exporters.
+    """
+
+    def __init__(self, exporters: Optional[list] = None):
+        """
+        Args:
+            exporters (Optional[list]): Objects with an `export(span)` method, such as `JSONLExporter` or `InMemoryAggregator`.
+        """
+        self.exporters = exporters or []
+
+    def export(self, span: Span):
+        for exporter in self.exporters:
+            exporter.export(span)
+
+    def start_span(self, kind: str, name: str, parent: Optional[Span] = None, **attributes: Any) -> Span:
+        return start_span(kind, name, parent=parent, tracer=self, **attributes)
+
+    def span(self, kind: str, name: str, parent: Optional[Span] = None, **attributes: Any):
+        return trace_span(kind, name, parent=parent, tracer=self, **attributes)
+
+
+def start_span(
+    kind: str,
+    name: str,
+    parent: Optional[Span] = None,
+    tracer: Optional[Tracer] = None,
+    **attributes: Any,
+) -> Span:
+    """
+    Start a span under `parent` (default: the current span). It inherits the parent's run and tracer.
+    """
+    parent = parent if parent is not None else current_span.get()
+    span = Span(
+        kind=kind,
+        name=name,
+        parent_id=parent.span_id if parent is not None else None,
+        run_id=parent.run_id if parent is not None else None,
+        attributes=attributes,
+    )
+    span._parent = parent
+    span._tracer = tracer if tracer is not None else (parent._tracer if parent is not None else None)
+    return span
+
+
+@contextmanager
+def trace_span(
+    kind: str,
+    name: str,
+    parent: Optional[Span] = None,
+    tracer: Optional[Tracer] = None,
+    **attributes: Any,
+) -> Iterator[Span]:
+    """
+    Run a block inside a span, which is the current span for everything called from the block.
+    """
+    span = start_span(kind, name, parent=parent, tracer=tracer, **attributes)
+    token = current_span.set(span)
+    error = None
+    try:
+        yield span
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        current_span.reset(token)
+        span.finish(error)
@@ -0,0 +1,90 @@
+import re
+import json
+from typing import Optional
+
+from app.utils.json_stream import THINK_OPEN, THINK_CLOSE, IncrementalJSONParser
+
+THINK_BLOCK = re.compile(f"{re.escape(THINK_OPEN)}.*?({re.escape(THINK_CLOSE)}|$)", re.DOTALL)
+CODE_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+
+
+def strip_reasoning(text: str) -> str:
+    """
+    Remove `<think>...</think>` blocks (an unterminated one runs to the end) and unwrap a ```json code fence.
+    """
+    text = THINK_BLOCK.sub("", text)
+    fenced = CODE_FENCE.search(text)
+    return fenced.group(1) if fenced else text
+
+
+def extract_first_object(text: str) -> Optional[str]:
+    """
+    The first balanced `{...}` in the text, ignoring braces inside strings. None if there is none.
+    """
+    parser = IncrementalJSONParser()
+    try:
+        parser.feed(text)
+    except ValueError:
+        # Balanced but not valid JSON, `parser.raw` still holds it
+        pass
+    return parser.raw
+
+
+def remove_trailing_commas(text: str) -> str:
+    """
+    Drop the commas right before a closing `}` or `]`, outside of strings.
+    """
+    result = []
+    in_string = escape = False
+    for index, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == ",":
+            rest = text[index + 1 :].lstrip()
+            if rest[:1] in ("}", "]"):
+                continue
+        result.append(char)
+    return "".join(result)
+
+
+def repair_json(text: str) -> tuple[Optional[dict], list[str]]:
+    """
+    Parse the JSON object of an LLM reply, fixing the usual defects locally.
+    Returns (the object or None if it cannot be repaired, the fixes that were needed).
+    """
+    fixes = []
+    try:
+        result = json.loads(text)
+        if isinstance(result, dict):
+            return result, fixes
+    except ValueError:
+        pass
+
+    stripped = strip_reasoning(text)
+    if stripped != text:
+        fixes.append("strip_reasoning")
+
+    candidate = extract_first_object(stripped)
+    if candidate is None:
+        return None, fixes
+    if candidate != stripped.strip():
+        fixes.append("extract_object")
+
+    try:
+        return json.loads(candidate), fixes
+    except ValueError:
+        pass
+
+    candidate = remove_trailing_commas(candidate)
+    fixes.append("trailing_commas")
+    try:
+        return json.loads(candidate), fixes
+    except ValueError:
+        return None, fixes
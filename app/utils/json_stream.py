@@ -0,0 +1,92 @@
+import json
+from typing import Optional
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+class IncrementalJSONParser:
+    """
+    Consumes a streamed LLM reply chunk by chunk and reports the first top-level JSON object
+    as soon as it is syntactically complete, so the caller can stop the generation early.
+
+    Text before the object (including a leading `<think>...</think>` block) is skipped.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._in_think = False
+        self.result: Optional[dict] = None
+        self.raw: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.result is not None
+
+    def feed(self, delta: str) -> Optional[dict]:
+        """
+        Append a chunk of text. Returns the parsed object once it is complete, otherwise None.
+        """
+        if self.raw is not None:
+            return self.result
+
+        self.buffer += delta
+        text = self.buffer
+
+        while self._pos < len(text):
+            if self._start is None:
+                if self._in_think:
+                    end = text.find(THINK_CLOSE, self._pos)
+                    if end == -1:
+                        # Keep the tail in case the closing tag is split between chunks
+                        self._pos = max(self._pos, len(text) - len(THINK_CLOSE) + 1)
+                        return None
+                    self._pos = end + len(THINK_CLOSE)
+                    self._in_think = False
+                    continue
+
+                char = text[self._pos]
+                if char == "<":
+                    candidate = text[self._pos : self._pos + len(THINK_OPEN)]
+                    if candidate == THINK_OPEN:
+                        self._in_think = True
+                        self._pos += len(THINK_OPEN)
+                        continue
+                    if THINK_OPEN.startswith(candidate):
+                        # Possibly a partial `<think>` tag, wait for more text
+                        return None
+                elif char == "{":
+                    self._start = self._pos
+                    self._depth = 1
+                self._pos += 1
+                continue
+
+            char = text[self._pos]
+            self._pos += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{" or char == "[":
+                self._depth += 1
+            elif char == "}" or char == "]":
+                self._depth -= 1
+                if self._depth == 0:
+                    # Kept when the object is invalid too, for the repair
+                    self.raw = text[self._start : self._pos]
+                    # Raises json.JSONDecodeError for a balanced but invalid object
+                    self.result = json.loads(self.raw)
+                    return self.result
+
+        return None
@@ -0,0 +1,11 @@
+import importlib
+
+
+def import_object(path: str):
+    """
+    Import an object from a "module.path:Name" string. The module is only imported on the first call.
+    """
+    module_name, _, attribute = path.partition(":")
+    if not attribute:
+        raise ValueError(f"'{path}' is not in the 'module.path:Name' form.")
+    return getattr(importlib.import_module(module_name), attribute)
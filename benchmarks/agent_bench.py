@@ -0,0 +1,213 @@
+"""
+Offline benchmark suite for the agent framework.
+
+Runs `StatefulAgent` against the scripted backend (`Scripted_LLM`, in-process) and against the
+Ollama-compatible stand-in (`FakeOllamaServer`, over HTTP), so the framework's own overhead can be
+measured without a GPU host. Reports:
+
+    steps      steps/s of one session with an instant backend (pure framework overhead)
+    states     per-state self time, i.e. state wall time minus the LLM and tool calls inside it
+    memory     KiB held per live session
+    scaling    runs/s and steps/s for 1..N concurrent sessions with a simulated model latency
+    http       the same agent over HTTP against a local fake Ollama server
+
+Results are saved to benchmarks/results/<commit>.json, pass an older file to --compare to see the regressions.
+
+Usage:
+    python -m benchmarks.agent_bench
+    python -m benchmarks.agent_bench --quick --compare benchmarks/results/<commit>.json
+"""
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import contextlib
+import subprocess
+from typing import Optional
+
+from app.llm.lan_llm import LAN_LLM
+from app.llm.scripted_llm import ScriptedPolicy
+from app.tracing.tracer import Span, Tracer
+from app.tracing.exporters import percentile
+from benchmarks.fake_ollama import FakeOllamaServer
+from benchmarks.load_sessions import build_agent, measure
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+class _StateSelfTime:
+    """
+    Collects the time each state spends outside of its LLM and tool calls.
+    """
+
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+
+    def export(self, span: Span):
+        if span.kind != "state":
+            return
+        children = sum(child.wall_time or 0.0 for child in span.children)
+        self.samples.setdefault(span.name, []).append(span.wall_time - children)
+
+    def summary(self) -> dict:
+        report = {}
+        for name, values in self.samples.items():
+            ordered = sorted(values)
+            report[name] = {
+                "count": len(ordered),
+                "mean_us": round(sum(ordered) / len(ordered) * 1e6, 1),
+                "p50_us": round(percentile(ordered, 0.50) * 1e6, 1),
+                "p95_us": round(percentile(ordered, 0.95) * 1e6, 1),
+            }
+        return report
+
+
+async def _run_sequential(agent, runs: int) -> int:
+    steps = 0
+    for run in range(runs):
+        async for _ in agent.run(f"What is the weather in Tokyo? (#{run})"):
+            steps += 1
+    return steps
+
+
+async def bench_steps(runs: int) -> dict:
+    agent = build_agent(latency=0.0)
+    # Warm up the tool definitions and the tool cache
+    await _run_sequential(agent, 1)
+    started = time.perf_counter()
+    steps = await _run_sequential(agent, runs)
+    elapsed = time.perf_counter() - started
+    return {
+        "runs": runs,
+        "steps_per_s": round(steps / elapsed, 1),
+        "us_per_step": round(elapsed / steps * 1e6, 1),
+    }
+
+
+async def bench_states(runs: int) -> dict:
+    collector = _StateSelfTime()
+    agent = build_agent(latency=0.0)
+    agent.tracer = Tracer([collector])
+    await _run_sequential(agent, runs)
+    return collector.summary()
+
+
+async def bench_memory(session_count: int) -> dict:
+    result = await measure(build_agent(latency=0.0), session_count)
+    return {"sessions": session_count, "kib_per_session": result["kib_per_session"]}
+
+
+async def bench_scaling(session_counts: list[int], latency: float, tokens_per_second: Optional[float]) -> list:
+    agent = build_agent(latency=latency, tokens_per_second=tokens_per_second)
+    results = []
+    for session_count in session_counts:
+        result = await measure(agent, session_count)
+        result.pop("kib_per_session")
+        results.append(result)
+    return results
+
+
+async def bench_http(session_count: int, latency: float, tokens_per_second: Optional[float]) -> dict:
+    policy = ScriptedPolicy()
+    server = FakeOllamaServer(
+        latency=latency,
+        reply=lambda body: policy(body.get("messages", []), body.get("format"), body.get("think")),
+        tokens_per_second=tokens_per_second,
+    )
+    await server.start()
+    try:
+        llm = await LAN_LLM.create(model_name="fake-model", host=server.url)
+        result = await measure(build_agent(llm=llm), session_count)
+        result.pop("kib_per_session")
+        result["requests"] = server.requests
+        return result
+    finally:
+        await server.stop()
+
+
+def git_commit() -> str:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit.stdout.strip() + ("-dirty" if dirty.stdout.strip() else "")
+
+
+def flatten(results, prefix: str = "") -> dict:
+    """
+    Turn the nested results into {"scaling.100.steps_per_s": value, ...} for comparisons.
+    """
+    flat = {}
+    if isinstance(results, dict):
+        items = results.items()
+    elif isinstance(results, list):
+        # Scaling rows are keyed by their session count
+        items = ((str(row.get("sessions", index)), row) for index, row in enumerate(results))
+    else:
+        return {prefix: results} if isinstance(results, (int, float)) else {}
+    for key, value in items:
+        flat.update(flatten(value, f"{prefix}.{key}" if prefix else key))
+    return flat
+
+
+def compare(baseline: dict, current: dict):
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    print(f"\nComparison with {baseline['commit']}:")
+    print(f"{'metric':<45} {'before':>12} {'after':>12} {'change':>9}")
+    for key in sorted(old.keys() & new.keys()):
+        if key.endswith((".runs", ".sessions", ".count", ".requests")):
+            continue
+        before, after = old[key], new[key]
+        change = f"{(after - before) / before:+.1%}" if before else "n/a"
+        print(f"{key:<45} {before:>12} {after:>12} {change:>9}")
+
+
+async def main(args):
+    sizes = [1, 10, 100] if args.quick else [1, 10, 100, 1000]
+    runs = 20 if args.quick else 200
+    results = {}
+
+    # The states log every step with print, keep that out of the measurement
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        results["steps"] = await bench_steps(runs)
+        results["states"] = await bench_states(runs)
+        results["memory"] = await bench_memory(sizes[-1])
+        results["scaling"] = await bench_scaling(sizes, args.latency, args.tokens_per_second)
+        if not args.no_http:
+            results["http"] = await bench_http(min(sizes[-1], 100), args.latency, args.tokens_per_second)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": {"quick": args.quick, "latency": args.latency, "tokens_per_second": args.tokens_per_second},
+        "results": results,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = args.output or os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2, ensure_ascii=False)
+    print(f"\nSaved to {path}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            compare(json.load(file), report)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="Fewer runs and sessions, for a fast check.")
+    parser.add_argument("--latency", type=float, default=0.01, help="Simulated time to first token in seconds.")
+    parser.add_argument("--tokens-per-second", type=float, default=None, help="Simulated decode rate, None is instant.")
+    parser.add_argument("--no-http", action="store_true", help="Skip the benchmark over HTTP.")
+    parser.add_argument("--output", default=None, help="Where to save the results (default: benchmarks/results/<commit>.json).")
+    parser.add_argument("--compare", default=None, help="An earlier results file to compare against.")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,226 @@
+"""
+A minimal Ollama-compatible HTTP server for local tests and benchmarks.
+
+It implements the endpoints the agent uses (`GET /api/tags`, `POST /api/chat`, streaming and not)
+with configurable latency, decode rate and failures, so several of them can stand in for a pool of GPU hosts.
+
+Usage:
+    python -m benchmarks.fake_ollama --port 11500 --latency 0.2 --tokens-per-second 50
+"""
+
+import json
+import time
+import random
+import asyncio
+import argparse
+from typing import Callable, Optional
+
+from app.llm.scripted_llm import ScriptedPolicy
+
+
+class FakeOllamaServer:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        models: Optional[list[str]] = None,
+        latency: float = 0.0,
+        reply: Optional[Callable[[dict], str]] = None,
+        tokens_per_second: Optional[float] = None,
+        straggler_rate: float = 0.0,
+        straggler_latency: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        """
+        Args:
+            port (int): 0 picks a free port, see `url` after `start()`.
+            models (Optional[list[str]]): Models reported by `/api/tags`.
+            latency (float): Seconds before the first byte of every chat reply.
+            reply (Optional[Callable[[dict], str]]): Builds the reply content from the request body,
+                such as `lambda body: ScriptedPolicy()(body["messages"], body.get("format"))`.
+            tokens_per_second (Optional[float]): Decode rate of the reply (about 4 characters per token). None sends it at once.
+            straggler_rate (float): Share of the chat requests that are slow, like a host busy with a long generation.
+            straggler_latency (float): Seconds before the first byte of a slow request, instead of `latency`.
+            seed (Optional[int]): Seed of the straggler draws.
+        """
+        self.host = host
+        self.port = port
+        self.models = models or ["fake-model"]
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.straggler_rate = straggler_rate
+        self.straggler_latency = straggler_latency
+        self._random = random.Random(seed)
+        self.reply = reply or (lambda request: '{"tool_name": "finish_task", "arguments": {"final_answer": "ok"}}')
+        # Set to True to make every request fail with HTTP 500
+        self.failing = False
+        self.requests = 0
+        self.active = 0
+        self.cancelled = 0
+        self.stragglers = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._connections: dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self) -> "FakeOllamaServer":
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            # Idle keep-alive connections would otherwise wait for a next request forever
+            for writer in list(self._connections):
+                writer.close()
+            await asyncio.gather(*self._connections.values(), return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            # HTTP/1.1 keep-alive: serve requests until the client closes the connection
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                body = json.loads(await reader.readexactly(length)) if length else {}
+                await self._route(method, path, body, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: dict, writer: asyncio.StreamWriter):
+        if self.failing:
+            await self._send_json(writer, {"error": "injected failure"}, status="500 Internal Server Error")
+        elif method == "GET" and path == "/api/tags":
+            await self._send_json(writer, {"models": [{"model": name, "name": name} for name in self.models]})
+        elif method == "POST" and path == "/api/chat":
+            await self._chat(body, writer)
+        else:
+            await self._send_json(writer, {"error": "not found"}, status="404 Not Found")
+
+    async def _chat(self, body: dict, writer: asyncio.StreamWriter):
+        self.requests += 1
+        self.active += 1
+        try:
+            if body.get("model") not in self.models:
+                await self._send_json(writer, {"error": f"model '{body.get('model')}' not found"}, status="404 Not Found")
+                return
+
+            started = time.perf_counter()
+            latency = self.latency
+            if self.straggler_rate and self._random.random() < self.straggler_rate:
+                self.stragglers += 1
+                latency = self.straggler_latency
+            await asyncio.sleep(latency)
+            content = self.reply(body)
+            created_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            tokens = [content[index : index + 4] for index in range(0, len(content), 4)]
+
+            if not body.get("stream", True):
+                if self.tokens_per_second:
+                    await asyncio.sleep(len(tokens) / self.tokens_per_second)
+                await self._send_json(
+                    writer,
+                    {
+                        "model": body["model"],
+                        "created_at": created_at,
+                        "message": {"role": "assistant", "content": content},
+                        **self._usage(body, tokens, started, latency),
+                    },
+                )
+                return
+
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nTransfer-Encoding: chunked\r\n\r\n"
+            )
+            for token in tokens:
+                chunk = {
+                    "model": body["model"],
+                    "created_at": created_at,
+                    "message": {"role": "assistant", "content": token},
+                    "done": False,
+                }
+                await self._send_chunk(writer, json.dumps(chunk).encode() + b"\n")
+                if self.tokens_per_second:
+                    await asyncio.sleep(1 / self.tokens_per_second)
+            final = {
+                "model": body["model"],
+                "created_at": created_at,
+                "message": {"role": "assistant", "content": ""},
+                **self._usage(body, tokens, started, latency),
+            }
+            await self._send_chunk(writer, json.dumps(final).encode() + b"\n")
+            await self._send_chunk(writer, b"")
+        except ConnectionError:
+            # The client went away, e.g. a cancelled generation
+            self.cancelled += 1
+            raise
+        finally:
+            self.active -= 1
+
+    def _usage(self, body: dict, tokens: list, started: float, latency: float) -> dict:
+        total = time.perf_counter() - started
+        return {
+            "done": True,
+            "prompt_eval_count": sum(len(m.get("content", "")) for m in body.get("messages", [])) // 4,
+            "eval_count": len(tokens),
+            "prompt_eval_duration": int(latency * 1e9),
+            "eval_duration": int(max(0.0, total - latency) * 1e9),
+            "total_duration": int(total * 1e9),
+        }
+
+    async def _send_chunk(self, writer: asyncio.StreamWriter, data: bytes):
+        writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        await writer.drain()
+
+    async def _send_json(self, writer: asyncio.StreamWriter, payload: dict, status: str = "200 OK"):
+        data = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode()
+            + data
+        )
+        await writer.drain()
+
+
+async def main(port: int, latency: float, models: list[str], tokens_per_second: Optional[float]):
+    # Replies follow the scripted planning/summarizing conversation of `Scripted_LLM`
+    policy = ScriptedPolicy()
+    server = FakeOllamaServer(
+        port=port,
+        latency=latency,
+        models=models,
+        reply=lambda body: policy(body.get("messages", []), body.get("format"), body.get("think")),
+        tokens_per_second=tokens_per_second,
+    )
+    await server.start()
+    print(f"Fake Ollama server listening on {server.url}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--models", nargs="+", default=["fake-model"])
+    parser.add_argument("--tokens-per-second", type=float, default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.port, args.latency, args.models, args.tokens_per_second))
@@ -0,0 +1,97 @@
+"""
+Tail latency of `Router_LLM` with and without hedged requests, against local fake Ollama servers
+where a share of the requests straggle (e.g. a host busy with a long generation).
+
+For each mode it sends the same number of requests and prints the latency percentiles, how many
+requests were hedged and won by the hedge, and the extra load the hedges put on the servers.
+
+Usage:
+    python -m benchmarks.hedging --requests 1000 --straggler-rate 0.03 --straggler-latency 1.0
+"""
+
+import time
+import asyncio
+import argparse
+
+from app.llm.router_llm import Router_LLM
+from app.llm.hedging import HedgePolicy
+from app.tracing.exporters import percentile
+from benchmarks.fake_ollama import FakeOllamaServer
+
+
+async def send(llm: Router_LLM, count: int, concurrency: int, stream: bool) -> list[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(index: int):
+        # Distinct prompts, so in-flight requests are never shared
+        messages = [{"role": "user", "content": f"What is the weather in Tokyo? (#{index})"}]
+        async with semaphore:
+            started = time.perf_counter()
+            if stream:
+                async for _ in llm.chat_stream(messages, format_type="json"):
+                    pass
+            else:
+                await llm.chat(messages, format_type="json")
+            latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(index) for index in range(count)))
+    return sorted(latencies)
+
+
+async def run_mode(args, hedge) -> dict:
+    servers = [
+        await FakeOllamaServer(
+            latency=args.latency,
+            straggler_rate=args.straggler_rate,
+            straggler_latency=args.straggler_latency,
+            seed=index,
+        ).start()
+        for index in range(args.hosts)
+    ]
+    llm = Router_LLM("fake-model", hosts=[server.url for server in servers], hedge=hedge)
+    await llm._check_model_exists()
+    try:
+        latencies = await send(llm, args.requests, args.concurrency, args.stream)
+    finally:
+        await llm.close()
+        for server in servers:
+            await server.stop()
+    return {
+        "p50": percentile(latencies, 0.50),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1],
+        "server_requests": sum(server.requests for server in servers),
+        "stragglers": sum(server.stragglers for server in servers),
+    }
+
+
+async def main(args):
+    modes = {
+        "no hedging": None,
+        f"hedge p{args.percentile * 100:g}": HedgePolicy(percentile=args.percentile, budget=args.budget, initial_delay=0.1),
+    }
+    print(f"{'mode':<12} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'max ms':>7} {'load':>6} {'hedged':>7} {'won':>5}")
+    for name, hedge in modes.items():
+        result = await run_mode(args, hedge)
+        hedged = hedge.stats["hedged"] if hedge is not None else 0
+        won = hedge.stats["hedge_won"] if hedge is not None else 0
+        print(
+            f"{name:<12} {result['p50'] * 1e3:>7.0f} {result['p95'] * 1e3:>7.0f} {result['p99'] * 1e3:>7.0f} "
+            f"{result['max'] * 1e3:>7.0f} {result['server_requests'] / args.requests:>6.2f} {hedged:>7} {won:>5}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--hosts", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds to the first byte of a normal request.")
+    parser.add_argument("--straggler-rate", type=float, default=0.03, help="Share of the requests that straggle.")
+    parser.add_argument("--straggler-latency", type=float, default=1.0, help="Seconds to the first byte of a straggler.")
+    parser.add_argument("--percentile", type=float, default=0.95, help="Latency percentile after which a request is hedged.")
+    parser.add_argument("--budget", type=float, default=0.1, help="Hedges per request at most, in the long run.")
+    parser.add_argument("--stream", action="store_true", help="Stream the replies, hedging on the first chunk.")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,95 @@
+"""
+Interactive run latency under a batch backlog, with and without the LLM scheduler.
+
+The scripted server processes `--parallel` requests at a time and queues the others first come,
+first served, like Ollama with OLLAMA_NUM_PARALLEL. A backlog of batch runs starts first, then
+interactive runs arrive one by one. Without a scheduler the interactive requests queue behind the
+batch ones on the server, with it they are admitted first.
+
+Usage:
+    python -m benchmarks.llm_scheduler --batch 40 --interactive 10 --parallel 4
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import contextlib
+
+from app.llm.scripted_llm import Scripted_LLM
+from app.llm.scheduler import BATCH, INTERACTIVE, LLMScheduler
+from app.tracing.exporters import percentile
+from benchmarks.load_sessions import build_agent
+
+
+class ServerLLM(Scripted_LLM):
+    """
+    A scripted LLM behind a server that runs a bounded number of requests at a time.
+    """
+
+    def __init__(self, parallel: int, **kwargs):
+        self.server_slots = asyncio.Semaphore(parallel)
+        super().__init__(**kwargs)
+
+    async def _chat(self, *args):
+        async with self.server_slots:
+            return await super()._chat(*args)
+
+    async def _chat_stream(self, *args):
+        async with self.server_slots:
+            async for delta in super()._chat_stream(*args):
+                yield delta
+
+
+async def timed_run(agent, priority: int, index: int, durations: dict):
+    started = time.perf_counter()
+    async for _ in agent.run(f"What is the weather in Tokyo? (#{index})", priority=priority):
+        pass
+    durations[priority].append(time.perf_counter() - started)
+
+
+async def measure(args, scheduler) -> dict:
+    llm = ServerLLM(args.parallel, first_token_latency=args.latency)
+    agent = build_agent(llm=llm)
+    if scheduler is not None:
+        agent.scheduler = scheduler
+        llm.use_scheduler(scheduler)
+    durations = {INTERACTIVE: [], BATCH: []}
+    tasks = [asyncio.create_task(timed_run(agent, BATCH, index, durations)) for index in range(args.batch)]
+    for index in range(args.interactive):
+        await asyncio.sleep(args.arrival)
+        tasks.append(asyncio.create_task(timed_run(agent, INTERACTIVE, index, durations)))
+    await asyncio.gather(*tasks)
+
+    result = {}
+    for name, priority in (("interactive", INTERACTIVE), ("batch", BATCH)):
+        samples = sorted(durations[priority])
+        result[name] = (round(percentile(samples, 0.50) * 1e3), round(percentile(samples, 0.95) * 1e3))
+    return result
+
+
+async def main(args):
+    modes = {"server queue": None, "scheduler": LLMScheduler(per_host_concurrency=args.parallel, max_queue=args.max_queue)}
+    print(f"{'mode':<14} {'interactive p50/p95 ms':>23} {'batch p50/p95 ms':>18}")
+    for name, scheduler in modes.items():
+        # The states log every step with print, keep that out of the measurement
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = await measure(args, scheduler)
+        interactive, batch = result["interactive"], result["batch"]
+        print(f"{name:<14} {f'{interactive[0]}/{interactive[1]}':>23} {f'{batch[0]}/{batch[1]}':>18}")
+        if scheduler is not None:
+            stats = scheduler.stats()
+            for request_class, wait in sorted(stats["wait"].items()):
+                print(f"  wait {request_class}: n={wait['count']} p50={wait['p50'] * 1e3:.0f} ms p95={wait['p95'] * 1e3:.0f} ms")
+            print(f"  runs held back: {stats['runs_held']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=40, help="Batch runs started at once.")
+    parser.add_argument("--interactive", type=int, default=10, help="Interactive runs arriving after them.")
+    parser.add_argument("--arrival", type=float, default=0.05, help="Seconds between two interactive runs.")
+    parser.add_argument("--parallel", type=int, default=4, help="Requests the server processes at the same time.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per LLM request.")
+    parser.add_argument("--max-queue", type=int, default=None, help="Queued requests beyond which new runs wait.")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,120 @@
+"""
+Load test for the session-isolated runtime.
+
+One `StatefulAgent` (one LLM client, one toolbox) drives N concurrent `run()` generators on a
+single event loop. For each N it reports throughput and the memory held per live session.
+
+Usage:
+    python -m benchmarks.load_sessions --sessions 1 10 100 1000 5000
+"""
+
+import gc
+import os
+import time
+import asyncio
+import argparse
+import contextlib
+import tracemalloc
+from typing import Optional
+
+from app.llm.base import BaseLLM
+from app.llm.scripted_llm import Scripted_LLM
+from app.tools.tool_box import ToolBox
+from app.tools.finish import FinishTool
+from app.agent.stateful import StatefulAgent
+from app.tools.get_weather import GetWeatherTool
+from app.states.planning import PlanningState
+from app.states.finished import FinishedState
+from app.states.executing import ToolExecutionState
+from app.states.summarizing import SummarizationState
+
+
+def build_agent(
+    latency: float = 0.0, tokens_per_second: Optional[float] = None, llm: Optional[BaseLLM] = None
+) -> StatefulAgent:
+    """
+    The weather agent of `main.py` on a scripted backend (unless `llm` is given).
+    """
+    states = {
+        "planning": PlanningState(),
+        "tool_execution": ToolExecutionState(),
+        "summarizing": SummarizationState(),
+        "finished": FinishedState(),
+    }
+    toolbox = ToolBox([GetWeatherTool(), FinishTool()])
+    llm = llm or Scripted_LLM(first_token_latency=latency, tokens_per_second=tokens_per_second)
+    return StatefulAgent(llm=llm, toolbox=toolbox, states=states, max_steps=8)
+
+
+class _Barrier:
+    """
+    Holds every session open after its first step, so all of them are alive at the same time.
+    """
+
+    def __init__(self, parties: int):
+        self.parties = parties
+        self.arrived = 0
+        self.all_arrived = asyncio.Event()
+        self.release = asyncio.Event()
+
+    async def wait(self):
+        self.arrived += 1
+        if self.arrived == self.parties:
+            self.all_arrived.set()
+        await self.release.wait()
+
+
+async def _drain(agent: StatefulAgent, barrier: _Barrier, index: int) -> int:
+    steps = 0
+    async for _ in agent.run(f"What is the weather in Tokyo? (#{index})"):
+        steps += 1
+        if steps == 1:
+            await barrier.wait()
+    return steps
+
+
+async def measure(agent: StatefulAgent, session_count: int) -> dict:
+    gc.collect()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+
+    barrier = _Barrier(session_count)
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(_drain(agent, barrier, i)) for i in range(session_count)]
+
+    await barrier.all_arrived.wait()
+    live, _ = tracemalloc.get_traced_memory()
+    barrier.release.set()
+
+    steps = sum(await asyncio.gather(*tasks))
+    elapsed = time.perf_counter() - started
+    tracemalloc.stop()
+
+    return {
+        "sessions": session_count,
+        "elapsed_s": round(elapsed, 4),
+        "runs_per_s": round(session_count / elapsed, 1),
+        "steps_per_s": round(steps / elapsed, 1),
+        "kib_per_session": round((live - baseline) / 1024 / session_count, 2),
+    }
+
+
+async def main(session_counts: list[int], latency: float):
+    agent = build_agent(latency)
+    print(f"{'sessions':>9} {'elapsed_s':>10} {'runs/s':>9} {'steps/s':>9} {'KiB/session':>12}")
+    for session_count in session_counts:
+        # The states log every step with print, keep that out of the measurement
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = await measure(agent, session_count)
+        print(
+            f"{result['sessions']:>9} {result['elapsed_s']:>10} {result['runs_per_s']:>9} "
+            f"{result['steps_per_s']:>9} {result['kib_per_session']:>12}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 100, 1000, 5000])
+    parser.add_argument("--latency", type=float, default=0.01, help="Simulated LLM latency in seconds.")
+    args = parser.parse_args()
+    asyncio.run(main(args.sessions, args.latency))
@@ -0,0 +1,79 @@
+"""
+Long-term memory search latency at scale.
+
+Fills a `LongTermMemory` with synthetic tool results (a few common words shared by every item,
+a city shared by a fifth of them, and random rare words), then times searches that rank by rare
+terms, searches made only of common terms, and searches that match nothing.
+
+Usage:
+    python -m benchmarks.long_term_recall --items 1000000 --path /tmp/long_term.db
+"""
+
+import os
+import time
+import random
+import argparse
+
+from app.agent.long_term import LongTermMemory
+from app.tracing.exporters import percentile
+
+CITIES = ["Tokyo", "Shanghai", "Paris", "Berlin", "Lima"]
+
+
+def fill(memory: LongTermMemory, count: int, vocabulary: int, seed: int = 0):
+    rng = random.Random(seed)
+    batch = []
+    for index in range(count):
+        words = " ".join(f"w{rng.randrange(vocabulary)}" for _ in range(12))
+        batch.append(("tool_result", f'get_todays_weather({{"city": "{rng.choice(CITIES)}"}}) returned: {words} (#{index})'))
+        if len(batch) == 10_000:
+            memory.add_many(batch)
+            batch = []
+    memory.add_many(batch)
+    memory.optimize()
+
+
+def timed(memory: LongTermMemory, queries: list[str]) -> dict:
+    samples = []
+    for query in queries:
+        started = time.perf_counter()
+        memory.search(query)
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {
+        "p50_ms": round(percentile(samples, 0.50) * 1e3, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1e3, 3),
+    }
+
+
+def main(args):
+    if args.path != ":memory:" and os.path.exists(args.path) and not args.reuse:
+        os.remove(args.path)
+    memory = LongTermMemory(args.path)
+    if len(memory) < args.items:
+        started = time.perf_counter()
+        fill(memory, args.items - len(memory), args.vocabulary)
+        print(f"Filled {args.items} items in {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(1)
+    queries = {
+        "rare terms": [f"w{rng.randrange(args.vocabulary)} w{rng.randrange(args.vocabulary)} weather" for _ in range(args.queries)],
+        "common terms": [f"What is the weather in {rng.choice(CITIES)} today?" for _ in range(args.queries)],
+        "no match": [f"unknown{index} request" for index in range(args.queries)],
+    }
+    print(f"{'query':<14} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, batch in queries.items():
+        timed(memory, batch[:10])
+        result = timed(memory, batch)
+        print(f"{name:<14} {result['p50_ms']:>8} {result['p99_ms']:>8}")
+    memory.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=200_000, help="Items in the memory.")
+    parser.add_argument("--vocabulary", type=int, default=50_000, help="Distinct rare words.")
+    parser.add_argument("--queries", type=int, default=500, help="Searches per kind of query.")
+    parser.add_argument("--path", default="/tmp/long_term_bench.db", help="The database file, ':memory:' keeps it in memory.")
+    parser.add_argument("--reuse", action="store_true", help="Keep the items of an earlier run of the same path.")
+    main(parser.parse_args())
@@ -0,0 +1,125 @@
+"""
+Event-loop latency while a CPU-heavy tool runs.
+
+A ticker task asks the loop to wake it up every millisecond and records how late each wake-up is,
+while the same CPU-bound tool is called through the ToolBox in each execution mode:
+
+    async      the work runs on the event loop, every other session stalls
+    thread     the work runs in the thread pool, the GIL still takes slices of the loop
+    process    the work runs in the process pool, the loop stays free
+
+The lag with the tool running should stay close to the idle lag for the process mode.
+
+Usage:
+    python -m benchmarks.loop_latency --calls 4 --limit 2000000
+"""
+
+import time
+import asyncio
+import argparse
+
+from app.tools.base import BaseTool, BlockingTool
+from app.tools.tool_box import ToolBox
+from app.tracing.exporters import percentile
+
+PARAMETERS = {
+    "type": "object",
+    "properties": {"limit": {"type": "integer", "description": "Count the primes below this number."}},
+    "required": ["limit"],
+}
+
+
+def count_primes(limit: int) -> int:
+    sieve = bytearray([1]) * limit
+    sieve[0:2] = b"\x00\x00"
+    for number in range(2, int(limit ** 0.5) + 1):
+        if sieve[number]:
+            # Pure Python on purpose, so the work holds the GIL like most tool code
+            for multiple in range(number * number, limit, number):
+                sieve[multiple] = 0
+    return sum(sieve)
+
+
+class AsyncPrimeTool(BaseTool):
+    name: str = "count_primes_async"
+    description: str = "Count the primes below a number."
+    parameters: dict = PARAMETERS
+
+    async def _execute(self, limit: int) -> int:
+        return count_primes(limit)
+
+
+class PrimeTool(BlockingTool):
+    name: str = "count_primes"
+    description: str = "Count the primes below a number."
+    parameters: dict = PARAMETERS
+
+    def _run(self, limit: int) -> int:
+        return count_primes(limit)
+
+
+async def _ticker(lags: list, stop: asyncio.Event, interval: float = 0.001):
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - expected))
+
+
+def _report(lags: list) -> dict:
+    ordered = sorted(lags)
+    return {
+        "ticks": len(ordered),
+        "p50_ms": round(percentile(ordered, 0.50) * 1e3, 2),
+        "p99_ms": round(percentile(ordered, 0.99) * 1e3, 2),
+        "max_ms": round(ordered[-1] * 1e3, 2) if ordered else 0.0,
+    }
+
+
+async def measure(toolbox: ToolBox, tool_name: str, calls: int, limit: int) -> dict:
+    lags, stop = [], asyncio.Event()
+    ticker = asyncio.create_task(_ticker(lags, stop))
+    started = time.perf_counter()
+    results = await toolbox.call_many([{"tool_name": tool_name, "arguments": {"limit": limit}} for _ in range(calls)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    errors = [result.error for result in results if result.error]
+    if errors:
+        raise RuntimeError(errors[0])
+    return {**_report(lags), "tool_s": round(elapsed, 2)}
+
+
+async def idle(seconds: float = 0.5) -> dict:
+    lags, stop = [], asyncio.Event()
+    ticker = asyncio.create_task(_ticker(lags, stop))
+    await asyncio.sleep(seconds)
+    stop.set()
+    await ticker
+    return _report(lags)
+
+
+async def main(args):
+    modes = ["thread", "process"]
+    toolbox = ToolBox(
+        [AsyncPrimeTool(), *(PrimeTool(name=f"count_primes_{mode}", execution=mode) for mode in modes)],
+        process_workers=args.calls,
+    )
+    # Spawning the workers is not part of the measurement
+    toolbox.start_workers()
+    try:
+        print(f"{'mode':<10} {'ticks':>7} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8} {'tool s':>7}")
+        rows = {"idle": await idle()}
+        rows["async"] = await measure(toolbox, "count_primes_async", args.calls, args.limit)
+        for mode in modes:
+            rows[mode] = await measure(toolbox, f"count_primes_{mode}", args.calls, args.limit)
+        for mode, row in rows.items():
+            print(f"{mode:<10} {row['ticks']:>7} {row['p50_ms']:>8} {row['p99_ms']:>8} {row['max_ms']:>8} {row.get('tool_s', ''):>7}")
+    finally:
+        toolbox.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=2, help="Concurrent calls of the tool per mode.")
+    parser.add_argument("--limit", type=int, default=2_000_000, help="Size of each call's work.")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,82 @@
+"""
+Prefix-reuse benchmark for prompt assembly.
+
+Ollama keeps the KV cache of the previous request and only has to process the part of the
+new prompt after the longest common prefix. This runs the agent against an in-process
+backend, renders every request the way a chat template would, and reports per run how much
+of each prompt could have been served from the cache of the previous one.
+
+Usage:
+    python -m benchmarks.prefix_reuse --runs 3
+"""
+
+import os
+import asyncio
+import argparse
+import contextlib
+
+from app.llm.scripted_llm import Scripted_LLM, ScriptedClient
+from benchmarks.load_sessions import build_agent
+
+
+def render_prompt(messages: list) -> str:
+    """
+    Flatten messages the way a chat template does, so common prefixes can be compared.
+    """
+    return "".join(f"<|{message['role']}|>{message['content']}<|end|>" for message in messages)
+
+
+def common_prefix_length(left: str, right: str) -> int:
+    length = min(len(left), len(right))
+    for index in range(length):
+        if left[index] != right[index]:
+            return index
+    return length
+
+
+class _RecordingClient(ScriptedClient):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prompts = []
+
+    async def chat(self, model: str, messages: list, stream: bool = False, **kwargs):
+        self.prompts.append(render_prompt(messages))
+        return await super().chat(model, messages, stream=stream, **kwargs)
+
+
+class RecordingLLM(Scripted_LLM):
+    def _create_client(self):
+        return _RecordingClient(self.policy, self.first_token_latency, self.tokens_per_second)
+
+
+def prefix_reuse_ratio(prompts: list[str]) -> float:
+    """
+    Share of the prompt characters (after the first request) that repeat the previous prompt's prefix.
+    """
+    reused = total = 0
+    for previous, current in zip(prompts, prompts[1:]):
+        reused += common_prefix_length(previous, current)
+        total += len(current)
+    return reused / total if total else 0.0
+
+
+async def main(runs: int):
+    agent = build_agent(latency=0.0, llm=RecordingLLM())
+    print(f"{'run':>4} {'requests':>9} {'prompt_chars':>13} {'prefix_reuse':>13}")
+    for run in range(runs):
+        agent.llm.client.prompts.clear()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            async for _ in agent.run(f"What is the weather in Tokyo? (#{run})"):
+                pass
+        prompts = agent.llm.client.prompts
+        print(
+            f"{run:>4} {len(prompts):>9} {sum(len(prompt) for prompt in prompts):>13} "
+            f"{prefix_reuse_ratio(prompts):>12.1%}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(main(args.runs))
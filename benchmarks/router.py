@@ -0,0 +1,84 @@
+"""
+Exercise `Router_LLM` against several local fake Ollama servers.
+
+Starts a fast host, a slow host and a failing host, sends concurrent requests and prints how
+they were balanced, then heals the failing host and shows it re-admitted by the health checks.
+
+Usage:
+    python -m benchmarks.router --requests 200 --concurrency 20
+"""
+
+import time
+import asyncio
+import argparse
+
+from app.llm.router_llm import Router_LLM
+from benchmarks.fake_ollama import FakeOllamaServer
+
+
+async def send(llm: Router_LLM, count: int, concurrency: int, stream: bool) -> tuple[float, int]:
+    semaphore = asyncio.Semaphore(concurrency)
+    messages = [{"role": "user", "content": "What is the weather in Tokyo?"}]
+    errors = 0
+
+    async def one():
+        nonlocal errors
+        async with semaphore:
+            if stream:
+                async for _ in llm.chat_stream(messages, format_type="json"):
+                    pass
+            else:
+                _, _, response_time = await llm.chat(messages, format_type="json")
+                errors += response_time is None
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(count)))
+    return time.perf_counter() - started, errors
+
+
+def report(title: str, llm: Router_LLM, servers: dict):
+    print(f"\n== {title}")
+    print(f"{'host':>6} {'served':>7} {'ewma_ms':>8} {'failures':>9} {'ejected':>8}")
+    for name, server in servers.items():
+        state = next(state for state in llm.client.hosts if state.host == server.url)
+        ewma = f"{state.ewma_latency * 1000:.0f}" if state.ewma_latency else "-"
+        print(f"{name:>6} {server.requests:>7} {ewma:>8} {state.failures:>9} {str(not state.available):>8}")
+
+
+async def main(requests: int, concurrency: int):
+    servers = {
+        "fast": await FakeOllamaServer(models=["fake-model"], latency=0.02).start(),
+        "slow": await FakeOllamaServer(models=["fake-model"], latency=0.2).start(),
+        "broken": await FakeOllamaServer(models=["fake-model"], latency=0.02).start(),
+    }
+    servers["broken"].failing = True
+
+    llm = Router_LLM(
+        "fake-model",
+        hosts=[server.url for server in servers.values()],
+        health_interval=0.5,
+        base_backoff=0.5,
+        # Every request is the same prompt, measure the balancing rather than the sharing of in-flight requests
+        coalesce=False,
+    )
+    await llm._check_model_exists()
+
+    elapsed, errors = await send(llm, requests, concurrency, stream=False)
+    report(f"{requests} chat requests in {elapsed:.2f}s, {errors} errors", llm, servers)
+
+    servers["broken"].failing = False
+    await asyncio.sleep(1.2)
+    elapsed, _ = await send(llm, requests, concurrency, stream=True)
+    report(f"host healed, {requests} streamed requests in {elapsed:.2f}s", llm, servers)
+
+    await llm.close()
+    for server in servers.values():
+        await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
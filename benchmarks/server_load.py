@@ -0,0 +1,78 @@
+"""
+Load test of the HTTP front-end: N concurrent clients each stream one run over SSE.
+
+The server (`AgentServer`) runs in this process on the scripted backend, so the numbers are the
+cost of the framework and the HTTP layer. Reports runs per second, and the p50/p99 time to the
+first step event and to the end of the stream.
+
+Usage:
+    python -m benchmarks.server_load --clients 10 100 1000
+"""
+
+import os
+import time
+import asyncio
+import argparse
+import contextlib
+
+import httpx
+
+from app.llm.scripted_llm import Scripted_LLM
+from app.server.agent_server import AgentServer
+from app.tracing.exporters import percentile
+from benchmarks.load_sessions import build_agent
+
+
+async def stream_run(client: httpx.AsyncClient, index: int) -> tuple[float, float]:
+    started = time.perf_counter()
+    first_step = None
+    async with client.stream("POST", "/runs", json={"request": f"What is the weather in Tokyo? (#{index})"}) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if first_step is None and line == "event: step":
+                first_step = time.perf_counter() - started
+    return first_step, time.perf_counter() - started
+
+
+async def measure(port: int, client_count: int) -> dict:
+    limits = httpx.Limits(max_connections=client_count, max_keepalive_connections=0)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=60, limits=limits) as client:
+        started = time.perf_counter()
+        results = await asyncio.gather(*(stream_run(client, index) for index in range(client_count)))
+        elapsed = time.perf_counter() - started
+    first_steps = sorted(result[0] for result in results)
+    totals = sorted(result[1] for result in results)
+    return {
+        "clients": client_count,
+        "runs_per_s": round(client_count / elapsed, 1),
+        "first_step_ms": (round(percentile(first_steps, 0.50) * 1e3), round(percentile(first_steps, 0.99) * 1e3)),
+        "total_ms": (round(percentile(totals, 0.50) * 1e3), round(percentile(totals, 0.99) * 1e3)),
+    }
+
+
+async def main(args):
+    agent = build_agent(llm=Scripted_LLM(first_token_latency=args.latency))
+    server = AgentServer(agent, max_active_runs=args.max_active_runs, max_waiting_runs=max(args.clients))
+    await server.start("127.0.0.1", args.port)
+    print(f"{'clients':>8} {'runs/s':>8} {'first step p50/p99 ms':>22} {'total p50/p99 ms':>18}")
+    try:
+        for client_count in args.clients:
+            # The states log every step with print, keep that out of the measurement
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                result = await measure(args.port, client_count)
+            first_step, total = result["first_step_ms"], result["total_ms"]
+            print(
+                f"{client_count:>8} {result['runs_per_s']:>8} {f'{first_step[0]}/{first_step[1]}':>22} "
+                f"{f'{total[0]}/{total[1]}':>18}"
+            )
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--latency", type=float, default=0.01, help="Simulated LLM latency in seconds.")
+    parser.add_argument("--max-active-runs", type=int, default=256, help="Runs streamed at the same time.")
+    parser.add_argument("--port", type=int, default=8799)
+    asyncio.run(main(parser.parse_args()))
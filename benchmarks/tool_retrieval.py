@@ -0,0 +1,132 @@
+"""
+Planner prompt size with indexed tool retrieval.
+
+Builds a synthetic toolbox of many tools (every combination of an action and a resource, like
+`create_invoice` or `search_customer`), then for requests naming one tool's job compares:
+
+    all        every tool definition in the system prompt (tool_top_k=None)
+    top-k      the k best matches of the BM25 index, plus the pinned tools and search_tools
+
+and reports the prompt size, how often the needed tool made it into the top-k (recall), and the
+cost of building the index, adding a tool and selecting the tools of a request.
+
+Usage:
+    python -m benchmarks.tool_retrieval --tools 300 --top-k 8
+"""
+
+import os
+import time
+import random
+import argparse
+import contextlib
+
+from app.agent.memory import estimate_tokens
+from app.prompts.agent import AGENT_SYSTEM_PROMPT
+from app.tools.base import BaseTool
+from app.tools.finish import FinishTool
+from app.tools.tool_box import ToolBox
+
+ACTIONS = {
+    "create": "Create a new {resource} with the given fields.",
+    "get": "Get one {resource} by its id.",
+    "search": "Search the {resource} records matching a free text query.",
+    "update": "Update the fields of an existing {resource}.",
+    "delete": "Permanently delete a {resource}.",
+    "export": "Export the {resource} records to a CSV file.",
+}
+RESOURCES = [
+    "invoice", "customer", "order", "shipment", "product", "ticket", "employee", "calendar_event",
+    "email", "document", "payment", "refund", "subscription", "coupon", "warehouse", "supplier",
+    "contract", "meeting_room", "expense_report", "purchase_order", "lead", "campaign", "survey",
+    "repository", "build", "deployment", "alert", "dashboard", "dataset", "model", "experiment",
+    "user_account", "api_key", "webhook", "invoice_template", "tax_rate", "currency_rate",
+    "flight_booking", "hotel_booking", "weather_station", "news_feed", "stock_quote", "recipe",
+    "playlist", "podcast", "translation", "map_route", "parking_spot", "library_book", "course",
+]
+REQUESTS = {
+    "create": "Please make a new {words} for me",
+    "get": "Show me the {words} with id 42",
+    "search": "Find every {words} that mentions the spring sale",
+    "update": "Change the fields of the {words} I created yesterday",
+    "delete": "Remove the {words} permanently",
+    "export": "I need all {words} records as a CSV file",
+}
+
+
+class SyntheticTool(BaseTool):
+    async def _execute(self, **kwargs):
+        return "ok"
+
+
+def build_tools(count: int) -> list[BaseTool]:
+    tools = [FinishTool()]
+    for resource in RESOURCES:
+        for action, description in ACTIONS.items():
+            words = resource.replace("_", " ")
+            tools.append(SyntheticTool(
+                name=f"{action}_{resource}",
+                description=description.format(resource=words),
+                parameters={
+                    "type": "object",
+                    "properties": {
+                        f"{resource}_id": {"type": "string", "description": f"The id of the {words}."},
+                        "fields": {"type": "object", "description": f"The {words} fields to set."},
+                    },
+                    "required": [f"{resource}_id"] if action in ("get", "update", "delete") else [],
+                },
+            ))
+            if len(tools) >= count:
+                return tools
+    return tools
+
+
+def prompt_size(toolbox: ToolBox, names) -> tuple[int, int]:
+    prompt = AGENT_SYSTEM_PROMPT.format(tools_json=toolbox.get_llm_tool_definitions_json(names))
+    return len(prompt), estimate_tokens(prompt)
+
+
+def main(args):
+    tools = build_tools(args.tools)
+    requests = []
+    for tool in tools[1:]:
+        action, _, resource = tool.name.partition("_")
+        requests.append((tool.name, REQUESTS[action].format(words=resource.replace("_", " "))))
+    random.Random(0).shuffle(requests)
+    requests = requests[: args.requests]
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        toolbox = ToolBox(tools, tool_top_k=args.top_k)
+        build_ms = (time.perf_counter() - started) * 1e3
+        full = ToolBox(tools)
+
+    started = time.perf_counter()
+    toolbox.add_tool(SyntheticTool(name="add_probe", description="A tool added after the index was built."))
+    add_us = (time.perf_counter() - started) * 1e6
+    toolbox.remove_tool("add_probe")
+
+    all_chars, all_tokens = prompt_size(full, None)
+    hits = chars = tokens = 0
+    started = time.perf_counter()
+    selections = [(expected, toolbox.select_tools(request)) for expected, request in requests]
+    select_us = (time.perf_counter() - started) / len(requests) * 1e6
+    for expected, names in selections:
+        hits += expected in names
+        size = prompt_size(toolbox, names)
+        chars += size[0]
+        tokens += size[1]
+
+    print(f"{len(tools)} tools, top-k {args.top_k}, {len(requests)} requests")
+    print(f"index build {build_ms:.1f} ms, add a tool {add_us:.0f} us, select per request {select_us:.0f} us")
+    print(f"{'prompt':<8} {'chars':>9} {'tokens':>8}")
+    print(f"{'all':<8} {all_chars:>9} {all_tokens:>8}")
+    print(f"{'top-k':<8} {chars // len(requests):>9} {tokens // len(requests):>8}")
+    print(f"reduction {1 - tokens / len(requests) / all_tokens:.1%}, recall@{args.top_k} {hits / len(requests):.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tools", type=int, default=300, help="Size of the synthetic toolbox.")
+    parser.add_argument("--top-k", type=int, default=8, help="Tools shown per request.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests to select tools for.")
+    main(parser.parse_args())
@@ -1,18 +1,21 @@
+import time
+
+# Cold start is measured from here, before the framework is imported
+STARTED = time.perf_counter()
+
 import os
 import asyncio
 
-from app.states import *
-from app.prompts import *
-from app.llm.api_llm import *
-from app.llm.lan_llm import *
-from app.tools.finish import *
-from app.agent.stateful import *
-from app.tools.tool_box import *
-from app.states.finished import *
-from app.states.planning import *
-from app.states.executing import *
-from app.tools.get_weather import *
-from app.states.summarizing import *
+from app.agent.warmup import warmup
+from app.tools.tool_box import ToolBox
+from app.llm.registry import build_llm, create_llm
+from app.llm.reasoning import ReasoningBudget
+from app.tools.registry import load_tools
+from app.agent.stateful import StatefulAgent
+from app.states.finished import FinishedState
+from app.states.planning import PlanningState
+from app.states.executing import ToolExecutionState
+from app.states.summarizing import SummarizationState
 
 all_states = {
     "planning": PlanningState(),
@@ -25,8 +28,8 @@ ollama_host = os.environ.get("OLLAMA_HOST")
 
 
 async def test_llm():
-    llm_brain = await LAN_LLM.create(model_name="deepseek-r1:14b", host=ollama_host)
-    # llm_brain = API_LLM("deepseek-reasoner")
+    llm_brain = await create_llm("lan", model_name="deepseek-r1:14b", host=ollama_host)
+    # llm_brain = await create_llm("api", model_name="deepseek-reasoner")
     while True:
         user_input = input("Input the prompt: ")
         system_message = {"role": "system", "content": "You are a helpful assistant."}
@@ -46,13 +49,25 @@ async def test_llm():
 
 
 async def main():
-    llm_brain = await LAN_LLM.create(model_name="deepseek-r1:14b", host=ollama_host)
+    # Keep the model and its prompt cache loaded between the steps of a run
+    llm_brain = build_llm("lan", model_name="deepseek-r1:14b", host=ollama_host, keep_alive="30m")
 
-    toolbox = ToolBox([GetWeatherTool(), FinishTool()])
+    toolbox = ToolBox(load_tools(["get_todays_weather", "finish_task"]))
     agent = StatefulAgent(
-        llm=llm_brain, toolbox=toolbox, states=all_states, max_steps=8
+        llm=llm_brain,
+        toolbox=toolbox,
+        states=all_states,
+        max_steps=8,
+        # Picking a tool needs little thinking, writing the summary none at all
+        state_reasoning={
+            "planning": ReasoningBudget(max_think_tokens=512),
+            "summarizing": ReasoningBudget(think=False),
+        },
     )
     user_request = "I want to know the weather in Shanghai today, tell me the result and finish the task"
+    # The model check and the weight loading run alongside the tool preparation, instead of one after the other
+    await warmup(agent, requests=[user_request])
+    print(f"Cold start: {time.perf_counter() - STARTED:.2f}s")
     async for step_result in agent.run(user_request=user_request):
         print("-" * 20)
         print(step_result)
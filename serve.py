@@ -0,0 +1,112 @@
+"""
+Serve the weather agent over HTTP, streaming the steps of every run (see `app.server.agent_server`).
+
+One agent (LLM clients, toolbox, scheduler) is built per worker process and shared by all its runs.
+With several workers, every process listens on the same port (SO_REUSEPORT) and the kernel spreads
+the connections over them, one event loop per core.
+
+Usage:
+    python serve.py --port 8000 --workers 4
+    curl -N localhost:8000/runs -d '{"request": "What is the weather in Shanghai today?"}'
+"""
+
+import os
+import signal
+import asyncio
+import argparse
+import multiprocessing
+
+from app.agent.warmup import warmup
+from app.tools.tool_box import ToolBox
+from app.llm.registry import build_llm
+from app.llm.reasoning import ReasoningBudget
+from app.llm.scheduler import LLMScheduler
+from app.tools.registry import load_tools
+from app.agent.stateful import StatefulAgent
+from app.server.agent_server import AgentServer
+from app.states.finished import FinishedState
+from app.states.planning import PlanningState
+from app.states.executing import ToolExecutionState
+from app.states.summarizing import SummarizationState
+
+
+def build_agent(args) -> StatefulAgent:
+    llm_options = {"host": args.ollama_host} if args.backend == "lan" else {}
+    if args.backend in ("lan", "ollama"):
+        llm_options["keep_alive"] = "30m"
+    llm = build_llm(args.backend, model_name=args.model, **llm_options)
+    return StatefulAgent(
+        llm=llm,
+        toolbox=ToolBox(load_tools(["get_todays_weather", "finish_task"])),
+        states={
+            "planning": PlanningState(),
+            "tool_execution": ToolExecutionState(),
+            "summarizing": SummarizationState(),
+            "finished": FinishedState(),
+        },
+        max_steps=8,
+        run_timeout=args.run_timeout,
+        scheduler=LLMScheduler(per_host_concurrency=args.llm_concurrency, max_queue=args.max_queue),
+        state_reasoning={
+            "planning": ReasoningBudget(max_think_tokens=512),
+            "summarizing": ReasoningBudget(think=False),
+        },
+    )
+
+
+async def serve(args, reuse_port: bool):
+    agent = build_agent(args)
+    await warmup(agent)
+    server = AgentServer(agent, max_active_runs=args.max_active_runs, max_waiting_runs=args.max_waiting_runs)
+    await server.start(args.host, args.port, reuse_port=reuse_port)
+    print(f"Worker {os.getpid()} serving on http://{args.host}:{args.port}")
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopped.set)
+    await stopped.wait()
+
+    print(f"Worker {os.getpid()} shutting down...")
+    await server.close()
+    agent.toolbox.shutdown()
+
+
+def run_worker(args, reuse_port: bool):
+    asyncio.run(serve(args, reuse_port))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes, e.g. one per core.")
+    parser.add_argument("--backend", default="lan", help="LLM backend, see `app.llm.registry` (\"scripted\" needs no server).")
+    parser.add_argument("--model", default="deepseek-r1:14b")
+    parser.add_argument("--ollama-host", default=os.environ.get("OLLAMA_HOST"))
+    parser.add_argument("--llm-concurrency", type=int, default=4, help="Requests per LLM server at the same time.")
+    parser.add_argument("--max-queue", type=int, default=None, help="Queued LLM requests beyond which new runs wait to start.")
+    parser.add_argument("--run-timeout", type=float, default=120.0, help="Seconds a run may take, then it answers with what it found so far.")
+    parser.add_argument("--max-active-runs", type=int, default=256, help="Runs streamed at the same time per worker.")
+    parser.add_argument("--max-waiting-runs", type=int, default=1024, help="Runs waiting for a slot per worker, beyond that 503.")
+    args = parser.parse_args()
+
+    if args.workers == 1:
+        run_worker(args, reuse_port=False)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=run_worker, args=(args, True)) for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    try:
+        for worker in workers:
+            worker.join()
+    except KeyboardInterrupt:
+        # The workers got the signal too and shut down on their own
+        for worker in workers:
+            worker.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import pytest
+
+from app.llm.api_llm import API_LLM
+from app.tools.finish import FinishTool
+from app.tools.tool_box import ToolBox
+from app.tools.get_weather import GetWeatherTool
+
+MESSAGES = [{"role": "user", "content": "Weather in Tokyo? Reply in JSON."}]
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    # The OpenAI client only needs a key to exist
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    return API_LLM("gpt-4o-mini")
+
+
+def test_object_schema_uses_structured_output(llm):
+    schema = {"type": "object", "properties": {"answer": {"type": "string"}}, "required": ["answer"]}
+
+    options = llm._build_chat_options(MESSAGES, schema)
+
+    assert options["response_format"] == {"type": "json_schema", "json_schema": {"name": "reply", "schema": schema}}
+
+
+def test_planner_schema_falls_back_to_json_mode(llm):
+    # The root of the planner schema is an anyOf (one call or a batch), which structured output rejects
+    schema = ToolBox([GetWeatherTool(), FinishTool()]).get_planner_schema()
+
+    options = llm._build_chat_options(MESSAGES, schema)
+
+    assert "anyOf" in schema
+    assert options["response_format"] == {"type": "json_object"}
+
+
+def test_json_and_plain_replies(llm):
+    assert llm._build_chat_options(MESSAGES, "json")["response_format"] == {"type": "json_object"}
+    assert "response_format" not in llm._build_chat_options(MESSAGES)
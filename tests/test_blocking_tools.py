@@ -0,0 +1,33 @@
+import asyncio
+
+from app.tools.tool_box import ToolBox
+from benchmarks.loop_latency import PrimeTool, count_primes, measure
+
+# The process mode leaves the loop free, so its ticks stay far below the duration of a call
+MAX_TICK_MS = 50
+
+
+def test_process_tool_keeps_the_event_loop_responsive():
+    toolbox = ToolBox([PrimeTool(execution="process")], process_workers=2)
+    # Spawning the workers is not part of the measurement
+    toolbox.start_workers()
+    try:
+        report = asyncio.run(measure(toolbox, "count_primes", calls=2, limit=1_000_000))
+    finally:
+        toolbox.shutdown()
+
+    # The tool ran long enough for a stalled loop to show
+    assert report["tool_s"] * 1e3 > 4 * MAX_TICK_MS
+    assert report["ticks"] > 0
+    assert report["max_ms"] < MAX_TICK_MS
+
+
+def test_process_tool_returns_the_worker_result():
+    toolbox = ToolBox([PrimeTool(execution="process")], process_workers=1)
+    try:
+        result = asyncio.run(toolbox.call("count_primes", limit=1000))
+    finally:
+        toolbox.shutdown()
+
+    assert result.error is None
+    assert result.result == count_primes(1000) == 168
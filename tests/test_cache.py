@@ -0,0 +1,49 @@
+import asyncio
+
+from app.llm.cache import LLMCache, make_cache_key
+
+
+def test_key_ignores_dict_order_but_not_the_request():
+    messages = [{"role": "user", "content": "Weather in Tokyo?"}]
+
+    key = make_cache_key("qwen3", messages, "json", {"temperature": 0, "seed": 1})
+
+    assert key == make_cache_key("qwen3", [{"content": "Weather in Tokyo?", "role": "user"}], "json", {"seed": 1, "temperature": 0})
+    assert key != make_cache_key("qwen3", messages, None, {"temperature": 0, "seed": 1})
+    assert key != make_cache_key("llama3", messages, "json", {"temperature": 0, "seed": 1})
+
+
+def test_memory_tier_is_a_bounded_lru():
+    cache = LLMCache(max_memory_entries=2)
+
+    async def scenario():
+        cache.put("a", (None, "A"))
+        cache.put("b", (None, "B"))
+        await cache.get("a")
+        cache.put("c", (None, "C"))
+        return [await cache.get(key) for key in ("a", "b", "c")]
+
+    assert asyncio.run(scenario()) == [(None, "A"), None, (None, "C")]
+    assert cache.stats["misses"] == 1
+
+
+def test_disk_tier_survives_a_restart_and_expires(tmp_path):
+    path = str(tmp_path / "llm_cache.db")
+
+    async def write():
+        cache = LLMCache(path=path)
+        cache.put("key", ("thinking", "answer"))
+        await cache.flush()
+
+    async def read(ttl):
+        cache = LLMCache(path=path, ttl=ttl)
+        return await cache.get("key"), cache.stats
+
+    asyncio.run(write())
+    value, stats = asyncio.run(read(ttl=None))
+    assert value == ("thinking", "answer")
+    assert stats["disk_hits"] == 1
+
+    value, stats = asyncio.run(read(ttl=-1))
+    assert value is None
+    assert stats["misses"] == 1
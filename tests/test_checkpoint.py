@@ -0,0 +1,84 @@
+import asyncio
+from typing import Optional
+
+import pytest
+
+from app.tools.tool_box import ToolBox
+from app.tools.finish import FinishTool
+from app.agent.stateful import StatefulAgent
+from app.tools.get_weather import GetWeatherTool
+from app.llm.scripted_llm import Scripted_LLM
+from app.states.planning import PlanningState
+from app.states.finished import FinishedState
+from app.states.executing import ToolExecutionState
+from app.states.summarizing import SummarizationState
+from app.agent.checkpoint import JSONLCheckpointStore, SQLiteCheckpointStore
+
+CALLS = []
+
+
+class CountingWeatherTool(GetWeatherTool):
+    # Every call reaches the tool
+    cache_ttl: Optional[float] = None
+
+    async def _execute(self, city: str) -> str:
+        CALLS.append(city)
+        return await super()._execute(city)
+
+
+def build_agent(store) -> StatefulAgent:
+    states = {
+        "planning": PlanningState(),
+        "tool_execution": ToolExecutionState(),
+        "summarizing": SummarizationState(),
+        "finished": FinishedState(),
+    }
+    toolbox = ToolBox([CountingWeatherTool(), FinishTool()])
+    return StatefulAgent(llm=Scripted_LLM(), toolbox=toolbox, states=states, max_steps=8, checkpoint_store=store)
+
+
+@pytest.fixture(params=["jsonl", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "jsonl":
+        return JSONLCheckpointStore(str(tmp_path / "runs"))
+    return SQLiteCheckpointStore(str(tmp_path / "runs.db"))
+
+
+def test_resumed_run_skips_the_checkpointed_steps(store):
+    CALLS.clear()
+
+    async def crash_after_the_tool_call() -> str:
+        agent = build_agent(store)
+        session = agent.create_session()
+        steps = agent.run("What is the weather in Tokyo?", session=session)
+        async for step in steps:
+            if step.current_state == "tool_execution":
+                break
+        # The worker dies, the generator is never resumed
+        await steps.aclose()
+        return session.run_id
+
+    async def resume_on_another_worker(run_id: str) -> list:
+        agent = build_agent(store)
+        return [step async for step in agent.resume(run_id)]
+
+    run_id = asyncio.run(crash_after_the_tool_call())
+    steps = asyncio.run(resume_on_another_worker(run_id))
+
+    assert CALLS == ["Tokyo"]
+    assert [step.current_state for step in steps] == ["planning", "finished"]
+    assert steps[-1].is_final and "Tokyo" in steps[-1].final_answer
+
+
+def test_finished_and_unknown_runs_cannot_be_resumed(store):
+    async def scenario():
+        agent = build_agent(store)
+        session = agent.create_session()
+        async for _ in agent.run("What is the weather in Tokyo?", session=session):
+            pass
+        with pytest.raises(ValueError, match="already finished"):
+            await agent.load_session(session.run_id)
+        with pytest.raises(KeyError):
+            await agent.load_session("missing")
+
+    asyncio.run(scenario())
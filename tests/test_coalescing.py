@@ -0,0 +1,125 @@
+import asyncio
+
+from app.llm.coalescing import InflightRequests, is_deterministic
+from app.llm.scheduler import BATCH, INTERACTIVE, RequestContext, current_request, request_context
+
+
+class Upstream:
+    def __init__(self, delay: float = 0.02):
+        self.delay = delay
+        self.sent = 0
+        self.cancelled = 0
+        self.contexts = []
+
+    async def chat(self) -> tuple:
+        self.sent += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        self.contexts.append(current_request.get().model_copy())
+        return None, "reply", "now"
+
+    async def stream(self):
+        self.sent += 1
+        for delta in ("one ", "two ", "three"):
+            await asyncio.sleep(self.delay / 3)
+            yield delta
+
+
+def test_sampling_options_decide_if_requests_can_be_shared():
+    assert is_deterministic(None)
+    assert is_deterministic({"temperature": 0})
+    assert is_deterministic({"temperature": 0.8, "seed": 7})
+    assert not is_deterministic({"temperature": 0.8})
+
+
+def test_identical_requests_share_one_upstream_request():
+    inflight = InflightRequests()
+    upstream = Upstream()
+
+    async def scenario():
+        return await asyncio.gather(*(inflight.chat("key", upstream.chat) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+
+    assert upstream.sent == 1
+    assert [coalesced for _, coalesced in results] == [False, True, True, True, True]
+    assert {reply for reply, _ in results} == {(None, "reply", "now")}
+    assert inflight.stats == {"requests": 1, "coalesced": 4}
+
+
+def test_a_caller_leaving_does_not_cancel_the_others():
+    inflight = InflightRequests()
+    upstream = Upstream()
+
+    async def scenario():
+        first = asyncio.create_task(inflight.chat("key", upstream.chat))
+        second = asyncio.create_task(inflight.chat("key", upstream.chat))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        return await second
+
+    reply, _ = asyncio.run(scenario())
+
+    assert reply == (None, "reply", "now")
+    assert upstream.cancelled == 0
+
+
+def test_the_last_caller_leaving_cancels_the_request():
+    inflight = InflightRequests()
+    upstream = Upstream()
+
+    async def scenario():
+        callers = [asyncio.create_task(inflight.chat("key", upstream.chat)) for _ in range(2)]
+        await asyncio.sleep(0.005)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+        # The key is free again, a new caller sends a new request
+        return await inflight.chat("key", upstream.chat)
+
+    _, coalesced = asyncio.run(scenario())
+
+    assert upstream.cancelled == 1
+    assert upstream.sent == 2
+    assert not coalesced
+
+
+def test_shared_request_is_queued_as_its_most_urgent_caller():
+    requeued = []
+    inflight = InflightRequests(on_requeue=requeued.append)
+    upstream = Upstream()
+
+    async def call(context: RequestContext):
+        with request_context(context):
+            return await inflight.chat("key", upstream.chat)
+
+    async def scenario():
+        batch = asyncio.create_task(call(RequestContext(session_id="batch", run_priority=BATCH)))
+        await asyncio.sleep(0)
+        interactive = asyncio.create_task(call(RequestContext(session_id="interactive", run_priority=INTERACTIVE)))
+        await asyncio.gather(batch, interactive)
+
+    asyncio.run(scenario())
+
+    assert [context.session_id for context in requeued] == ["interactive"]
+    assert upstream.contexts[0].run_priority == INTERACTIVE
+    assert upstream.contexts[0].shared
+
+
+def test_stream_is_replayed_from_the_start_to_late_subscribers():
+    inflight = InflightRequests()
+    upstream = Upstream()
+
+    async def read(delay: float) -> str:
+        await asyncio.sleep(delay)
+        return "".join([delta async for delta in inflight.chat_stream("key", upstream.stream)])
+
+    async def scenario():
+        return await asyncio.gather(read(0.0), read(0.01))
+
+    assert asyncio.run(scenario()) == ["one two three"] * 2
+    assert upstream.sent == 1
@@ -0,0 +1,102 @@
+import asyncio
+
+from app.llm.hedging import HedgePolicy
+
+
+class Hosts:
+    """
+    Attempts that take the next latency of `latencies`, like requests sent to different hosts.
+    """
+
+    def __init__(self, *latencies: float):
+        self.latencies = list(latencies)
+        self.started = []
+        self.cancelled = []
+
+    async def attempt(self):
+        index = len(self.started)
+        latency = self.latencies[index]
+        self.started.append(index)
+        try:
+            await asyncio.sleep(latency)
+        except asyncio.CancelledError:
+            self.cancelled.append(index)
+            raise
+        return f"host {index}"
+
+
+def test_delay_is_the_latency_percentile_once_known():
+    policy = HedgePolicy(percentile=0.9, min_samples=10, initial_delay=1.0, min_delay=0.01)
+
+    assert policy.delay("chat") == 1.0
+    for latency in range(1, 11):
+        policy.record("chat", latency / 100)
+
+    assert policy.delay("chat") == 0.1
+    assert policy.delay("stream") == 1.0
+
+
+def test_fast_request_is_not_hedged():
+    policy = HedgePolicy(initial_delay=0.05)
+    hosts = Hosts(0.0, 0.0)
+
+    assert asyncio.run(policy.race("chat", hosts.attempt)) == "host 0"
+    assert hosts.started == [0]
+    assert policy.stats["hedged"] == 0
+
+
+def test_slow_request_is_won_by_its_hedge():
+    policy = HedgePolicy(initial_delay=0.01)
+    hosts = Hosts(1.0, 0.01)
+
+    assert asyncio.run(policy.race("chat", hosts.attempt)) == "host 1"
+    assert hosts.cancelled == [0]
+    assert policy.stats["hedge_won"] == 1
+    # The beaten primary still counts as a slow sample
+    assert len(policy._latencies["chat"]) == 1
+
+
+def test_invalid_result_waits_for_the_other_attempt():
+    policy = HedgePolicy(initial_delay=0.01)
+    hosts = Hosts(0.05, 0.02)
+
+    result = asyncio.run(policy.race("chat", hosts.attempt, is_valid=lambda result: result != "host 1"))
+
+    assert result == "host 0"
+
+
+def test_hedges_stay_within_the_budget():
+    policy = HedgePolicy(initial_delay=0.005, budget=0.0, max_tokens=2)
+
+    async def scenario():
+        for _ in range(4):
+            await policy.race("chat", Hosts(0.02, 0.0).attempt)
+
+    asyncio.run(scenario())
+
+    assert policy.stats["hedged"] == 2
+    assert policy.stats["over_budget"] == 2
+
+
+def test_hedge_needs_a_free_slot_and_gives_it_back():
+    policy = HedgePolicy(initial_delay=0.005)
+    slots = {"free": 0, "released": 0}
+
+    def acquire() -> bool:
+        if not slots["free"]:
+            return False
+        slots["free"] -= 1
+        return True
+
+    async def release():
+        slots["released"] += 1
+
+    async def scenario():
+        first = await policy.race("chat", Hosts(0.02, 0.0).attempt, acquire=acquire, release=release)
+        slots["free"] = 1
+        second = await policy.race("chat", Hosts(0.02, 0.0).attempt, acquire=acquire, release=release)
+        return first, second
+
+    assert asyncio.run(scenario()) == ("host 0", "host 1")
+    assert policy.stats["no_slot"] == 1
+    assert slots["released"] == 1
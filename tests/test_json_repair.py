@@ -0,0 +1,44 @@
+import pytest
+
+from app.utils.json_repair import extract_first_object, repair_json
+
+
+def test_valid_reply_needs_no_fix():
+    assert repair_json('{"tool_name": "finish_task", "arguments": {}}') == (
+        {"tool_name": "finish_task", "arguments": {}},
+        [],
+    )
+
+
+@pytest.mark.parametrize(
+    "reply, fixes",
+    [
+        ('<think>call {the tool}</think>{"tool_name": "echo", "arguments": {}}', ["strip_reasoning"]),
+        ('```json\n{"tool_name": "echo", "arguments": {}}\n```', ["strip_reasoning"]),
+        ('I will call the tool: {"tool_name": "echo", "arguments": {}} and then finish.', ["extract_object"]),
+        ('{"tool_name": "echo", "arguments": {},}', ["trailing_commas"]),
+    ],
+)
+def test_usual_defects_are_repaired_locally(reply, fixes):
+    decision, applied = repair_json(reply)
+
+    assert decision == {"tool_name": "echo", "arguments": {}}
+    assert applied == fixes
+
+
+def test_first_object_ignores_braces_in_strings():
+    text = 'noise {"text": "a } b", "items": [{"x": 1}]} {"second": true}'
+
+    assert extract_first_object(text) == '{"text": "a } b", "items": [{"x": 1}]}'
+
+
+def test_first_object_keeps_an_invalid_object_for_the_repair():
+    assert extract_first_object('so {"a": [1, 2,],} here') == '{"a": [1, 2,],}'
+    assert extract_first_object('no object {"a": ') is None
+
+
+@pytest.mark.parametrize("reply", ["I cannot decide which tool to use.", '<think>the tool is {"tool_name": "echo"}'])
+def test_unrepairable_reply(reply):
+    decision, _ = repair_json(reply)
+
+    assert decision is None
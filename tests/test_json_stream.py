@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from app.utils.json_stream import IncrementalJSONParser
+
+
+def feed_chunks(parser: IncrementalJSONParser, text: str, size: int):
+    for index in range(0, len(text), size):
+        result = parser.feed(text[index : index + size])
+        if result is not None:
+            return result, index + size
+    return None, len(text)
+
+
+def test_object_reported_as_soon_as_it_is_complete():
+    decision = {"tool_name": "get_todays_weather", "arguments": {"city": "Tokyo"}}
+    text = json.dumps(decision) + "\nI chose the weather tool because..."
+    parser = IncrementalJSONParser()
+
+    result, consumed = feed_chunks(parser, text, 3)
+
+    assert result == decision
+    # Nothing after the object had to be read
+    assert consumed < len(json.dumps(decision)) + 3
+    assert parser.done
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 64])
+def test_think_block_and_prose_before_the_object_are_skipped(size):
+    text = '<think>maybe {"tool_name": "wrong"} first</think>Sure: {"tool_name": "finish_task", "arguments": {}}'
+    parser = IncrementalJSONParser()
+
+    result, _ = feed_chunks(parser, text, size)
+
+    assert result == {"tool_name": "finish_task", "arguments": {}}
+
+
+def test_braces_inside_strings_and_nested_arrays():
+    decision = {"tool_calls": [{"tool_name": "echo", "arguments": {"text": "a } and a ] and \\\" quote"}}]}
+    parser = IncrementalJSONParser()
+
+    result, _ = feed_chunks(parser, json.dumps(decision), 1)
+
+    assert result == decision
+
+
+def test_incomplete_object_is_not_reported():
+    parser = IncrementalJSONParser()
+
+    assert parser.feed('{"tool_name": "echo", "arguments": {') is None
+    assert not parser.done
+
+
+def test_balanced_but_invalid_object_raises():
+    parser = IncrementalJSONParser()
+
+    with pytest.raises(ValueError):
+        parser.feed('{"tool_name": "echo",}')
@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from app.agent.long_term import RECALL_HEADER, LongTermMemory
+
+
+@pytest.fixture
+def memory(tmp_path):
+    memory = LongTermMemory(str(tmp_path / "memory.db"))
+    yield memory
+    memory.close()
+
+
+def age(memory: LongTermMemory, text: str, seconds: float):
+    memory._conn.execute("UPDATE items SET created_at = ? WHERE text = ?", (time.time() - seconds, text))
+    memory._conn.commit()
+
+
+def test_search_ranks_by_the_rare_terms(memory):
+    memory.add_many([("tool_result", f"Paris weather report number {index}") for index in range(5)])
+    memory.add("tool_result", "Tokyo weather is sunny and 28 degrees")
+
+    results = memory.search("weather in Tokyo", limit=3)
+
+    assert results[0]["text"] == "Tokyo weather is sunny and 28 degrees"
+    assert memory.add("tool_result", "Tokyo weather is sunny and 28 degrees") is False
+    assert len(memory) == 6
+
+
+@pytest.mark.parametrize("max_postings", [500, 2])
+def test_expired_items_do_not_take_the_place_of_fresh_ones(memory, max_postings):
+    # The fresh item is the oldest row, every newer row has expired
+    memory.add("answer", "Tokyo weather: sunny")
+    memory.add_many([("answer", f"Tokyo weather: rain ({index})") for index in range(10)])
+    for index in range(10):
+        age(memory, f"Tokyo weather: rain ({index})", 3600)
+    memory.max_age = 600
+    memory.max_postings = max_postings
+
+    results = memory.search("Tokyo weather", limit=3)
+
+    assert [item["text"] for item in results] == ["Tokyo weather: sunny"]
+
+
+def test_recall_stays_within_the_budget(memory):
+    memory.add_many([("tool_result", f"Tokyo weather sample {index} " + "detail " * 20) for index in range(8)])
+
+    recalled = memory.recall("Tokyo weather", budget_tokens=120)
+
+    assert recalled.startswith(RECALL_HEADER)
+    assert memory.token_counter(recalled) <= 120
+    assert memory.recall("Lisbon", budget_tokens=120) is None
+
+
+def test_prune_forgets_old_items(memory):
+    memory.add("answer", "Tokyo weather: sunny")
+    memory.add("answer", "Osaka weather: cloudy")
+    age(memory, "Osaka weather: cloudy", 3600)
+
+    assert memory.prune(600) == 1
+    assert [item["text"] for item in memory.search("weather")] == ["Tokyo weather: sunny"]
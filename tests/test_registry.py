@@ -0,0 +1,40 @@
+import pytest
+
+from app.llm.base import BaseLLM
+from app.llm.registry import LLM_BACKENDS, build_llm, get_llm_class
+
+# What each backend needs besides the model name, none of them contacts a server when built
+BACKEND_OPTIONS = {
+    "lan": lambda: {"host": "http://127.0.0.1:11434"},
+    "router": lambda: {"hosts": ["http://127.0.0.1:11434", "http://127.0.0.1:11435"]},
+    "cascade": lambda: {
+        "small": build_llm("scripted", model_name="small"),
+        "large": build_llm("scripted", model_name="large"),
+    },
+}
+
+
+@pytest.mark.parametrize("name", sorted(LLM_BACKENDS))
+def test_every_backend_builds_by_name(name, monkeypatch):
+    # The OpenAI client only needs a key to exist
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+
+    llm = build_llm(name, model_name=f"{name}-model", **BACKEND_OPTIONS.get(name, dict)())
+
+    assert isinstance(llm, get_llm_class(name))
+    assert isinstance(llm, BaseLLM)
+    assert llm.model_name == f"{name}-model"
+
+
+def test_cascade_names_itself_after_its_tiers_by_default():
+    small = build_llm("scripted", model_name="small")
+    large = build_llm("scripted", model_name="large")
+
+    cascade = get_llm_class("cascade")(small=small, large=large)
+
+    assert cascade.model_name == "small->large"
+
+
+def test_unknown_backend():
+    with pytest.raises(KeyError, match="Unknown LLM backend"):
+        build_llm("missing", model_name="any")
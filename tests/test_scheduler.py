@@ -0,0 +1,106 @@
+import time
+import asyncio
+
+import pytest
+
+from app.llm.scheduler import BATCH, INTERACTIVE, DeadlineExceeded, LLMScheduler, RequestContext, request_context
+
+
+class Recorder:
+    def __init__(self, scheduler: LLMScheduler):
+        self.scheduler = scheduler
+        self.order = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def request(self, label: str, context: RequestContext, hold: float = 0.0):
+        with request_context(context):
+            async with self.scheduler.slot("host"):
+                self.in_flight += 1
+                self.peak = max(self.peak, self.in_flight)
+                self.order.append(label)
+                await asyncio.sleep(hold)
+                self.in_flight -= 1
+
+    async def queue_behind_a_busy_host(self, requests: list[tuple[str, RequestContext]]):
+        """
+        Send `requests` one after the other while the only slot is taken, then let them through.
+        """
+        blocker = asyncio.create_task(self.request("blocker", RequestContext(), hold=0.02))
+        await asyncio.sleep(0)
+        tasks = []
+        for label, context in requests:
+            tasks.append(asyncio.create_task(self.request(label, context)))
+            await asyncio.sleep(0)
+        await asyncio.gather(blocker, *tasks)
+
+
+def test_queued_requests_go_by_run_class_then_state():
+    recorder = Recorder(LLMScheduler(per_host_concurrency=1))
+
+    asyncio.run(
+        recorder.queue_behind_a_busy_host(
+            [
+                ("batch planning", RequestContext(run_priority=BATCH, state_priority=1)),
+                ("interactive planning", RequestContext(run_priority=INTERACTIVE, state_priority=1)),
+                ("interactive summary", RequestContext(run_priority=INTERACTIVE, state_priority=0)),
+            ]
+        )
+    )
+
+    assert recorder.order == ["blocker", "interactive summary", "interactive planning", "batch planning"]
+    assert recorder.peak == 1
+
+
+def test_each_host_runs_up_to_its_concurrency():
+    recorder = Recorder(LLMScheduler(per_host_concurrency=3))
+
+    async def scenario():
+        await asyncio.gather(*(recorder.request(f"#{index}", RequestContext(), hold=0.01) for index in range(10)))
+
+    asyncio.run(scenario())
+
+    assert recorder.peak == 3
+    assert recorder.scheduler.stats()["hosts"]["host"]["admitted"] == 10
+
+
+def test_busy_session_goes_after_the_others_until_its_run_ends():
+    scheduler = LLMScheduler(per_host_concurrency=1)
+    recorder = Recorder(scheduler)
+
+    async def scenario():
+        for _ in range(3):
+            await recorder.request("busy", RequestContext(session_id="busy"))
+        await recorder.queue_behind_a_busy_host(
+            [("busy", RequestContext(session_id="busy")), ("new", RequestContext(session_id="new"))]
+        )
+        order = recorder.order[-2:]
+        scheduler.end_run("busy")
+        scheduler.end_run("new")
+        await recorder.queue_behind_a_busy_host(
+            [("busy", RequestContext(session_id="busy")), ("new", RequestContext(session_id="new"))]
+        )
+        return order, recorder.order[-2:]
+
+    before, after = asyncio.run(scenario())
+
+    assert before == ["new", "busy"]
+    assert after == ["busy", "new"]
+
+
+def test_request_leaves_the_queue_at_its_deadline():
+    scheduler = LLMScheduler(per_host_concurrency=1)
+    recorder = Recorder(scheduler)
+
+    async def scenario():
+        blocker = asyncio.create_task(recorder.request("blocker", RequestContext(), hold=0.2))
+        await asyncio.sleep(0)
+        with pytest.raises(DeadlineExceeded):
+            await recorder.request("late", RequestContext(deadline=time.monotonic() + 0.02))
+        await blocker
+
+    asyncio.run(scenario())
+
+    assert recorder.order == ["blocker"]
+    assert scheduler.stats()["hosts"]["host"]["expired"] == 1
+    assert scheduler.queue_depth == 0
@@ -0,0 +1,56 @@
+import gc
+import asyncio
+import weakref
+
+from benchmarks.load_sessions import build_agent, measure
+
+
+async def drain(agent, user_request: str, session=None) -> list:
+    return [step async for step in agent.run(user_request, session=session)]
+
+
+def test_overlapping_runs_keep_their_own_state():
+    agent = build_agent(0.005)
+    sessions = [agent.create_session() for _ in range(20)]
+
+    async def scenario():
+        return await asyncio.gather(*(drain(agent, f"Weather please (#{index})", session) for index, session in enumerate(sessions)))
+
+    runs = asyncio.run(scenario())
+
+    assert len({session.run_id for session in sessions}) == len(sessions)
+    for index, (session, steps) in enumerate(zip(sessions, runs)):
+        assert steps[-1].is_final and steps[-1].final_answer
+        requests = [message["content"] for message in session.memory if message["role"] == "user"]
+        assert requests == [f"Weather please (#{index})"]
+        assert session.current_state.name == "finished"
+
+
+def test_finished_sessions_are_released():
+    agent = build_agent(0.0)
+    sessions = []
+
+    async def scenario():
+        for index in range(50):
+            session = agent.create_session()
+            sessions.append(weakref.ref(session))
+            await drain(agent, f"Weather please (#{index})", session)
+
+    asyncio.run(scenario())
+    gc.collect()
+
+    assert [ref for ref in sessions if ref() is not None] == []
+
+
+def test_memory_per_live_session_does_not_grow_with_the_session_count():
+    agent = build_agent(0.0)
+
+    async def scenario():
+        await measure(agent, 10)
+        return await measure(agent, 50), await measure(agent, 200)
+
+    few, many = asyncio.run(scenario())
+
+    assert many["runs_per_s"] > 0
+    assert many["kib_per_session"] < 64
+    assert many["kib_per_session"] < 2 * few["kib_per_session"] + 1
@@ -0,0 +1,120 @@
+import asyncio
+
+from app.tools.base import BaseTool
+from app.tools.tool_box import ToolBox
+
+RUNNING = {"now": 0, "peak": 0}
+
+
+class SleepTool(BaseTool):
+    name: str = "sleep"
+    description: str = "Sleep, then return the label."
+
+    async def _execute(self, seconds: float, label: str) -> str:
+        RUNNING["now"] += 1
+        RUNNING["peak"] = max(RUNNING["peak"], RUNNING["now"])
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            RUNNING["now"] -= 1
+        return label
+
+
+def sleep_calls(*seconds: float) -> list[dict]:
+    return [{"tool_name": "sleep", "arguments": {"seconds": value, "label": f"#{index}"}} for index, value in enumerate(seconds)]
+
+
+def test_results_keep_the_call_order():
+    toolbox = ToolBox([SleepTool()])
+
+    results = asyncio.run(toolbox.call_many(sleep_calls(0.06, 0.0, 0.03)))
+
+    assert [result.result for result in results] == ["#0", "#1", "#2"]
+
+
+def test_calls_run_at_the_same_time_within_the_limit():
+    RUNNING["peak"] = 0
+    toolbox = ToolBox([SleepTool()], max_concurrency=2)
+
+    results = asyncio.run(toolbox.call_many(sleep_calls(*[0.02] * 6)))
+
+    assert all(result.error is None for result in results)
+    assert RUNNING["peak"] == 2
+
+
+def test_slow_call_times_out_alone():
+    toolbox = ToolBox([SleepTool()], call_timeout=0.05)
+
+    slow, fast = asyncio.run(toolbox.call_many(sleep_calls(5.0, 0.0)))
+
+    assert "timed out" in slow.error
+    assert fast.result == "#1"
+
+
+def test_malformed_calls_become_errors():
+    toolbox = ToolBox([SleepTool()])
+
+    unknown, no_object, valid = asyncio.run(
+        toolbox.call_many(
+            [
+                {"tool_name": "missing", "arguments": {}},
+                {"tool_name": "sleep", "arguments": "seconds=0"},
+                *sleep_calls(0.0),
+            ]
+        )
+    )
+
+    assert "does not exist" in unknown.error
+    assert "must be an object" in no_object.error
+    assert valid.result == "#0"
+
+
+class CountingTool(BaseTool):
+    name: str = "lookup"
+    description: str = "Look a key up, slowly."
+    cache_ttl: float = 60.0
+    cache_key_args: list = ["key"]
+    runs: list = []
+
+    async def _execute(self, key: str, note: str = "") -> str:
+        self.runs.append(key)
+        await asyncio.sleep(0.02)
+        if key == "broken":
+            raise ValueError("no such key")
+        return f"value of {key}"
+
+
+def test_identical_calls_share_one_execution_and_the_cache():
+    tool = CountingTool()
+    toolbox = ToolBox([tool])
+
+    async def scenario():
+        # The note is not part of the cache key
+        together = await toolbox.call_many(
+            [{"tool_name": "lookup", "arguments": {"key": "a", "note": note}} for note in ("x", "y", "z")]
+        )
+        later = await toolbox.call("lookup", key="a")
+        return together, later
+
+    together, later = asyncio.run(scenario())
+
+    assert tool.runs == ["a"]
+    assert {result.result for result in [*together, later]} == {"value of a"}
+    assert toolbox.cache_stats == {"hits": 1, "misses": 1, "coalesced": 2}
+
+
+def test_expired_and_failed_results_are_not_reused():
+    tool = CountingTool(cache_ttl=0.01)
+    toolbox = ToolBox([tool])
+
+    async def scenario():
+        await toolbox.call("lookup", key="a")
+        await asyncio.sleep(0.02)
+        await toolbox.call("lookup", key="a")
+        await toolbox.call("lookup", key="broken")
+        return await toolbox.call("lookup", key="broken")
+
+    failed = asyncio.run(scenario())
+
+    assert tool.runs == ["a", "a", "broken", "broken"]
+    assert "no such key" in failed.error